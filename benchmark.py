@@ -0,0 +1,181 @@
+"""
+benchmark.py - Time each dashboard stage on synthetic data and record its peak memory, no BigQuery needed
+
+    python benchmark.py [--sizes xs,s,m,l,xl] [--repeat N] [--output FILE]
+
+Each size appends one JSON line to the output file (with the git revision),
+so runs before and after a change can be compared.
+"""
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from src.dashboard import SITES_PER_PAGE, _daily_figure, _minute_bar_figure, _source_trend_figure
+from src.dashboard_model import compute_dashboard_model, compute_realtime_model
+from src.rollup import build_rollup
+from src.snapshot_file import read_snapshot, write_snapshot
+from src.synthetic import synthetic_analytics, synthetic_cost
+from src.website_table import build_website_table, render_website_table
+
+logger = logging.getLogger(__name__)
+
+RESULTS_PATH = Path(".cache/benchmarks.jsonl")
+# name -> (sites, rows per site), 10k to 10M rows
+SIZES = {
+    "xs": (10, 1_000),
+    "s": (50, 2_000),
+    "m": (100, 10_000),
+    "l": (250, 10_000),
+    "xl": (500, 20_000),
+}
+# Sites picked in the filter for the selection stage
+SELECTED_SITES = 5
+
+
+def _panel_figures(panel) -> list:
+    figures = [_minute_bar_figure(panel.live.by_minute)]
+    if not panel.daily.empty:
+        figures.append(_daily_figure(panel.daily))
+    if not panel.source_trend.empty:
+        figures.append(_source_trend_figure(panel.source_trend))
+    return figures
+
+
+def _stages(df: pd.DataFrame, cost: pd.DataFrame, config: dict, snapshot_dir: str) -> list:
+    """(name, callable) per dashboard stage, in page order; later stages reuse earlier results."""
+    state = {}
+    realtime_df = df[df['session_minute'].notna()]
+
+    def rollup():
+        state['rollup'] = build_rollup(df, config)
+
+    def model():
+        state['model'] = compute_dashboard_model(df, cost, config, rollup=state['rollup'])
+
+    def selection_model():
+        compute_dashboard_model(df, cost, config, websites=state['rollup'].websites[:SELECTED_SITES],
+                                rollup=state['rollup'])
+
+    def website_table():
+        state['table'] = build_website_table(state['rollup'], config)
+
+    def website_table_html():
+        render_website_table(state['table'])
+
+    def figures():
+        # What one page draws: the Total panel and the first page of site panels
+        panels = [state['model'].total] + [state['model'].sites[website]
+                                           for website in state['model'].website_order[:SITES_PER_PAGE]]
+        for panel in panels:
+            _panel_figures(panel)
+
+    def realtime_model():
+        compute_realtime_model(state['rollup'], realtime_df)
+
+    def snapshot_write():
+        state['version'] = write_snapshot(df, cost, config, state['rollup'], directory=snapshot_dir)
+
+    def snapshot_read():
+        read_snapshot(state['version'], directory=snapshot_dir)
+
+    return [(stage.__name__, stage) for stage in (
+        rollup, model, selection_model, website_table, website_table_html, figures, realtime_model,
+        snapshot_write, snapshot_read)]
+
+
+def _time_stages(stages: list, repeat: int) -> dict:
+    """Best of ``repeat`` wall times per stage, in seconds."""
+    best = {}
+    for _ in range(repeat):
+        for name, stage in stages:
+            start = time.perf_counter()
+            stage()
+            best[name] = min(best.get(name, float('inf')), time.perf_counter() - start)
+    return best
+
+
+def _peak_memory(stages: list) -> dict:
+    """Peak bytes allocated above the starting point while each stage runs (a separate, slower pass)."""
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for name, stage in stages:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            stage()
+            peaks[name] = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(size: str, repeat: int = 3, seed: int = 0) -> dict:
+    """Generate one size of synthetic data and measure every stage on it."""
+    sites, rows_per_site = SIZES[size]
+    df, config = synthetic_analytics(sites, rows_per_site, seed=seed)
+    cost = synthetic_cost(config, seed=seed)
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        stages = _stages(df, cost, config, snapshot_dir)
+        seconds = _time_stages(stages, repeat)
+        peaks = _peak_memory(stages)
+    return {
+        "size": size,
+        "sites": sites,
+        "rows": len(df),
+        "frame_mb": round(df.memory_usage(deep=True).sum() / 1e6, 1),
+        "repeat": repeat,
+        "stages": {name: {"seconds": round(seconds[name], 4), "peak_mb": round(peaks[name] / 1e6, 1)}
+                   for name in seconds},
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's aggregation and render path offline.")
+    parser.add_argument("--sizes", default=",".join(SIZES),
+                        help=f"comma-separated sizes from {', '.join(f'{k}={s}x{r}' for k, (s, r) in SIZES.items())}")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the synthetic data")
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH, help=f"JSON lines file (default: {RESULTS_PATH})")
+    args = parser.parse_args(argv)
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    run = {
+        "run_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": _revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    for size in sizes:
+        result = {**run, **run_benchmark(size, args.repeat, args.seed)}
+        with args.output.open("a") as f:
+            f.write(json.dumps(result) + "\n")
+        stages = ", ".join(f"{name} {stage['seconds']:.3f}s/{stage['peak_mb']:.0f}MB"
+                           for name, stage in result["stages"].items())
+        print(f"{size} ({result['sites']} sites, {result['rows']:,} rows): {stages}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+build_snapshot.py - Fetch every site and write a dashboard snapshot for the web tier
+
+Run on a schedule (e.g. hourly from cron) with the app's USE_SNAPSHOT_FILES on:
+
+    python build_snapshot.py [--output DIR] [--keep N] [--no-cost]
+
+Uses the same credentials (.streamlit/secrets.toml) and fetch settings (src/fetch.py,
+including the scan budget) as the app, without importing the Streamlit app.
+"""
+import argparse
+import logging
+import sys
+
+import pandas as pd
+
+from src.bq_client import get_bigquery_client
+from src.fetch import fetch_cost_df, fetch_history
+from src.rollup import build_rollup
+from src.sheets_connector import get_config_from_sheet
+from src.snapshot_file import SNAPSHOT_DIR, KEEP_VERSIONS, latest_version, read_snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def _previous_snapshot(directory):
+    # Deferred sites keep their rows from the last snapshot written
+    version = latest_version(directory)
+    if version is None:
+        return None
+    try:
+        return read_snapshot(version, directory)
+    except Exception as e:
+        logger.warning(f"Could not read previous snapshot {version}: {str(e)}")
+        return None
+
+
+def build_snapshot(output=SNAPSHOT_DIR, keep: int = KEEP_VERSIONS, with_cost: bool = True) -> str:
+    """Load the config, run every site query the scan budget admits and the cost query,
+    and write the result with its rollup."""
+    config = get_config_from_sheet()
+    client = get_bigquery_client()
+    analytics, extra = fetch_history(client, config, _previous_snapshot(output))
+    if analytics.empty:
+        raise RuntimeError("Analytics queries returned no data; keeping the previous snapshot")
+    if not pd.api.types.is_datetime64_any_dtype(analytics['event_date']):
+        analytics['event_date'] = pd.to_datetime(analytics['event_date'])
+    cost = fetch_cost_df(client) if with_cost else None
+    return write_snapshot(analytics, cost, config, build_rollup(analytics, config), directory=output, keep=keep,
+                          site_fetched_at=extra.get("site_fetched_at"), site_scan=extra.get("site_scan"))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute a GA4 dashboard snapshot outside the web process.")
+    parser.add_argument("--output", default=SNAPSHOT_DIR, help=f"snapshot directory (default: {SNAPSHOT_DIR})")
+    parser.add_argument("--keep", type=int, default=KEEP_VERSIONS, help="snapshot versions to keep")
+    parser.add_argument("--no-cost", action="store_true", help="skip the BigQuery cost query")
+    args = parser.parse_args(argv)
+    try:
+        version = build_snapshot(args.output, args.keep, not args.no_cost)
+    except Exception as e:
+        logger.error(f"Snapshot build failed: {str(e)}")
+        return 1
+    logger.info(f"Snapshot {version} is now the latest")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""
+atomic_write.py - Replace a file in one step, so readers never see a partial write
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def atomic_write(path: Path, mode: str = "wb"):
+    """Yield a temporary file next to ``path`` that replaces it when the block succeeds.
+
+    The temporary name is unique, as several processes may write the same
+    file at once. If the block (or the replace) fails, the temporary file is
+    removed and ``path`` is left as it was.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(mode, dir=path.parent, suffix=".tmp", delete=False)
+    try:
+        with tmp:
+            yield tmp
+        os.replace(tmp.name, path)
+    except BaseException:
+        Path(tmp.name).unlink(missing_ok=True)
+        raise
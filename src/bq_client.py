@@ -1,20 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import bigquery
 from google.oauth2 import service_account
+import json
 import logging
+import threading
+import time
 import pandas as pd
+import requests
 import streamlit as st
+from pandas.api.types import union_categoricals
+
+from src.query_cost import APP_LABEL, job_label_value
+from src.scan_budget import record_spent
+from src.shared_cache import get_shared_cache, cache_key, frame_to_bytes, frame_from_bytes
+from src.telemetry import get_job_telemetry, job_record
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def get_bigquery_client():
+# Size of the HTTP connection pool shared by every thread using the client
+HTTP_POOL_SIZE = 32
+# Download results through the BigQuery Storage Read API when google-cloud-bigquery-storage
+# is installed; otherwise the client falls back to paging over REST into Arrow
+USE_STORAGE_API = True
+# Low-cardinality result columns decoded straight into pandas categoricals
+CATEGORY_COLUMNS = ['website', 'country', 'session_source', 'sourceDataSet']
+# Seconds a result stays in the shared cache for other replicas; kept under the app's hourly
+# refresh interval so a replica never reads back its own previous refresh. 0 disables sharing
+SHARED_CACHE_TTL = 3000
+# Parameters left out of the shared cache key: the reference minute changes on every
+# refresh, so results are shared for SHARED_CACHE_TTL instead
+VOLATILE_PARAMS = {'ref_ts'}
+
+
+def get_bigquery_client(pool_size=HTTP_POOL_SIZE):
     try:
         credentials = service_account.Credentials.from_service_account_info(
             st.secrets["gcp_service_account"]
-            )        
-        client = bigquery.Client(credentials=credentials, project=credentials.project_id)
+            )
+        # Share one pooled session so concurrent fetches reuse connections
+        session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        client = bigquery.Client(credentials=credentials, project=credentials.project_id, _http=session)
         logger.info("BigQuery client created successfully")
         return client
     except FileNotFoundError as e:
@@ -24,18 +55,304 @@ def get_bigquery_client():
         logger.error(f"Failed to create BigQuery client: {str(e)}")
         raise
 
-def fetch_analytics_data(client, query,website="uknkown"):
+def _job_config(params, labels=None):
+    if not params and not labels:
+        return None
+    return bigquery.QueryJobConfig(query_parameters=params or [], labels=labels or {})
+
+
+def _job_labels(website, tags) -> dict:
+    """BigQuery job labels attributing a job's cost to the app, a site, a query kind and version."""
+    tags = tags or {}
+    labels = {"app": APP_LABEL, "site": tags.get("site", website), "kind": tags.get("kind"),
+              "version": tags.get("version")}
+    return {key: job_label_value(value) for key, value in labels.items() if value}
+
+
+def _query_entry(entry) -> tuple:
+    # Queries map to (sql, params) or (sql, params, tags) to override the call's tags for one query
+    query, params, *entry_tags = entry
+    return query, params, entry_tags[0] if entry_tags else {}
+
+
+def _shared_key(query, params) -> str:
+    """Shared cache key: the rendered SQL plus its canonical parameters."""
+    return cache_key(query, *sorted(json.dumps(param.to_api_repr(), sort_keys=True, default=str)
+                                    for param in params or [] if param.name not in VOLATILE_PARAMS))
+
+
+def _record_job(query_job, website, tags, df=None, timings=(None, None), error=None):
+    get_job_telemetry().record(job_record(query_job, website, tags, df, *timings, error=error))
+    # Every job, whatever its lane, counts against the daily scan budget with what it was billed
+    billed = getattr(query_job, "total_bytes_billed", None)
+    if billed:
+        try:
+            record_spent(billed)
+        except OSError as e:
+            logger.warning(f"Could not record billed bytes in the scan budget ledger: {str(e)}")
+
+
+def _run_query(client, query, website, params, tags=None):
+    query_job = None
     try:
         logger.info(f"Executing BigQuery query for : {website}...")
-        query_job = client.query(query)
-        df = query_job.to_dataframe()
+        query_job = client.query(query, job_config=_job_config(params, _job_labels(website, tags)))
+        df, timings = _download(query_job, website)
+        _record_job(query_job, website, tags, df, timings)
         
         if df.empty:
             logger.warning("Query returned no data")
         else:
-            logger.info(f"Query returned {len(df)} rows")
+            logger.info(f"Query returned {len(df)} rows ({_job_stats(query_job)})")
             
         return df
     except Exception as e:
         logger.warning(f"Error executing BigQuery query: {str(e)}")
-        raise
\ No newline at end of file
+        _record_job(query_job, website, tags, error=e)
+        raise
+
+
+def fetch_analytics_data(client, query,website="uknkown", params=None, shared_ttl=SHARED_CACHE_TTL,
+                         tags=None, force=False):
+    """Run one query; ``tags`` (site, kind, version) become job labels and telemetry fields.
+
+    ``force`` skips the shared cache lookup (a user asked for fresh data) and
+    stores the new result for other replicas.
+    """
+    cache = get_shared_cache() if shared_ttl else None
+    if cache is None:
+        return _run_query(client, query, website, params, tags)
+    if force:
+        df = _run_query(client, query, website, params, tags)
+        _store_shared(cache, _shared_key(query, params), df, shared_ttl)
+        return df
+    computed = []
+
+    def compute():
+        computed.append(True)
+        return frame_to_bytes(_run_query(client, query, website, params, tags))
+
+    df = frame_from_bytes(cache.get_or_compute(_shared_key(query, params), compute, shared_ttl))
+    if not computed:
+        logger.info(f"Shared cache hit for {website}: {len(df)} rows")
+    return df
+
+
+def _download(query_job, website):
+    """Download a finished job as Arrow and convert it to a compact DataFrame.
+
+    Returns the frame and the seconds spent downloading and converting it.
+    """
+    start = time.perf_counter()
+    table = query_job.to_arrow(create_bqstorage_client=USE_STORAGE_API)
+    downloaded = time.perf_counter()
+    df = table.to_pandas(
+        categories=[column for column in CATEGORY_COLUMNS if column in table.column_names],
+        date_as_object=False,
+    )
+    if 'sessions' in df.columns:
+        df['sessions'] = df['sessions'].astype('int32')
+    elapsed = time.perf_counter() - start
+    # Arrow buffers and the DataFrame are both alive at conversion time
+    peak_mb = (table.nbytes + df.memory_usage(deep=True).sum()) / 1e6
+    logger.info(f"Downloaded {website}: {table.num_rows} rows in {elapsed:.2f}s, ~{peak_mb:,.1f} MB peak")
+    return df, (downloaded - start, time.perf_counter() - downloaded)
+
+
+def concat_compact(frames):
+    """Concatenate result frames while keeping the low-cardinality columns categorical."""
+    categorical = [column for column in CATEGORY_COLUMNS if all(column in f.columns for f in frames)]
+    df = pd.concat([f.drop(columns=categorical) for f in frames], ignore_index=True)
+    for column in categorical:
+        df[column] = union_categoricals(
+            [f[column].astype('category') for f in frames], ignore_order=True)
+    return df
+
+
+def _job_stats(query_job):
+    billed_mb = (query_job.total_bytes_billed or 0) / 1e6
+    elapsed = (query_job.ended - query_job.started).total_seconds() if query_job.ended and query_job.started else 0
+    return f"{billed_mb:,.1f} MB billed, {elapsed:.1f}s"
+
+
+def _download_within(query_job, website, timeout):
+    """Run :func:`_download`, giving up after ``timeout`` seconds (None waits for it).
+
+    A download can't be cancelled, so one that overruns finishes on its own
+    daemon thread and its result is dropped.
+    """
+    outcome = {}
+
+    def download():
+        try:
+            outcome['result'] = _download(query_job, website)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=download, name=f"download {website}", daemon=True)
+    thread.start()
+    thread.join(timeout if timeout is None else max(0.0, timeout))
+    if thread.is_alive():
+        raise TimeoutError(f"Result download for {website} did not finish within the query timeout")
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def _wait_for_job(query_job, website, timeout, tags=None):
+    """Wait for a job and download its result, within ``timeout`` seconds for both."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    query_job.result(timeout=timeout)
+    remaining = None if deadline is None else deadline - time.monotonic()
+    df, timings = _download_within(query_job, website, remaining)
+    logger.info(f"Query for {website} returned {len(df)} rows ({_job_stats(query_job)})")
+    _record_job(query_job, website, tags, df, timings)
+    return df
+
+
+def _shared_lookup(cache, queries, locked):
+    """Split queries into shared cache hits and keys another replica holds; returns ``(hits, waiting)``.
+
+    Keys this replica locks are added to ``locked`` as they are taken, so the
+    caller can release them even if the lookup fails part way.
+    """
+    keys = {website: _shared_key(*_query_entry(entry)[:2]) for website, entry in queries.items()}
+    hits, waiting = {}, {}
+    for website, key in keys.items():
+        data = cache.get(key)
+        if data is not None:
+            hits[website] = frame_from_bytes(data)
+        elif cache.try_lock(key):
+            locked[website] = key
+        else:
+            waiting[website] = key
+    if hits or waiting:
+        logger.info(f"Shared cache: {len(hits)} hits, {len(waiting)} being refreshed by another replica")
+    return hits, waiting
+
+
+def _store_shared(cache, key, df, ttl):
+    try:
+        cache.set(key, frame_to_bytes(df), ttl)
+    except Exception as e:
+        logger.warning(f"Could not store result in the shared cache: {str(e)}")
+
+
+def estimate_bytes_concurrent(client, queries, max_workers=8):
+    """Dry-run each query and return ``(estimates, errors)`` keyed like ``queries``.
+
+    Dry runs are free; the estimate is the bytes the query would process
+    without the query cache.
+    """
+    def dry_run(query, params):
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False, query_parameters=params or [])
+        return client.query(query, job_config=job_config).total_bytes_processed
+
+    estimates, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(dry_run, query, params): website
+                   for website, (query, params) in queries.items()}
+        for future in as_completed(futures):
+            website = futures[future]
+            try:
+                estimates[website] = future.result()
+            except Exception as e:
+                errors[website] = e
+    logger.info(f"Dry runs: {sum(estimates.values()) / 1e9:,.2f} GB for {len(estimates)} queries, "
+                f"{len(errors)} failed")
+    return estimates, errors
+
+
+def fetch_analytics_data_concurrent(client, queries, max_workers=8, timeout=300, shared_ttl=SHARED_CACHE_TTL,
+                                    tags=None, force=False):
+    """Run one query per website concurrently on a shared client.
+
+    ``queries`` maps each website to a ``(sql, query_parameters)`` pair, or a
+    ``(sql, query_parameters, tags)`` triple to override ``tags`` for one query. All
+    jobs are submitted up front, then a bounded pool of workers waits on
+    them and downloads results as they finish. Returns ``(results, errors)``,
+    two dicts keyed by website holding a DataFrame or the raised exception.
+    ``timeout`` bounds each job's wait and download together.
+
+    With the shared cache on, results another replica stored within
+    ``shared_ttl`` are reused, and queries another replica is already
+    running are waited on instead of run twice. ``force`` skips both (a user
+    asked for fresh data) and stores every new result for the other replicas.
+    ``tags`` (site, kind, version) become the jobs' BigQuery labels and are
+    kept with their telemetry records.
+    """
+    results, errors, jobs, job_tags = {}, {}, {}, {}
+    locked, waiting = {}, {}
+    cache = get_shared_cache() if shared_ttl else None
+
+    try:
+        if cache is not None and not force:
+            try:
+                results, waiting = _shared_lookup(cache, queries, locked)
+            except Exception as e:
+                logger.warning(f"Shared cache unavailable, querying directly: {str(e)}")
+                results, waiting = {}, {}
+        # Where results go for the other replicas: the keys locked here, or with force every key
+        # (written without a lock, so a concurrent normal refresh may store its result too)
+        store_keys = locked
+        if cache is not None and force:
+            store_keys = {website: _shared_key(*_query_entry(entry)[:2]) for website, entry in queries.items()}
+
+        for website, entry in queries.items():
+            if website in results or website in waiting:
+                continue
+            query, params, entry_tags = _query_entry(entry)
+            job_tags[website] = {**(tags or {}), **entry_tags}
+            try:
+                logger.info(f"Submitting BigQuery query for : {website}...")
+                jobs[website] = client.query(
+                    query, job_config=_job_config(params, _job_labels(website, job_tags[website])))
+            except Exception as e:
+                logger.warning(f"Error submitting query for {website}: {str(e)}")
+                errors[website] = e
+                _record_job(None, website, job_tags[website], error=e)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_wait_for_job, job, website, timeout, job_tags[website]): website
+                for website, job in jobs.items()
+            }
+            for future in as_completed(futures):
+                website = futures[future]
+                try:
+                    results[website] = future.result()
+                    if website in store_keys:
+                        _store_shared(cache, store_keys[website], results[website], shared_ttl)
+                except Exception as e:
+                    logger.warning(f"Error executing query for {website}: {str(e)}")
+                    errors[website] = e
+                    _record_job(jobs[website], website, job_tags[website], error=e)
+                    try:
+                        jobs[website].cancel()
+                    except Exception:
+                        pass
+    finally:
+        for key in locked.values():
+            try:
+                cache.unlock(key)
+            except Exception as e:
+                logger.warning(f"Could not release shared cache lock {key[:12]}: {str(e)}")
+
+    # The other replica's jobs were running alongside ours; run the ones it gave up on here
+    fallback = {}
+    for website, key in waiting.items():
+        data = cache.wait_for(key)
+        if data is None:
+            fallback[website] = queries[website]
+        else:
+            results[website] = frame_from_bytes(data)
+    if fallback:
+        logger.warning(f"Shared cache: no result from another replica for {', '.join(fallback)}, querying here")
+        fallback_results, fallback_errors = fetch_analytics_data_concurrent(
+            client, fallback, max_workers, timeout, shared_ttl=0, tags=tags)
+        for website, df in fallback_results.items():
+            _store_shared(cache, waiting[website], df, shared_ttl)
+        results.update(fallback_results)
+        errors.update(fallback_errors)
+
+    return results, errors
@@ -0,0 +1,88 @@
+"""
+cost_rollup.py - Local rollup of billed bytes per day, site and query kind, grown incrementally
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.atomic_write import atomic_write
+
+logger = logging.getLogger(__name__)
+
+COST_ROLLUP_PATH = Path(os.environ.get("GA4_COST_ROLLUP", ".cache/cost_rollup.parquet"))
+# Days fetched on the first load; INFORMATION_SCHEMA.JOBS keeps about 180
+BACKFILL_DAYS = 90
+# Jobs created in the last few minutes may still be running; they're counted on a later load
+SETTLE_MINUTES = 15
+KEY_COLUMNS = ['date', 'site', 'kind', 'version']
+COLUMNS = KEY_COLUMNS + ['jobs', 'bytes_billed']
+# Schema metadata key holding the high-water mark, so rows and mark are replaced together
+_MARK_KEY = b"cost_until"
+
+_lock = threading.Lock()
+
+
+def _empty_rollup() -> pd.DataFrame:
+    return pd.DataFrame({
+        'date': pd.Series(dtype='datetime64[ns]'),
+        'site': pd.Series(dtype=object),
+        'kind': pd.Series(dtype=object),
+        'version': pd.Series(dtype=object),
+        'jobs': pd.Series(dtype='int64'),
+        'bytes_billed': pd.Series(dtype='int64'),
+    })
+
+
+def load_cost_rollup(path: Path = COST_ROLLUP_PATH) -> pd.DataFrame:
+    """Every day, site, kind and version counted so far (empty before the first load)."""
+    if not path.exists():
+        return _empty_rollup()
+    return pd.read_parquet(path)
+
+
+def high_water_mark(path: Path = COST_ROLLUP_PATH) -> Optional[datetime]:
+    """Jobs created up to this time are already in the rollup."""
+    if not path.exists():
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    return datetime.fromisoformat(metadata[_MARK_KEY].decode()) if _MARK_KEY in metadata else None
+
+
+def _save(rollup: pd.DataFrame, until: datetime, path: Path) -> None:
+    table = pa.Table.from_pandas(rollup, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), _MARK_KEY: until.isoformat().encode()})
+    # Several processes may update the rollup at once
+    with atomic_write(path) as tmp:
+        pq.write_table(table, tmp)
+
+
+def update_cost_rollup(fetch: Callable[[datetime, datetime], pd.DataFrame], now: Optional[datetime] = None,
+                       path: Path = COST_ROLLUP_PATH) -> pd.DataFrame:
+    """Fetch only jobs created since the high-water mark, merge them in and return the rollup.
+
+    ``fetch(since, until)`` returns rows with :data:`COLUMNS` for jobs created
+    in ``(since, until]``.
+    """
+    now = now or datetime.now(timezone.utc)
+    with _lock:
+        rollup = load_cost_rollup(path)
+        since = high_water_mark(path) or now - timedelta(days=BACKFILL_DAYS)
+        until = now - timedelta(minutes=SETTLE_MINUTES)
+        if until <= since:
+            return rollup
+        rows = fetch(since, until)
+        if not rows.empty:
+            rows = rows.assign(date=pd.to_datetime(rows['date']))[COLUMNS]
+            parts = [frame for frame in (rollup, rows) if not frame.empty]
+            rollup = (pd.concat(parts, ignore_index=True)
+                      .groupby(KEY_COLUMNS, dropna=False, as_index=False)[['jobs', 'bytes_billed']].sum())
+        _save(rollup, until, path)
+        logger.info(f"Cost rollup: {len(rows)} new rows for jobs created {since:%Y-%m-%d %H:%M} to {until:%H:%M}")
+        return rollup
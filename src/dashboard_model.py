@@ -0,0 +1,250 @@
+"""
+dashboard_model.py - Streamlit-free view model holding everything the dashboard displays
+"""
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+from typing import Optional
+
+import pandas as pd
+
+from src.query import REALTIME_MINUTES
+from src.query_cost import job_label_value
+from src.rollup import Rollup, build_rollup, with_realtime
+from src.website_table import RECENT_COLUMN, build_website_table, render_website_table
+
+COST_WINDOW_DAYS = 30
+FREE_TIER_GIB = 1024
+# Cost rows from jobs without the app's labels, and from jobs covering several sites
+OTHER_JOBS = '(other jobs)'
+MULTI_SITE_JOBS = '(multi-site jobs)'
+
+
+@dataclass(frozen=True)
+class RealtimePanel:
+    """The "Active Users (Last 30 Minutes)" section of a panel."""
+    by_minute: pd.Series     # sessions per minutes_past, 0..REALTIME_MINUTES
+    active_users: int
+    countries: pd.DataFrame  # country, sessions
+
+
+@dataclass(frozen=True)
+class SitePanel:
+    """Numbers and series for one site panel (or the Total panel)."""
+    website: str
+    daily: pd.DataFrame          # event_date, sessions
+    live: RealtimePanel
+    landing_pages: pd.DataFrame  # Landing Page, Sessions
+    sources: pd.DataFrame        # session_source, sessions
+    source_trend: pd.DataFrame   # event_date, session_source, sessions
+
+
+@dataclass(frozen=True)
+class CostSummary:
+    days: int
+    daily: pd.DataFrame    # date, gigs_billed, month_to_date_gigs_billed_sum (last ``days`` days)
+    by_site: pd.DataFrame  # site, gigs_billed, busiest first
+    by_kind: pd.DataFrame  # kind, gigs_billed, busiest first
+    total_gb: float
+    percent_free: float
+
+
+@dataclass(frozen=True)
+class RealtimeModel:
+    """Realtime sections only, recomputed on every realtime refresh."""
+    total: RealtimePanel
+    sites: dict  # website -> RealtimePanel, sites with recent sessions only
+
+    def site(self, website: str) -> RealtimePanel:
+        return self.sites.get(website) or _realtime_panel(EMPTY_REALTIME, EMPTY_COUNTRIES)
+
+
+@dataclass(frozen=True)
+class DashboardModel:
+    """Everything the dashboard page shows, computed once per data version, config and day."""
+    today: pd.Timestamp
+    websites: list       # filter options: sites with data in the last 7 days
+    website_order: list  # panel order: selected sites with data, busiest first
+    website_table: pd.DataFrame
+    website_table_html: str
+    total: SitePanel     # selected sites only
+    sites: dict          # website -> SitePanel, selected sites only
+    cost: Optional[CostSummary]
+    rollup: Rollup
+
+
+def _minute_series(realtime: pd.DataFrame) -> pd.Series:
+    return (realtime.groupby('minutes_past')['sessions'].sum()
+            .reindex(range(REALTIME_MINUTES + 1), fill_value=0))
+
+
+EMPTY_REALTIME = pd.DataFrame({'minutes_past': pd.Series(dtype='int64'), 'sessions': pd.Series(dtype='int64')})
+EMPTY_COUNTRIES = pd.DataFrame({'country': pd.Series(dtype=object), 'sessions': pd.Series(dtype='int64')})
+
+
+def _realtime_panel(realtime: pd.DataFrame, countries: pd.DataFrame) -> RealtimePanel:
+    return RealtimePanel(
+        by_minute=_minute_series(realtime),
+        active_users=int(realtime['sessions'].sum()),
+        countries=countries,
+    )
+
+
+def _landing_page_table(pages: pd.DataFrame) -> pd.DataFrame:
+    return pages.rename(columns={'landingPage': 'Landing Page', 'sessions': 'Sessions'})
+
+
+def _split_by_website(frame: pd.DataFrame) -> dict:
+    # One groupby per frame instead of an index lookup per site
+    return {website: rows.reset_index(drop=True)
+            for website, rows in frame.groupby(level='website', sort=False)}
+
+
+def _site_panels(rollup: Rollup) -> dict:
+    frames = {
+        'daily': rollup.daily,
+        'realtime': rollup.realtime,
+        'countries': rollup.countries,
+        'landing_pages': rollup.landing_pages,
+        'sources': rollup.sources,
+        'source_trend': rollup.source_trend,
+    }
+    split = {name: _split_by_website(frame) for name, frame in frames.items()}
+    empty = {name: frame.iloc[0:0].reset_index(drop=True) for name, frame in frames.items()}
+
+    panels = {}
+    for website in rollup.website_order:
+        rows = {name: split[name].get(website, empty[name]) for name in frames}
+        panels[website] = SitePanel(
+            website=website,
+            daily=rows['daily'],
+            live=_realtime_panel(rows['realtime'], rows['countries']),
+            landing_pages=_landing_page_table(rows['landing_pages']),
+            sources=rows['sources'],
+            source_trend=rows['source_trend'].sort_values('event_date'),
+        )
+    return panels
+
+
+def _total_panel(rollup: Rollup) -> SitePanel:
+    return SitePanel(
+        website='Total',
+        daily=rollup.daily.groupby('event_date')['sessions'].sum().reset_index().sort_values('event_date'),
+        live=_realtime_panel(rollup.realtime, rollup.all_countries),
+        landing_pages=_landing_page_table(rollup.all_landing_pages),
+        sources=rollup.sources.iloc[0:0].reset_index(drop=True),
+        source_trend=rollup.source_trend.iloc[0:0].reset_index(drop=True),
+    )
+
+
+def _gigs_by(window: pd.DataFrame, column: str, names: dict) -> pd.DataFrame:
+    labels = window[column].map(lambda value: OTHER_JOBS if pd.isna(value) else names.get(value, value))
+    return (window.groupby(labels.rename(column))['gigs_billed'].sum()
+            .sort_values(ascending=False).reset_index())
+
+
+def compute_cost_summary(cost_df: Optional[pd.DataFrame], today: pd.Timestamp, days: int = COST_WINDOW_DAYS,
+                         websites: Optional[list] = None) -> Optional[CostSummary]:
+    """Billed GiB per day for the last ``days`` days, per site and query kind, with the total
+    and share of the free tier.
+
+    ``cost_df`` is the cost rollup (date, site, kind, version, jobs,
+    bytes_billed); ``websites`` maps site labels back to website names.
+    """
+    if cost_df is None or cost_df.empty:
+        return None
+    cost_df = cost_df.assign(date=pd.to_datetime(cost_df['date']).dt.date, gigs_billed=cost_df['bytes_billed'] / 1e9)
+    daily_cost = cost_df.groupby('date', as_index=False)['gigs_billed'].sum().sort_values('date')
+    month = pd.to_datetime(daily_cost['date']).dt.to_period('M')
+    daily_cost['month_to_date_gigs_billed_sum'] = daily_cost.groupby(month)['gigs_billed'].cumsum()
+    last_days = pd.DataFrame({'date': pd.date_range(end=today, periods=days).date})
+    # Merge with full date range to ensure all days are present
+    daily_cost = last_days.merge(daily_cost, on='date', how='left').fillna(
+        {'gigs_billed': 0, 'month_to_date_gigs_billed_sum': 0})
+
+    window = cost_df[cost_df['date'] >= last_days['date'].iloc[0]]
+    site_names = {job_label_value(website): website for website in websites or []}
+    site_names['multi'] = MULTI_SITE_JOBS
+    total_gb = float(daily_cost['gigs_billed'].sum())
+    return CostSummary(
+        days=days,
+        daily=daily_cost,
+        by_site=_gigs_by(window, 'site', site_names),
+        by_kind=_gigs_by(window, 'kind', {}),
+        total_gb=total_gb,
+        percent_free=total_gb / FREE_TIER_GIB * 100,
+    )
+
+
+def compute_dashboard_model(df: pd.DataFrame, cost_df: Optional[pd.DataFrame], config: dict,
+                            today: Optional[date] = None, websites: Optional[list] = None,
+                            rollup: Optional[Rollup] = None,
+                            realtime_df: Optional[pd.DataFrame] = None,
+                            site_fetched_at: Optional[dict] = None,
+                            site_scan: Optional[dict] = None,
+                            now: Optional[datetime] = None) -> DashboardModel:
+    """Compute every number, table and series on the page without touching Streamlit.
+
+    ``websites`` limits the Total and site panels to a selection (None keeps
+    every site); the website table always covers every configured site. A
+    ``rollup`` already built from ``df`` can be passed to skip rebuilding it.
+    ``realtime_df`` (from the realtime lane) replaces the realtime figures
+    derived from ``df``; ``site_fetched_at`` and ``site_scan`` add per-site
+    freshness and scan estimates to the table. The realtime figures cover
+    the minutes before ``now`` (default: the current time).
+    """
+    if not pd.api.types.is_datetime64_any_dtype(df['event_date']):
+        df = df.assign(event_date=pd.to_datetime(df['event_date']))
+    rollup = rollup or build_rollup(df, config, today, now)
+    selected = rollup
+    if websites is not None:
+        selected = build_rollup(df[df['website'].isin(websites)], config, rollup.today, now)
+    website_table = build_website_table(rollup, config, site_fetched_at, site_scan)
+    model = DashboardModel(
+        today=rollup.today,
+        websites=rollup.websites,
+        website_order=selected.website_order,
+        website_table=website_table,
+        website_table_html=render_website_table(website_table),
+        total=_total_panel(selected),
+        sites=_site_panels(selected),
+        cost=compute_cost_summary(cost_df, rollup.today, websites=[w['website'] for w in config['websites']]),
+        rollup=rollup,
+    )
+    return model if realtime_df is None else merge_realtime(model, realtime_df, websites, now)
+
+
+def merge_realtime(model: DashboardModel, realtime_df: pd.DataFrame,
+                   websites: Optional[list] = None, now: Optional[datetime] = None) -> DashboardModel:
+    """Swap the realtime figures of ``model`` for ones built from the realtime lane.
+
+    Only the live sections and the table's 30 Min column are rebuilt; the
+    history and cost parts are shared with ``model``.
+    """
+    rollup = with_realtime(model.rollup, realtime_df, now)
+    live = (_realtime_model(rollup) if websites is None
+            else compute_realtime_model(model.rollup, realtime_df, websites, now))
+    recent = model.website_table['Website'].map(rollup.site_summary['recent']).fillna(0).astype(int)
+    website_table = model.website_table.assign(**{RECENT_COLUMN: recent})
+    return replace(
+        model,
+        website_table=website_table,
+        website_table_html=render_website_table(website_table),
+        total=replace(model.total, live=live.total),
+        sites={website: replace(panel, live=live.site(website)) for website, panel in model.sites.items()},
+        rollup=rollup,
+    )
+
+
+def _realtime_model(rollup: Rollup) -> RealtimeModel:
+    countries = _split_by_website(rollup.countries)
+    sites = {website: _realtime_panel(rows, countries.get(website, EMPTY_COUNTRIES))
+             for website, rows in _split_by_website(rollup.realtime).items()}
+    return RealtimeModel(total=_realtime_panel(rollup.realtime, rollup.all_countries), sites=sites)
+
+
+def compute_realtime_model(rollup: Rollup, realtime_df: pd.DataFrame,
+                           websites: Optional[list] = None, now: Optional[datetime] = None) -> RealtimeModel:
+    """Build just the realtime sections from fresh realtime rows on top of a history rollup."""
+    if websites is not None:
+        realtime_df = realtime_df[realtime_df['website'].isin(websites)]
+    return _realtime_model(with_realtime(rollup, realtime_df, now))
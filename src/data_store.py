@@ -0,0 +1,179 @@
+"""
+data_store.py - Process-wide, read-only store for the latest dashboard data
+"""
+import itertools
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import pandas as pd
+
+from src.bq_client import concat_compact
+from src.rollup import Rollup
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DataSnapshot:
+    version: str
+    fetched_at: datetime
+    analytics: pd.DataFrame
+    cost: Optional[pd.DataFrame]
+    websites: Optional[frozenset] = None  # sites fetched; None means every configured site
+    config: Optional[dict] = None         # site config the data was fetched with
+    site_fetched_at: dict = field(default_factory=dict)  # website -> when its rows were fetched
+    rollup: Optional[Rollup] = None       # precomputed by build_snapshot.py, if the snapshot came from a file
+    site_scan: dict = field(default_factory=dict)  # website -> SiteScan from the scan budget, if enabled
+
+    def age_seconds(self) -> float:
+        return (datetime.now(timezone.utc) - self.fetched_at).total_seconds()
+
+    def covers(self, websites: Optional[frozenset]) -> bool:
+        if self.websites is None:
+            return True
+        return websites is not None and websites <= self.websites
+
+
+# Snapshot frames are shared by every session and reused across versions, so the
+# helpers below return new frames instead of writing into the ones they are given
+def _prepare_analytics(df: pd.DataFrame) -> pd.DataFrame:
+    if 'event_date' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['event_date']):
+        df = df.assign(event_date=pd.to_datetime(df['event_date']))
+    return df
+
+
+def _prepare_cost(cost_df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    if cost_df is not None and not cost_df.empty:
+        cost_df = cost_df.assign(date=pd.to_datetime(cost_df['date']).dt.date)
+    return cost_df
+
+
+class DataStore:
+    """Holds one immutable snapshot shared by every session in the process.
+
+    Sessions read the same frames without pickling or hashing them; a refresh
+    builds a new snapshot and swaps it in under a lock. Snapshot frames are
+    read-only: code that needs to change one works on a copy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[DataSnapshot] = None
+        self._counter = itertools.count(1)
+        self._published = threading.Event()
+
+    def get(self) -> Optional[DataSnapshot]:
+        return self._snapshot
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[DataSnapshot]:
+        """Block until there is a first snapshot (or ``timeout`` passes) and return the current one."""
+        self._published.wait(timeout)
+        return self._snapshot
+
+    def publish(self, analytics: pd.DataFrame, cost: Optional[pd.DataFrame], config: Optional[dict] = None,
+                websites: Optional[frozenset] = None, fetched_at: Optional[datetime] = None,
+                site_fetched_at: Optional[dict] = None, site_scan: Optional[dict] = None) -> DataSnapshot:
+        """Derive the shared columns once and make the result the current snapshot.
+
+        ``fetched_at`` defaults to now; partial updates pass the previous value
+        so the snapshot still ages from its last full load.
+        """
+        now = datetime.now(timezone.utc)
+        fetched_at = fetched_at or now
+        analytics = _prepare_analytics(analytics)
+        if site_fetched_at is None and 'website' in analytics.columns:
+            site_fetched_at = {str(website): fetched_at for website in analytics['website'].unique()}
+        snapshot = DataSnapshot(
+            version=f"{now:%Y%m%d%H%M%S}-{next(self._counter)}",
+            fetched_at=fetched_at,
+            analytics=analytics,
+            cost=_prepare_cost(cost),
+            websites=websites,
+            config=config,
+            site_fetched_at=site_fetched_at or {},
+            site_scan=site_scan or {},
+        )
+        self._snapshot = snapshot
+        self._published.set()
+        logger.info(f"Published data snapshot {snapshot.version} ({len(analytics)} rows)")
+        return snapshot
+
+    def update_sites(self, websites: frozenset, analytics: pd.DataFrame) -> Optional[DataSnapshot]:
+        """Publish a new version with the rows of ``websites`` replaced by ``analytics``.
+
+        Fetch outside the store; only the splice runs under the lock.
+        """
+        with self._lock:
+            current = self._snapshot
+            if current is None:
+                return None
+            kept = current.analytics[~current.analytics['website'].isin(websites)]
+            now = datetime.now(timezone.utc)
+            return self.publish(
+                concat_compact([kept, _prepare_analytics(analytics)]), current.cost, current.config,
+                current.websites, fetched_at=current.fetched_at,
+                site_fetched_at={**current.site_fetched_at, **{website: now for website in websites}},
+                site_scan=current.site_scan)
+
+    def update_cost(self, cost: pd.DataFrame) -> Optional[DataSnapshot]:
+        """Publish a new version with only the cost data replaced."""
+        with self._lock:
+            current = self._snapshot
+            if current is None:
+                return None
+            return self.publish(current.analytics, cost, current.config, current.websites,
+                                fetched_at=current.fetched_at, site_fetched_at=current.site_fetched_at,
+                                site_scan=current.site_scan)
+
+    def adopt(self, version: str, read: Callable[[], DataSnapshot]) -> DataSnapshot:
+        """Make a snapshot built elsewhere current, calling ``read`` only if ``version`` isn't loaded yet."""
+        current = self._snapshot
+        if current is not None and current.version == version:
+            return current
+        with self._lock:
+            current = self._snapshot
+            if current is not None and current.version == version:
+                return current
+            self._snapshot = read()
+            self._published.set()
+            logger.info(f"Adopted data snapshot {version} ({len(self._snapshot.analytics)} rows)")
+            return self._snapshot
+
+    def get_or_refresh(self, loader: Callable[[Optional[frozenset]], tuple], max_age: float,
+                       force: bool = False, websites: Optional[frozenset] = None) -> DataSnapshot:
+        """Return the current snapshot, reloading it first if missing, stale, forced or
+        not covering ``websites`` (None asks for every configured site).
+
+        Only one caller runs ``loader`` at a time; callers that waited on the
+        lock reuse the snapshot it produced. ``loader`` gets the sites to fetch,
+        which keeps whatever a fresh partial snapshot already covers so sessions
+        with different filters don't evict each other.
+        """
+        snapshot = self._snapshot
+        if (not force and snapshot is not None and snapshot.age_seconds() < max_age
+                and snapshot.covers(websites)):
+            return snapshot
+        with self._lock:
+            current = self._snapshot
+            if current is not snapshot and current is not None and current.covers(websites):
+                return current
+            if (websites is not None and current is not None and current.websites is not None
+                    and current.age_seconds() < max_age):
+                websites = websites | current.websites
+            return self._publish_loaded(loader(websites), websites)
+
+    def refresh(self, loader: Callable[[Optional[frozenset]], tuple],
+                websites: Optional[frozenset] = None) -> DataSnapshot:
+        """Load and publish a new snapshot unconditionally; readers keep the old one until the swap."""
+        with self._lock:
+            return self._publish_loaded(loader(websites), websites)
+
+    def _publish_loaded(self, loaded: tuple, websites: Optional[frozenset]) -> DataSnapshot:
+        # Loaders return (analytics, cost[, config[, extra publish() keyword arguments]])
+        analytics, cost, *rest = loaded
+        config = rest[0] if rest else None
+        extra = rest[1] if len(rest) > 1 else {}
+        return self.publish(analytics, cost, config, websites=websites, **extra)
@@ -0,0 +1,103 @@
+"""
+day_cache.py - On-disk Parquet cache for completed GA4 daily tables
+
+Drop entries after GA4 re-exports older days (a site's Refresh does it for that site):
+
+    python -m src.day_cache invalidate [--suffix SUFFIX] [--day YYYY-MM-DD] [--version V]
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from src.atomic_write import atomic_write
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.environ.get("GA4_DAY_CACHE_DIR", ".cache/ga4_days"))
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+# Bumped whenever the stored columns change, so stale files are never read
+CACHE_FORMAT = 2
+
+
+def _day_path(suffix: str, day: date, version: str) -> Path:
+    return CACHE_DIR / f"{version}-r{CACHE_FORMAT}" / suffix / f"{day:%Y%m%d}.parquet"
+
+
+def is_cached(suffix: str, day: date, version: str) -> bool:
+    return _day_path(suffix, day, version).exists()
+
+
+def load_day(suffix: str, day: date, version: str) -> Optional[pd.DataFrame]:
+    """Return the cached rows for one site and day, or None on a miss."""
+    path = _day_path(suffix, day, version)
+    if not path.exists():
+        return None
+    try:
+        df = pd.read_parquet(path)
+    except Exception as e:
+        logger.warning(f"Discarding unreadable day cache file {path}: {str(e)}")
+        path.unlink(missing_ok=True)
+        return None
+    # Reads count as use for LRU eviction
+    os.utime(path)
+    return df
+
+
+def save_day(suffix: str, day: date, version: str, df: pd.DataFrame) -> None:
+    """Store the rows for one site and day, then enforce the size cap."""
+    # Several replicas may backfill the same day at once
+    with atomic_write(_day_path(suffix, day, version)) as tmp:
+        df.to_parquet(tmp, index=False)
+    evict()
+
+
+def invalidate(suffix: Optional[str] = None, day: Optional[date] = None,
+               version: Optional[str] = None) -> int:
+    """Delete cached days matching every given filter; returns the number removed."""
+    version_dir = f"{version}-r{CACHE_FORMAT}" if version else "*"
+    day_name = f"{day:%Y%m%d}" if day else "*"
+    pattern = f"{version_dir}/{suffix or '*'}/{day_name}.parquet"
+    removed = 0
+    for path in CACHE_DIR.glob(pattern):
+        path.unlink(missing_ok=True)
+        removed += 1
+    logger.info(f"Invalidated {removed} cached days ({pattern})")
+    return removed
+
+
+def evict(max_bytes: int = MAX_CACHE_BYTES) -> None:
+    """Remove least recently used files until the cache fits in ``max_bytes``."""
+    files = [(path.stat(), path) for path in CACHE_DIR.glob("*/*/*.parquet")]
+    total = sum(stat.st_size for stat, _ in files)
+    for stat, path in sorted(files, key=lambda item: item[0].st_mtime):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= stat.st_size
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the on-disk cache of completed GA4 days.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    drop = commands.add_parser("invalidate", help="delete cached days, e.g. after a GA4 backfill or reprocessing")
+    drop.add_argument("--suffix", help="only this dataset suffix (default: every site)")
+    drop.add_argument("--day", type=date.fromisoformat, help="only this day, as YYYY-MM-DD (default: every day)")
+    drop.add_argument("--version", help="only this query version (default: every version)")
+    commands.add_parser("evict", help="enforce the size cap now")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == "invalidate":
+        invalidate(args.suffix, args.day, args.version)
+    else:
+        evict()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
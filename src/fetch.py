@@ -0,0 +1,458 @@
+"""
+fetch.py - Run the dashboard's BigQuery fetches, for the app and for build_snapshot.py
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import pandas as pd
+
+from src.bq_client import (fetch_analytics_data, fetch_analytics_data_concurrent, concat_compact,
+                           estimate_bytes_concurrent, SHARED_CACHE_TTL)
+from src.cost_rollup import update_cost_rollup, load_cost_rollup
+from src.data_store import DataSnapshot
+from src.day_cache import is_cached, load_day, save_day
+from src.query import (final_days, window_dates, get_site_query, get_day_query,
+                       get_multi_property_analytics_query, batch_suffixes, get_intraday_tables_query,
+                       get_query_parameters, get_realtime_query,
+                       get_multi_property_realtime_query, get_realtime_query_parameters,
+                       REALTIME_PROPERTIES_PER_QUERY)
+from src.query_cost import get_job_cost_query, get_job_cost_parameters
+from src.scan_budget import (RUN, DOWNGRADE, DEFER, MIN_BILLED_BYTES, ScanBudgetExceeded, format_bytes, plan_scans,
+                              admitted_bytes, remaining_today)
+
+logger = logging.getLogger(__name__)
+
+# Seconds a site seen with an intraday table is trusted to still have one (a missing one is
+# caught by the query error fallback); sites without one are looked up again after
+# INTRADAY_RECHECK_SECONDS so they rejoin the live queries soon after their table appears
+METADATA_CACHE_DURATION = 6 * 3600
+INTRADAY_RECHECK_SECONDS = 900
+
+# Analytics fetching: "concurrent" runs all site queries at once, "sequential" one by one,
+# "multi_property" unions all properties into one (or a few batched) jobs
+FETCH_MODE = "concurrent"
+MAX_CONCURRENT_QUERIES = 8
+QUERY_TIMEOUT = 300  # seconds per BigQuery job, waiting for it and downloading its result
+# Query engine: "v1" is the original self-joining query, "v2" the single-scan rewrite
+QUERY_VERSION = "v2"
+# Kept with each job's telemetry record
+HISTORY_TAGS = {"kind": "history", "version": QUERY_VERSION}
+# Result grain: "minute" for the whole window, "multi" for minute rows only in the last 30 minutes
+RESULT_GRAIN = "multi"
+# Serve completed daily tables from the on-disk Parquet cache (concurrent mode)
+USE_DAY_CACHE = True
+# Dry-run each site's history query first and keep refreshes within a bytes-scanned budget;
+# sites over it are downgraded to history-only, deferred (previous rows kept) or skipped.
+# The realtime lane is dry-run too and skipped when over today's budget, as are the metadata
+# and cost queries; every job's billed bytes count towards it. Limits in bytes, None for no limit
+# (1024 ** 4 // 31 spreads the 1 TiB monthly free tier over a month)
+SCAN_BUDGET = False
+MAX_REFRESH_SCAN_BYTES = None
+MAX_DAILY_SCAN_BYTES = None
+
+
+def _require_budget(label, nbytes) -> None:
+    """Raise ScanBudgetExceeded if ``nbytes`` more would go over today's scan budget."""
+    remaining = remaining_today(MAX_DAILY_SCAN_BYTES) if SCAN_BUDGET else None
+    if remaining is not None and nbytes > remaining:
+        raise ScanBudgetExceeded(f"{label} needs ~{format_bytes(nbytes)}, "
+                                 f"{format_bytes(remaining)} left of today's scan budget")
+
+
+_intraday_lock = threading.Lock()
+_intraday = {"seen_at": {}, "checked_at": None}  # suffix -> when last seen with an intraday table
+
+
+def fetch_intraday_suffixes(client, suffixes=None) -> Optional[set]:
+    """The dataset suffixes that currently have an intraday table, or None if never looked up.
+
+    Positive results are kept for METADATA_CACHE_DURATION; if any of
+    ``suffixes`` (the configured sites) has no intraday table, the lookup is
+    repeated once INTRADAY_RECHECK_SECONDS have passed.
+    """
+    with _intraday_lock:
+        now = time.monotonic()
+        seen_at, checked_at = _intraday["seen_at"], _intraday["checked_at"]
+        current = {suffix for suffix, at in seen_at.items() if now - at < METADATA_CACHE_DURATION}
+        stale = checked_at is None or now - checked_at >= METADATA_CACHE_DURATION or (
+            not set(suffixes or ()) <= current and now - checked_at >= INTRADAY_RECHECK_SECONDS)
+        if not stale:
+            return current
+        try:
+            _require_budget("Intraday table lookup", MIN_BILLED_BYTES)
+            # Shared for no longer than the recheck interval, or other replicas would return stale negatives
+            tables_df = fetch_analytics_data(client, get_intraday_tables_query(), "table metadata",
+                                             shared_ttl=INTRADAY_RECHECK_SECONDS, tags={"kind": "metadata"})
+        except Exception as e:
+            logger.warning(f"Could not fetch intraday table metadata: {str(e)}")
+            return current if checked_at is not None else None
+        seen_at.update({suffix: now for suffix in tables_df.loc[tables_df['has_intraday'], 'suffix']})
+        _intraday["checked_at"] = now
+        return {suffix for suffix, at in seen_at.items() if now - at < METADATA_CACHE_DURATION}
+
+
+def _is_missing_intraday(error) -> bool:
+    return "does not match any table" in str(error) and "events_intraday_" in str(error)
+
+
+def _is_missing_daily(error) -> bool:
+    # A finalized day named explicitly that the property never exported (e.g. a new site)
+    return "Not found: Table" in str(error) and ".events_" in str(error) and "events_intraday_" not in str(error)
+
+
+def _wildcard_params(reference) -> list:
+    # Parameters for reading every window day through the wildcard, when a named table is missing
+    return get_query_parameters(reference, table_dates=window_dates(reference.date()))
+
+
+def _is_historical(suffix, intraday) -> bool:
+    # Without metadata, assume the intraday table exists and rely on the error fallback
+    return intraday is not None and suffix not in intraday
+
+
+def _fetch_sequential(client, websites, reference, intraday=None, force=False) -> list:
+    all_data = []
+    params = get_query_parameters(reference)
+    final = final_days(reference.date())
+
+    for website in websites:
+        suffix = website['suffix']
+        website_name = website['website']
+        try:
+            query = get_site_query(suffix, QUERY_VERSION, historical=_is_historical(suffix, intraday),
+                                   grain=RESULT_GRAIN, final_dates=final)
+            data = fetch_analytics_data(client, query, website_name, params, tags=HISTORY_TAGS, force=force)
+        except Exception as e:
+            if _is_missing_daily(e):
+                logger.warning(
+                    f"Daily table missing for website: {website_name}. Reading the window through the wildcard.")
+                query = get_site_query(suffix, QUERY_VERSION, historical=_is_historical(suffix, intraday),
+                                       grain=RESULT_GRAIN)
+                data = fetch_analytics_data(client, query, website_name, _wildcard_params(reference),
+                                            tags=HISTORY_TAGS, force=force)
+            elif _is_missing_intraday(e):
+                logger.warning(
+                    f"Intraday table not found for website: {website_name}. Using historical data only.")
+                historical_query = get_site_query(suffix, QUERY_VERSION, historical=True, grain=RESULT_GRAIN,
+                                                  final_dates=final)
+                data = fetch_analytics_data(
+                    client, historical_query, website_name, params, tags=HISTORY_TAGS, force=force)
+            else:
+                logger.warning(
+                    f"Error executing query for website {website_name}: {str(e)}")
+                continue
+        data['website'] = website_name
+        all_data.append(data)
+    return all_data
+
+
+def _backfill_queries(websites, today) -> dict:
+    """Day queries for the completed days missing from the day cache, labelled like _cached_days()."""
+    return {
+        f"{website['website']} {day:%Y-%m-%d}": (website['website'],
+                                                 (get_day_query(website['suffix'], day, QUERY_VERSION), None))
+        for website in websites for day in final_days(today)
+        if not is_cached(website['suffix'], day, QUERY_VERSION)
+    }
+
+
+def _cached_days(suffixes, today) -> tuple:
+    """Split completed days into cached frames per site and queries for the missing ones."""
+    cached, day_queries = {}, {}
+    for name, suffix in suffixes.items():
+        for day in final_days(today):
+            data = load_day(suffix, day, QUERY_VERSION)
+            if data is None:
+                day_queries[f"{name} {day:%Y-%m-%d}"] = (name, day, get_day_query(suffix, day, QUERY_VERSION))
+            else:
+                cached.setdefault(name, []).append(data)
+    return cached, day_queries
+
+
+def _fetch_concurrent(client, websites, reference, intraday=None, force=False) -> list:
+    suffixes = {website['website']: website['suffix'] for website in websites}
+    # With the day cache, completed days come from disk and only the open days
+    # plus the intraday table are queried live; without it they are read as named tables
+    params = get_query_parameters(reference)
+    if USE_DAY_CACHE:
+        final = ()
+        cached, day_queries = _cached_days(suffixes, reference.date())
+    else:
+        final = final_days(reference.date())
+        cached, day_queries = {}, {}
+
+    queries = {
+        name: (get_site_query(suffix, QUERY_VERSION, historical=_is_historical(suffix, intraday),
+                              grain=RESULT_GRAIN, final_dates=final, after_cached_days=USE_DAY_CACHE), params)
+        for name, suffix in suffixes.items()
+    }
+    queries.update({label: (query, None, {**HISTORY_TAGS, "kind": "day", "site": name})
+                    for label, (name, _, query) in day_queries.items()})
+    results, errors = fetch_analytics_data_concurrent(
+        client, queries, max_workers=MAX_CONCURRENT_QUERIES, timeout=QUERY_TIMEOUT, tags=HISTORY_TAGS, force=force)
+
+    day_failed = set()
+    for label, (name, day, _) in day_queries.items():
+        if label in results:
+            data = results.pop(label)
+            save_day(suffixes[name], day, QUERY_VERSION, data)
+            cached.setdefault(name, []).append(data)
+        else:
+            day_failed.add(name)
+
+    # Sites whose intraday table is missing despite the metadata get a second concurrent round
+    missing_intraday = {name for name, error in errors.items() if name in suffixes and _is_missing_intraday(error)}
+    if missing_intraday:
+        logger.warning(
+            f"Intraday table not found for websites: {', '.join(missing_intraday)}. Using historical data only.")
+    # Sites missing one of the named daily tables, or with a day that couldn't be backfilled,
+    # read the whole window through the wildcard in that round instead
+    wildcard = {name for name, error in errors.items() if name in suffixes and _is_missing_daily(error)}
+    if day_failed:
+        logger.warning(f"Day queries failed for websites: {', '.join(day_failed)}. Querying their whole window.")
+        wildcard |= day_failed
+        for name in day_failed:
+            results.pop(name, None)
+            cached.pop(name, None)
+    retry_queries = {
+        name: (get_site_query(suffixes[name], QUERY_VERSION, historical=True, grain=RESULT_GRAIN,
+                              final_dates=final, after_cached_days=USE_DAY_CACHE), params)
+        for name in missing_intraday - wildcard
+    }
+    if wildcard:
+        if wildcard - day_failed:
+            logger.warning(f"Daily table missing for websites: {', '.join(wildcard - day_failed)}. "
+                           f"Reading the window through the wildcard.")
+        retry_queries.update({
+            name: (get_site_query(suffixes[name], QUERY_VERSION, grain=RESULT_GRAIN,
+                                  historical=name in missing_intraday or _is_historical(suffixes[name], intraday)),
+                   _wildcard_params(reference))
+            for name in wildcard
+        })
+    if retry_queries:
+        retry_results, _ = fetch_analytics_data_concurrent(
+            client, retry_queries, max_workers=MAX_CONCURRENT_QUERIES, timeout=QUERY_TIMEOUT,
+            tags=HISTORY_TAGS, force=force)
+        results.update(retry_results)
+
+    all_data = []
+    for website_name in suffixes:
+        if website_name in results:
+            data = concat_compact([results[website_name]] + cached.get(website_name, []))
+            data['website'] = website_name
+            all_data.append(data)
+    return all_data
+
+
+def _fetch_multi_property(client, websites, reference, intraday=None, force=False) -> list:
+    names_by_suffix = {website['suffix']: website['website'] for website in websites}
+    historical_suffixes = {suffix for suffix in names_by_suffix if _is_historical(suffix, intraday)}
+    params = get_query_parameters(reference)
+    final = final_days(reference.date())
+    batches = batch_suffixes(list(names_by_suffix), historical_suffixes, version=QUERY_VERSION, grain=RESULT_GRAIN,
+                             final_dates=final)
+    queries = {
+        f"batch {i + 1}/{len(batches)}": (batch, get_multi_property_analytics_query(
+            batch, historical_suffixes, version=QUERY_VERSION, grain=RESULT_GRAIN, final_dates=final))
+        for i, batch in enumerate(batches)
+    }
+    results, errors = fetch_analytics_data_concurrent(
+        client, {label: (query, params) for label, (_, query) in queries.items()},
+        max_workers=MAX_CONCURRENT_QUERIES, timeout=QUERY_TIMEOUT, tags={**HISTORY_TAGS, "site": "multi"},
+        force=force)
+
+    all_data = []
+    for label, data in results.items():
+        data['website'] = data.pop('property').map(names_by_suffix)
+        all_data.append(data)
+
+    # A batch fails as a whole (e.g. stale metadata for an intraday table),
+    # so fall back to per-site queries for the sites it covered
+    for label, error in errors.items():
+        batch = queries[label][0]
+        logger.warning(
+            f"Multi-property query {label} failed, fetching its {len(batch)} sites individually: {str(error)}")
+        all_data.extend(_fetch_concurrent(
+            client, [w for w in websites if w['suffix'] in batch], reference, intraday, force))
+    return all_data
+
+
+def fetch_analytics_df(client, config, downgraded: frozenset = frozenset(), force: bool = False) -> pd.DataFrame:
+    """Fetch analytics data for filtered websites; ``downgraded`` suffixes skip their intraday table.
+
+    ``force`` bypasses results other replicas shared (for refreshes a user asked for).
+    """
+    suffixes = {website['suffix'] for website in config['websites']}
+    intraday = fetch_intraday_suffixes(client, suffixes)
+    if downgraded:
+        intraday = (suffixes if intraday is None else intraday) - downgraded
+    # One reference time for every job so identical refreshes render identical queries
+    reference = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    if FETCH_MODE == "multi_property":
+        all_data = _fetch_multi_property(client, config['websites'], reference, intraday, force)
+    elif FETCH_MODE == "concurrent":
+        all_data = _fetch_concurrent(client, config['websites'], reference, intraday, force)
+    else:
+        all_data = _fetch_sequential(client, config['websites'], reference, intraday, force)
+    if all_data:
+        return concat_compact(all_data)
+    return pd.DataFrame()
+
+
+def _scan_queries(websites, reference, intraday, historical=False) -> dict:
+    """Each site's history query and parameters, as the fetch would run them, for dry runs."""
+    # With the day cache only the open days are read live; see _backfill_queries() for the rest
+    params = get_query_parameters(reference)
+    day_cache = FETCH_MODE == "concurrent" and USE_DAY_CACHE
+    final = () if day_cache else final_days(reference.date())
+    return {
+        website['website']: (get_site_query(website['suffix'], QUERY_VERSION, grain=RESULT_GRAIN, final_dates=final,
+                                            historical=historical or _is_historical(website['suffix'], intraday),
+                                            after_cached_days=day_cache),
+                             params)
+        for website in websites
+    }
+
+
+def plan_history_scan(client, config, previous: Optional[DataSnapshot]) -> dict:
+    """Dry-run every site's history query and decide what the scan budget lets each one do."""
+    websites = config['websites']
+    intraday = fetch_intraday_suffixes(client, {website['suffix'] for website in websites})
+    reference = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    estimates, errors = estimate_bytes_concurrent(
+        client, _scan_queries(websites, reference, intraday), MAX_CONCURRENT_QUERIES)
+    # Completed days missing from the day cache are queried along with the site, whatever its action
+    backfill = _backfill_queries(websites, reference.date()) if FETCH_MODE == "concurrent" and USE_DAY_CACHE else {}
+    backfill_bytes = {}
+    if backfill:
+        day_estimates, _ = estimate_bytes_concurrent(
+            client, {label: query for label, (_, query) in backfill.items()}, MAX_CONCURRENT_QUERIES)
+        for label, (name, _) in backfill.items():
+            backfill_bytes[name] = backfill_bytes.get(name, 0) + max(day_estimates.get(label, 0), MIN_BILLED_BYTES)
+    # A missing intraday table fails the dry run too; the fetch then reads history only, so estimate that
+    missing = [w for w in websites if w['website'] in errors and _is_missing_intraday(errors[w['website']])]
+    if missing:
+        historical, _ = estimate_bytes_concurrent(
+            client, _scan_queries(missing, reference, intraday, historical=True), MAX_CONCURRENT_QUERIES)
+        estimates.update(historical)
+    for website, error in errors.items():
+        if website not in estimates:
+            logger.warning(f"Dry run failed for {website}, fetching it unbudgeted: {str(error)}")
+
+    by_name = {website['website']: website for website in websites}
+
+    def with_backfill(site_estimates):
+        return {name: None if nbytes is None else nbytes + backfill_bytes.get(name, 0)
+                for name, nbytes in site_estimates.items()}
+
+    def estimate_downgraded(names):
+        return with_backfill(estimate_bytes_concurrent(
+            client, _scan_queries([by_name[name] for name in names], reference, intraday, historical=True),
+            MAX_CONCURRENT_QUERIES)[0])
+
+    has_previous = set(previous.analytics['website'].astype(str).unique()) if previous is not None else set()
+    return plan_scans(with_backfill({website['website']: estimates.get(website['website']) for website in websites}),
+                      estimate_downgraded, has_previous, MAX_REFRESH_SCAN_BYTES, MAX_DAILY_SCAN_BYTES)
+
+
+def fetch_within_budget(client, config, previous: Optional[DataSnapshot] = None, force: bool = False) -> tuple:
+    """Fetch the sites the scan budget admits, carrying deferred sites' rows over from ``previous``.
+
+    Returns the analytics frame and the extra snapshot fields (per-site fetch
+    times and scan estimates).
+    """
+    plan = plan_history_scan(client, config, previous)
+    admitted = [w for w in config['websites'] if plan[w['website']].action in (RUN, DOWNGRADE)]
+    downgraded = frozenset(w['suffix'] for w in admitted if plan[w['website']].action == DOWNGRADE)
+    logger.info(f"Scan budget: {len(admitted)} sites admitted, ~{format_bytes(admitted_bytes(plan))} estimated")
+    # The jobs record what they are actually billed in the ledger as they finish
+    analytics = fetch_analytics_df(client, {**config, 'websites': admitted}, downgraded, force)
+
+    now = datetime.now(timezone.utc)
+    site_fetched_at = {str(website): now for website in analytics['website'].unique()} if not analytics.empty else {}
+    deferred = [website for website, scan in plan.items() if scan.action == DEFER]
+    if deferred:
+        kept = previous.analytics[previous.analytics['website'].isin(deferred)]
+        analytics = concat_compact([f for f in (analytics, kept) if not f.empty])
+        site_fetched_at.update({w: previous.site_fetched_at[w] for w in deferred if w in previous.site_fetched_at})
+    return analytics, {"site_fetched_at": site_fetched_at, "site_scan": plan}
+
+
+def fetch_realtime_df(client, config, shared_ttl=SHARED_CACHE_TTL, force: bool = False) -> pd.DataFrame:
+    """Fetch recent session starts for every site with an intraday table.
+
+    ``shared_ttl`` should stay under the caller's realtime refresh interval;
+    ``force`` bypasses results other replicas shared.
+    """
+    intraday = fetch_intraday_suffixes(client, {website['suffix'] for website in config['websites']})
+    names_by_suffix = {website['suffix']: website['website'] for website in config['websites']
+                       if not _is_historical(website['suffix'], intraday)}
+    suffixes = list(names_by_suffix)
+    batches = [suffixes[i:i + REALTIME_PROPERTIES_PER_QUERY]
+               for i in range(0, len(suffixes), REALTIME_PROPERTIES_PER_QUERY)]
+    params = get_realtime_query_parameters()
+    queries = {f"realtime {i + 1}/{len(batches)}": (get_multi_property_realtime_query(batch), params)
+               for i, batch in enumerate(batches)}
+    if SCAN_BUDGET and queries:
+        # Dry runs report bytes processed; each intraday table read is billed at least MIN_BILLED_BYTES
+        estimates, _ = estimate_bytes_concurrent(client, queries, MAX_CONCURRENT_QUERIES)
+        _require_budget("Realtime lane", sum(max(estimates.get(label, 0), len(batch) * MIN_BILLED_BYTES)
+                                             for label, batch in zip(queries, batches)))
+    results, errors = fetch_analytics_data_concurrent(
+        client, queries, max_workers=MAX_CONCURRENT_QUERIES, timeout=QUERY_TIMEOUT,
+        shared_ttl=shared_ttl, tags={"kind": "realtime", "site": "multi"}, force=force)
+
+    all_data = []
+    for label, data in results.items():
+        data['website'] = data.pop('property').map(names_by_suffix)
+        all_data.append(data)
+
+    # A batch fails as a whole (e.g. an intraday table expired since the metadata
+    # lookup), so retry its sites one by one and skip the ones without intraday data
+    if errors:
+        failed = [suffix for label in errors for suffix in batches[list(queries).index(label)]]
+        logger.warning(f"Realtime query failed for {len(errors)} batches, retrying {len(failed)} sites individually")
+        site_results, site_errors = fetch_analytics_data_concurrent(
+            client, {names_by_suffix[suffix]: (get_realtime_query(suffix), params) for suffix in failed},
+            max_workers=MAX_CONCURRENT_QUERIES, timeout=QUERY_TIMEOUT, shared_ttl=shared_ttl,
+            tags={"kind": "realtime"}, force=force)
+        for website, data in site_results.items():
+            data['website'] = website
+            all_data.append(data)
+        for website, error in site_errors.items():
+            if not _is_missing_intraday(error):
+                raise error
+
+    if all_data:
+        return concat_compact(all_data)
+    return pd.DataFrame(columns=['website', 'session_minute', 'country', 'sessions']).astype(
+        {'session_minute': 'datetime64[ns, UTC]', 'sessions': 'int32'})
+
+
+def fetch_cost_df(client) -> Optional[pd.DataFrame]:
+    """Add jobs finished since the last load to the local cost rollup and return it."""
+    def fetch(since, until):
+        _require_budget("Cost query", MIN_BILLED_BYTES)
+        # Depends on this replica's high-water mark, so never shared
+        return fetch_analytics_data(client, get_job_cost_query(), "cost", get_job_cost_parameters(since, until),
+                                    shared_ttl=0, tags={"kind": "cost"})
+    try:
+        return update_cost_rollup(fetch)
+    except Exception as e:
+        logger.warning(f"Could not fetch BigQuery cost usage: {str(e)}")
+        rollup = load_cost_rollup()
+        return None if rollup.empty else rollup
+
+
+def fetch_history(client, config, previous: Optional[DataSnapshot] = None, force: bool = False) -> tuple:
+    """Fetch the history lane as the store publishes it: ``(analytics, extra snapshot fields)``.
+
+    With SCAN_BUDGET the fetch goes through the budget, ``previous`` supplying
+    the rows of deferred sites. ``force`` bypasses results other replicas shared.
+    """
+    if not SCAN_BUDGET:
+        return fetch_analytics_df(client, config, force=force), {}
+    return fetch_within_budget(client, config, previous, force)
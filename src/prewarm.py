@@ -0,0 +1,139 @@
+"""
+prewarm.py - Background refresher that keeps a DataStore warm ahead of its TTL
+"""
+import functools
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from src.data_store import DataStore
+
+logger = logging.getLogger(__name__)
+
+# Wait before retrying after a failed refresh
+RETRY_SECONDS = 60
+
+
+class Prewarmer:
+    """Refreshes a store on a daemon thread shortly before its snapshot expires.
+
+    Once a first snapshot exists, requests never wait on BigQuery: they read
+    the current snapshot while the next one is built, and refreshes asked for
+    by users are queued here instead of run inline. Smaller jobs (one site,
+    cost only) can be queued with :meth:`submit` and run on the same thread.
+    ``loader`` is called with ``force=True`` for refreshes users asked for, so
+    it can skip results other replicas shared.
+
+    Nothing is scheduled before the store has a first snapshot: the request
+    that needs it loads it, and refreshing alongside would query twice.
+
+    With ``idle_after``, scheduled refreshes pause once no session has called
+    :meth:`touch` for that many seconds, and resume on the next touch.
+    """
+
+    def __init__(self, store: DataStore, loader: Callable[[Optional[frozenset]], tuple],
+                 max_age: float, lead: float, name: str = "prewarm", idle_after: Optional[float] = None):
+        self.store = store
+        self.loader = loader
+        self.max_age = max_age
+        self.lead = lead
+        self.name = name
+        self.idle_after = idle_after
+        self.refreshing = False
+        self._seen_at = time.monotonic()
+        self._paused = False
+        self.last_error: Optional[str] = None
+        self._full_requested = False
+        self._retry_at: Optional[float] = None
+        self._jobs = queue.Queue()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "Prewarmer":
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            logger.info(f"Started {self.name} (max age {self.max_age}s, lead {self.lead}s)")
+        return self
+
+    def touch(self) -> None:
+        """Record that a session is using the store, waking the refresher if it was paused."""
+        self._seen_at = time.monotonic()
+        if self._paused:
+            self._wake.set()
+
+    def idle(self) -> bool:
+        return self.idle_after is not None and time.monotonic() - self._seen_at > self.idle_after
+
+    def request_refresh(self) -> None:
+        """Queue a full refresh to run as soon as the current work (if any) finishes."""
+        self._full_requested = True
+        self._wake.set()
+
+    def submit(self, label: str, job: Callable[[], object]) -> None:
+        """Queue a targeted refresh to run on the refresher thread."""
+        self._jobs.put((label, job))
+        self._wake.set()
+
+    def _seconds_until_due(self) -> float:
+        snapshot = self.store.get()
+        due = 0 if snapshot is None else self.max_age - self.lead - snapshot.age_seconds()
+        if self._retry_at is not None:
+            due = max(due, self._retry_at - time.monotonic())
+        return max(0.0, due)
+
+    def _run_jobs(self):
+        while True:
+            try:
+                label, job = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            self.refreshing = True
+            try:
+                job()
+                logger.info(f"{self.name}: finished {label}")
+            except Exception as e:
+                logger.error(f"{self.name}: {label} failed: {str(e)}")
+            finally:
+                self.refreshing = False
+
+    def _refresh(self, force: bool = False):
+        snapshot = self.store.get()
+        loader = functools.partial(self.loader, force=True) if force else self.loader
+        self.refreshing = True
+        try:
+            self.store.refresh(loader, snapshot.websites if snapshot else None)
+            self.last_error = None
+            self._retry_at = None
+        except Exception as e:
+            logger.error(f"{self.name}: background refresh failed: {str(e)}")
+            self.last_error = str(e)
+            self._retry_at = time.monotonic() + RETRY_SECONDS
+        finally:
+            self.refreshing = False
+
+    def _run(self):
+        if self.store.get() is None:
+            self.store.wait()
+            # The first load also served any refresh asked for while it ran
+            self._full_requested = False
+        while True:
+            if self._full_requested:
+                delay = 0
+            elif self.idle():
+                if not self._paused:
+                    logger.info(f"{self.name}: no sessions for {self.idle_after}s, pausing scheduled refreshes")
+                self._paused = True
+                delay = None  # until a touch, request or job wakes the thread
+            else:
+                delay = self._seconds_until_due()
+            if delay is None or delay > 0:
+                self._wake.wait(delay)
+            self._wake.clear()
+            self._paused = False
+            self._run_jobs()
+            if self._full_requested or (not self.idle() and self._seconds_until_due() == 0):
+                requested, self._full_requested = self._full_requested, False
+                self._refresh(force=requested)
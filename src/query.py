@@ -1,35 +1,106 @@
-def get_analytics_query(suffix):
+import os
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+from google.cloud import bigquery
+
+PROJECT_ID = "certain-catcher-417521"
+# Location of the GA4 export datasets, and of the INFORMATION_SCHEMA views read about them
+REGION = os.environ.get("GA4_BQ_REGION", "US")
+
+# Number of completed daily tables read alongside the intraday table
+WINDOW_DAYS = 7
+# GA4 may still rewrite a daily table for ~72h after it lands; older tables never change
+FINAL_AFTER_DAYS = 3
+# Minutes covered by the realtime panels; older rows can be collapsed to day grain
+REALTIME_MINUTES = 30
+# minutes_past value carried by day-grain rows (same as the historical query)
+DAY_GRAIN_MINUTES = 1440
+
+# Session start truncated to the minute; minutes_past is derived from it when the dashboard renders
+SESSION_MINUTE = "TIMESTAMP_TRUNC(TIMESTAMP_MICROS(sessionFirstTimestamp), MINUTE)"
+NO_SESSION_MINUTE = "CAST(NULL AS TIMESTAMP)"
+
+
+def _dataset(suffix):
+    return f"{PROJECT_ID}.analytics_{suffix}"
+
+
+def final_days(today=None, window_days=WINDOW_DAYS) -> list:
+    """Daily tables in the query window that are old enough to never change."""
+    today = today or datetime.now(timezone.utc).date()
+    return [today - timedelta(days=n) for n in range(FINAL_AFTER_DAYS, window_days + 1)]
+
+
+def open_days(today=None, window_days=WINDOW_DAYS) -> list:
+    """Daily tables in the query window that may still be updated (or not exported yet)."""
+    today = today or datetime.now(timezone.utc).date()
+    return [today - timedelta(days=n) for n in range(1, min(FINAL_AFTER_DAYS, window_days + 1))]
+
+
+def window_dates(today=None, window_days=WINDOW_DAYS) -> list:
+    """Every daily table in the query window, oldest first."""
+    return sorted(final_days(today, window_days) + open_days(today, window_days))
+
+
+def _live_sources(dataset, final_dates=(), after_cached_days=False):
+    return [(f"{dataset}.events_intraday_*", "")] + _daily_sources(dataset, final_dates, after_cached_days)
+
+
+def _daily_sources(dataset, final_dates=(), after_cached_days=False):
+    # Finalized days are named directly; the rest may not exist yet, so they go through the
+    # wildcard. Reading any wildcard keeps the whole job out of BigQuery's results cache
+    where = "\n    WHERE _TABLE_SUFFIX IN UNNEST(@table_suffixes)"
+    if after_cached_days:
+        where += "\n      AND " + _started_in(f"{dataset}.events_*", where)
+    return [(f"{dataset}.events_{day:%Y%m%d}", "") for day in sorted(final_dates)] + [
+        (f"{dataset}.events_*", where)]
+
+
+def _started_in(table, where=""):
+    """Condition keeping only the events of sessions that started within ``table``.
+
+    A session crossing midnight has events in two daily tables; when the days
+    are queried separately, only the day it started in may count it.
+    ga_session_id is the session start in seconds, compared with a second of
+    slack against the table's first event.
+    """
+    return (f"(SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id')"
+            f" >= (SELECT DIV(MIN(event_timestamp), 1000000) - 1 FROM `{table}`{where})")
+
+
+def _sessions_query_v1(dataset, sources, session_minute=SESSION_MINUTE):
+    combined_events = "\n    \n    UNION ALL\n    ".join(f"""
+    SELECT *, traffic_source.source AS session_source
+    FROM `{table}`{where}""" for table, where in sources)
     return f"""
 -- Query for Final Table with 7-day data
-WITH combined_events AS (
-    -- Intraday events (most recent data)
-    SELECT *, traffic_source.source AS session_source
-    FROM `certain-catcher-417521.analytics_{suffix}.events_intraday_*`
-    
-    UNION ALL
-    
-    -- Historical events (prior days)
-    SELECT *, traffic_source.source AS session_source
-    FROM `certain-catcher-417521.analytics_{suffix}.events_*`
-    WHERE _TABLE_SUFFIX BETWEEN 
-        FORMAT_DATE('%Y%m%d', DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)) 
-        AND FORMAT_DATE('%Y%m%d', DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY))
+WITH combined_events AS ({combined_events}
 )
 
 SELECT
   sourceDataSet,
   landingPage,
-  time_since_in_minutes as minutes_past,
-  ifnull(sessionFirstCountry, "(not set)") as country,
-  DATE(TIMESTAMP_MICROS(sessionFirstTimestamp)) as event_date,
+  session_minute,
+  country,
+  event_date,
   session_source,
   COUNT(DISTINCT session_uid) as sessions
 FROM (
+  -- Per-session columns; session_minute may be a constant, which can only be grouped as a column
+  SELECT
+    sourceDataSet,
+    session_uid,
+    landingPage,
+    {session_minute} as session_minute,
+    ifnull(sessionFirstCountry, "(not set)") as country,
+    DATE(TIMESTAMP_MICROS(sessionFirstTimestamp)) as event_date,
+    session_source
+  FROM (
   --Prep Query for Final Table
-  SELECT 
+  SELECT
     sourceDataSet,
     event_timestamp,
-    time_since_in_minutes,
     session_uid,
     eventName,
     landingPage,
@@ -37,19 +108,18 @@ FROM (
     sessionFirstTimestamp,
     session_source
   FROM (
-    SELECT 
+    SELECT
       events.sourceDataset,
       events.session_uid,
       events.event_timestamp,
       events.eventName,
       sessionFirstCountry_tbl.sessionFirstCountry,
       sessionFirstTimestamp_tbl.sessionFirstTimestamp,
-      TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), TIMESTAMP_MICROS(sessionFirstTimestamp_tbl.sessionFirstTimestamp),MINUTE) AS time_since_in_minutes,
       landingPage_tbl.landingPage,
       events.session_source
-    FROM ( 
-      SELECT 
-        'certain-catcher-417521.analytics_{suffix}' AS sourceDataset,
+    FROM (
+      SELECT
+        '{dataset}' AS sourceDataset,
         CONCAT((SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id'),'_',user_pseudo_id) AS session_uid,
         `event_timestamp` AS event_timestamp,
         event_name AS eventName,
@@ -58,182 +128,342 @@ FROM (
     ) events
     INNER JOIN (
       SELECT session_uid,IFNULL(sessionFirstCountry,'(not set)') as sessionFirstCountry FROM (
-      SELECT session_uid,(FIRST_VALUE(`country` IGNORE NULLS) OVER (PARTITION BY session_uid ORDER BY event_timestamp ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)) as sessionFirstCountry FROM ( 
+      SELECT session_uid,(FIRST_VALUE(`country` IGNORE NULLS) OVER (PARTITION BY session_uid ORDER BY event_timestamp ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)) as sessionFirstCountry FROM (
       SELECT event_timestamp, CONCAT((SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id'),'_',user_pseudo_id) AS session_uid,
       geo.country as country FROM combined_events ) GROUP BY session_uid,country,event_timestamp
       ) group by session_uid,sessionFirstCountry
     ) sessionFirstCountry_tbl ON sessionFirstCountry_tbl.session_uid=events.session_uid
     INNER JOIN (
       SELECT session_uid,sessionFirstTimestamp FROM (
-      SELECT session_uid,(FIRST_VALUE(`event_timestamp` IGNORE NULLS) OVER (PARTITION BY session_uid ORDER BY event_timestamp ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)) as sessionFirstTimestamp FROM ( 
+      SELECT session_uid,(FIRST_VALUE(`event_timestamp` IGNORE NULLS) OVER (PARTITION BY session_uid ORDER BY event_timestamp ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)) as sessionFirstTimestamp FROM (
       SELECT event_timestamp, CONCAT((SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id'),'_',user_pseudo_id) AS session_uid
       FROM combined_events ) GROUP BY session_uid,event_timestamp
       ) group by session_uid,sessionFirstTimestamp
     ) sessionFirstTimestamp_tbl ON sessionFirstTimestamp_tbl.session_uid=events.session_uid
     INNER JOIN (
       SELECT session_uid,landingPage FROM (
-      SELECT CONCAT((SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id'),'_',user_pseudo_id) AS session_uid, 
-      (SELECT params.value.string_value from UNNEST (event_params) as params where params.key='page_location') as landingPage, 
+      SELECT CONCAT((SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id'),'_',user_pseudo_id) AS session_uid,
+      (SELECT params.value.string_value from UNNEST (event_params) as params where params.key='page_location') as landingPage,
       event_name,
-      row_number() over (PARTITION BY CONCAT(user_pseudo_id,(SELECT params.value.int_value from UNNEST (event_params) as params where params.key='ga_session_id')) ORDER BY event_timestamp) as sessionRank 
-      FROM combined_events) 
+      row_number() over (PARTITION BY CONCAT(user_pseudo_id,(SELECT params.value.int_value from UNNEST (event_params) as params where params.key='ga_session_id')) ORDER BY event_timestamp) as sessionRank
+      FROM combined_events)
       WHERE sessionRank=1) landingPage_tbl ON landingPage_tbl.session_uid=events.session_uid
-    GROUP BY 
+    GROUP BY
       sourceDataSet,
       session_uid,
       event_timestamp,
       sessionFirstTimestamp,
-      time_since_in_minutes,
       eventName,
       sessionFirstCountry,
       landingPage,
       events.session_source)
-  GROUP BY 
+  GROUP BY
     sourceDataset,
     event_timestamp,
-    time_since_in_minutes,
     session_uid,
     eventName,
     sessionFirstCountry,
     sessionFirstTimestamp,
     landingPage,
     session_source)
-GROUP BY 
+)
+GROUP BY
   sourceDataset,
-  minutes_past,
+  session_minute,
   country,
   landingPage,
   event_date,
   session_source
     """
 
-def get_historical_analytics_query(suffix):
+
+def _events_v2(table, where=""):
     return f"""
-WITH date_spine AS (
-    SELECT date_day
-    FROM UNNEST(GENERATE_DATE_ARRAY(DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY), 
-                                   CURRENT_DATE())) as date_day
-),
-combined_events AS (
-    SELECT *, traffic_source.source AS session_source
-    FROM `certain-catcher-417521.analytics_{suffix}.events_*`
-    WHERE _TABLE_SUFFIX BETWEEN 
-        FORMAT_DATE('%Y%m%d', DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)) 
-        AND FORMAT_DATE('%Y%m%d', DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY))
-),
-historical_data AS (
     SELECT
-      sourceDataSet,
-      landingPage,
-      1440 as minutes_past,
-      ifnull(sessionFirstCountry, "(not set)") as country,
-      DATE(TIMESTAMP_MICROS(sessionFirstTimestamp)) as event_date,
-      session_source,
-      COUNT(DISTINCT session_uid) as sessions
-    FROM (
-      SELECT 
-        sourceDataSet,
-        event_timestamp,
-        1440 as time_since_in_minutes,
-        session_uid,
-        eventName,
-        landingPage,
-        sessionFirstCountry,
-        sessionFirstTimestamp,
-        session_source
-      FROM (
-        SELECT 
-          events.sourceDataset,
-          events.session_uid,
-          events.event_timestamp,
-          events.eventName,
-          sessionFirstCountry_tbl.sessionFirstCountry,
-          sessionFirstTimestamp_tbl.sessionFirstTimestamp,
-          1440 AS time_since_in_minutes,
-          landingPage_tbl.landingPage,
-          events.session_source
-        FROM ( 
-          SELECT 
-            'certain-catcher-417521.analytics_{suffix}' AS sourceDataset,
-            CONCAT((SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id'),'_',user_pseudo_id) AS session_uid,
-            `event_timestamp` AS event_timestamp,
-            event_name AS eventName,
-            session_source
-          FROM combined_events
-        ) events
-        INNER JOIN (
-          SELECT session_uid,IFNULL(sessionFirstCountry,'(not set)') as sessionFirstCountry FROM (
-          SELECT session_uid,(FIRST_VALUE(`country` IGNORE NULLS) OVER (PARTITION BY session_uid ORDER BY event_timestamp ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)) as sessionFirstCountry FROM ( 
-          SELECT event_timestamp, CONCAT((SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id'),'_',user_pseudo_id) AS session_uid,
-          geo.country as country FROM combined_events ) GROUP BY session_uid,country,event_timestamp
-          ) group by session_uid,sessionFirstCountry
-        ) sessionFirstCountry_tbl ON sessionFirstCountry_tbl.session_uid=events.session_uid
-        INNER JOIN (
-          SELECT session_uid,sessionFirstTimestamp FROM (
-          SELECT session_uid,(FIRST_VALUE(`event_timestamp` IGNORE NULLS) OVER (PARTITION BY session_uid ORDER BY event_timestamp ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)) as sessionFirstTimestamp FROM ( 
-          SELECT event_timestamp, CONCAT((SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id'),'_',user_pseudo_id) AS session_uid
-          FROM combined_events ) GROUP BY session_uid,event_timestamp
-          ) group by session_uid,sessionFirstTimestamp
-        ) sessionFirstTimestamp_tbl ON sessionFirstTimestamp_tbl.session_uid=events.session_uid
-        INNER JOIN (
-          SELECT session_uid,landingPage FROM (
-          SELECT CONCAT((SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id'),'_',user_pseudo_id) AS session_uid, 
-          (SELECT params.value.string_value from UNNEST (event_params) as params where params.key='page_location') as landingPage, 
-          event_name,
-          row_number() over (PARTITION BY CONCAT(user_pseudo_id,(SELECT params.value.int_value from UNNEST (event_params) as params where params.key='ga_session_id')) ORDER BY event_timestamp) as sessionRank 
-          FROM combined_events) 
-          WHERE sessionRank=1) landingPage_tbl ON landingPage_tbl.session_uid=events.session_uid
-        GROUP BY 
-          sourceDataSet,
-          session_uid,
-          event_timestamp,
-          sessionFirstTimestamp,
-          time_since_in_minutes,
-          eventName,
-          sessionFirstCountry,
-          landingPage,
-          events.session_source)
-      GROUP BY 
-        sourceDataset,
-        event_timestamp,
-        time_since_in_minutes,
-        session_uid,
-        eventName,
-        sessionFirstCountry,
-        sessionFirstTimestamp,
-        landingPage,
-        session_source)
-    GROUP BY 
-      sourceDataset,
-      minutes_past,
-      country,
-      landingPage,
-      event_date,
-      session_source
+      CONCAT((SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_id'),'_',user_pseudo_id) AS session_uid,
+      event_timestamp,
+      geo.country AS country,
+      (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'page_location') AS page_location,
+      traffic_source.source AS session_source
+    FROM `{table}`{where}"""
+
+
+def _sessions_query_v2(dataset, sources, session_minute=SESSION_MINUTE):
+    events = "\n    UNION ALL".join(_events_v2(table, where) for table, where in sources)
+    return f"""
+-- Single-scan sessions query: only the needed columns are read, once
+WITH events AS ({events}
 ),
-date_based_data AS (
-    SELECT
-      date_spine.date_day as event_date,
-      COALESCE(historical_data.sourceDataSet, 'certain-catcher-417521.analytics_{suffix}') as sourceDataSet,
-      COALESCE(historical_data.landingPage, '') as landingPage,
-      COALESCE(historical_data.minutes_past, 1440) as minutes_past,
-      COALESCE(historical_data.country, 'United States') as country,
-      COALESCE(historical_data.session_source, '') as session_source,
-      COALESCE(historical_data.sessions, 0) as sessions
-    FROM date_spine
-    LEFT JOIN historical_data ON date_spine.date_day = historical_data.event_date
+sessions AS (
+  SELECT
+    session_uid,
+    session_source,
+    FIRST_VALUE(country IGNORE NULLS) OVER session_window AS sessionFirstCountry,
+    FIRST_VALUE(event_timestamp) OVER session_window AS sessionFirstTimestamp,
+    FIRST_VALUE(page_location) OVER session_window AS landingPage
+  FROM events
+  WHERE session_uid IS NOT NULL
+  WINDOW session_window AS (
+    PARTITION BY session_uid ORDER BY event_timestamp
+    ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+)
+-- The dataset is a literal, so it is selected but not grouped; BigQuery can't GROUP BY literals
+SELECT
+  '{dataset}' AS sourceDataSet,
+  landingPage,
+  session_minute,
+  country,
+  event_date,
+  session_source,
+  COUNT(DISTINCT session_uid) AS sessions
+FROM (
+  SELECT
+    session_uid,
+    landingPage,
+    {session_minute} AS session_minute,
+    IFNULL(sessionFirstCountry, '(not set)') AS country,
+    DATE(TIMESTAMP_MICROS(sessionFirstTimestamp)) AS event_date,
+    session_source
+  FROM sessions
 )
+GROUP BY
+  landingPage,
+  session_minute,
+  country,
+  event_date,
+  session_source"""
+
 
-SELECT * FROM date_based_data
+# Selectable query engines: "v1" is the original self-joining query, "v2" the single-scan rewrite
+QUERY_VERSIONS = {
+    "v1": _sessions_query_v1,
+    "v2": _sessions_query_v2,
+}
+
+
+def _historical_padding(query, dataset):
+    """Give every day of the window a row, plus a zero row for today's realtime panels."""
+    return f"""
+WITH date_spine AS (
+    SELECT date_day
+    FROM UNNEST(GENERATE_DATE_ARRAY(@start_date, DATE(@ref_ts))) as date_day
+),
+historical_data AS ({query}
+)
+SELECT
+  date_spine.date_day as event_date,
+  COALESCE(historical_data.sourceDataSet, '{dataset}') as sourceDataSet,
+  COALESCE(historical_data.landingPage, '') as landingPage,
+  historical_data.session_minute as session_minute,
+  COALESCE(historical_data.country, 'United States') as country,
+  COALESCE(historical_data.session_source, '') as session_source,
+  COALESCE(historical_data.sessions, 0) as sessions
+FROM date_spine
+LEFT JOIN historical_data ON date_spine.date_day = historical_data.event_date
 
 UNION ALL
 
 SELECT
-  CURRENT_DATE() as event_date,
-  'certain-catcher-417521.analytics_{suffix}' as sourceDataSet,
+  DATE(@ref_ts) as event_date,
+  '{dataset}' as sourceDataSet,
   '' as landingPage,
-  30 as minutes_past,
+  TIMESTAMP_TRUNC(@ref_ts, MINUTE) as session_minute,
   '' as country,
   '' as session_source,
   0 as sessions
-"""
\ No newline at end of file
+"""
+
+
+def _multi_resolution(query, realtime_minutes=REALTIME_MINUTES):
+    """Keep minute rows inside the realtime window and collapse the rest to one row per day.
+
+    Each session has a single start minute, so summing the per-minute
+    distinct counts gives the exact per-day session count.
+    """
+    return f"""
+SELECT
+  sourceDataSet,
+  landingPage,
+  IF(session_minute >= TIMESTAMP_SUB(@ref_ts, INTERVAL {realtime_minutes} MINUTE),
+     session_minute, NULL) AS session_minute,
+  country,
+  event_date,
+  session_source,
+  SUM(sessions) AS sessions
+FROM ({query}
+)
+-- Ordinals: session_minute is both an input column and an output alias here
+GROUP BY 1, 2, 3, 4, 5, 6"""
+
+
+def get_site_query(suffix, version="v1", historical=False, grain="minute", final_dates=(),
+                   after_cached_days=False):
+    """Render the analytics query for one property using the given engine version.
+
+    The reference time and the daily tables read through the wildcard come
+    from the parameters built by get_query_parameters(); ``final_dates`` (see
+    final_days()) are read as explicitly named tables instead. Leave them out
+    when those days come from elsewhere, e.g. the day cache, and set
+    ``after_cached_days`` so sessions carried over from the last cached day
+    aren't counted twice.
+    ``historical=True`` skips the intraday table, and ``grain="multi"``
+    returns minute rows only for the realtime window and day-grain rows for
+    everything older.
+
+    Every variant reads a wildcard table (the open days, and the intraday
+    table unless ``historical``), so BigQuery never serves it from its results
+    cache: fixed parameters only make identical refreshes render identical
+    jobs, which the shared cache can reuse. Only get_day_query() jobs can be
+    results-cached.
+    """
+    dataset = _dataset(suffix)
+    if historical:
+        query = QUERY_VERSIONS[version](dataset, _daily_sources(dataset, final_dates, after_cached_days),
+                                        NO_SESSION_MINUTE)
+        query = _historical_padding(query, dataset)
+    else:
+        query = QUERY_VERSIONS[version](dataset, _live_sources(dataset, final_dates, after_cached_days))
+    if grain == "multi":
+        query = _multi_resolution(query)
+    return query
+
+
+def get_analytics_query(suffix, version="v1"):
+    return get_site_query(suffix, version)
+
+
+def get_historical_analytics_query(suffix, version="v1"):
+    return get_site_query(suffix, version, historical=True)
+
+
+def get_day_query(suffix, table_date, version="v2"):
+    """Render the day-grain query for a single completed daily table.
+
+    It names the table directly rather than through a wildcard, so it needs no
+    parameters and repeated runs can be answered from BigQuery's results cache.
+    Sessions that started the day before are left to that day's query.
+    """
+    dataset = _dataset(suffix)
+    table = f"{dataset}.events_{table_date:%Y%m%d}"
+    return QUERY_VERSIONS[version](dataset, [(table, "\n    WHERE " + _started_in(table))], NO_SESSION_MINUTE)
+
+
+def get_query_parameters(reference=None, window_days=WINDOW_DAYS, table_dates=None):
+    """Build the parameters shared by every analytics query.
+
+    ``reference`` is truncated to the minute so refreshes within the same
+    minute render identical jobs. ``table_dates`` are the daily tables read
+    through the wildcard; by default the window's open days, the finalized
+    ones being named in the query text.
+    """
+    reference = (reference or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+    today = reference.date()
+    start_date = today - timedelta(days=window_days)
+    if table_dates is None:
+        table_dates = open_days(today, window_days)
+    return [
+        bigquery.ScalarQueryParameter("ref_ts", "TIMESTAMP", reference),
+        bigquery.ScalarQueryParameter("start_date", "DATE", start_date),
+        bigquery.ArrayQueryParameter("table_suffixes", "STRING", [f"{day:%Y%m%d}" for day in table_dates]),
+    ]
+
+
+def get_realtime_query(suffix, minutes=REALTIME_MINUTES):
+    """Render the realtime-lane query: sessions started in the last ``minutes`` minutes.
+
+    Sessions are counted from their session_start events, so only the
+    event_name, event_timestamp and geo.country columns of the intraday table
+    are read (not event_params). Needs only the ``ref_ts`` parameter.
+    """
+    dataset = _dataset(suffix)
+    return f"""
+-- Realtime lane: per-minute session starts from the intraday table only
+SELECT
+  '{dataset}' AS sourceDataSet,
+  TIMESTAMP_TRUNC(TIMESTAMP_MICROS(event_timestamp), MINUTE) AS session_minute,
+  IFNULL(geo.country, '(not set)') AS country,
+  COUNT(*) AS sessions
+FROM `{dataset}.events_intraday_*`
+WHERE event_name = 'session_start'
+  AND event_timestamp >= UNIX_MICROS(TIMESTAMP_SUB(@ref_ts, INTERVAL {minutes} MINUTE))
+-- Not 1: the dataset column is a literal, which BigQuery can't group by
+GROUP BY 2, 3"""
+
+
+def get_multi_property_realtime_query(suffixes, minutes=REALTIME_MINUTES):
+    """Realtime-lane query for several properties in one job, rows tagged with the property suffix."""
+    return "\nUNION ALL\n".join(
+        f"SELECT '{suffix}' AS property, * FROM (\n{get_realtime_query(suffix, minutes)}\n)" for suffix in suffixes)
+
+
+def get_realtime_query_parameters(reference=None):
+    reference = (reference or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+    return [bigquery.ScalarQueryParameter("ref_ts", "TIMESTAMP", reference)]
+
+
+def add_minutes_past(df, now=None):
+    """Copy of ``df`` with minutes_past counted from session_minute back from ``now``.
+
+    Day-grain rows get DAY_GRAIN_MINUTES.
+    """
+    now = pd.Timestamp(now or datetime.now(timezone.utc))
+    session_minute = pd.to_datetime(df['session_minute'], utc=True)
+    minutes = (now - session_minute) // pd.Timedelta(minutes=1)
+    return df.assign(minutes_past=minutes.fillna(DAY_GRAIN_MINUTES).astype(int))
+
+
+def get_intraday_tables_query():
+    """List every GA4 dataset in the project and whether it has an intraday table."""
+    return f"""
+SELECT
+  REGEXP_EXTRACT(table_schema, r'^analytics_(.+)$') AS suffix,
+  LOGICAL_OR(STARTS_WITH(table_name, 'events_intraday_')) AS has_intraday
+FROM `{PROJECT_ID}.region-{REGION}.INFORMATION_SCHEMA.TABLES`
+WHERE STARTS_WITH(table_schema, 'analytics_')
+GROUP BY suffix
+"""
+
+
+# BigQuery caps a query at 1,024k characters and 1,000 referenced tables.
+MAX_QUERY_LENGTH = 1_000_000
+MAX_TABLES_PER_QUERY = 1000
+# Tables a single property can reference: up to two intraday shards plus the daily tables
+TABLES_PER_PROPERTY = WINDOW_DAYS + 2
+# The realtime query only touches the intraday shards
+REALTIME_PROPERTIES_PER_QUERY = MAX_TABLES_PER_QUERY // 2
+
+
+def _property_branch(suffix, historical=False, version="v1", grain="minute", final_dates=()):
+    query = get_site_query(suffix, version, historical, grain, final_dates)
+    return f"SELECT '{suffix}' AS property, * FROM (\n{query}\n)"
+
+
+def get_multi_property_analytics_query(suffixes, historical_suffixes=(), version="v1", grain="minute",
+                                       final_dates=()):
+    """Build one query covering every property in ``suffixes``.
+
+    Each property keeps its own self-contained branch so results match the
+    per-site query exactly; rows are tagged with the property suffix.
+    Properties listed in ``historical_suffixes`` use the historical query.
+    """
+    branches = [_property_branch(suffix, suffix in historical_suffixes, version, grain, final_dates)
+                for suffix in suffixes]
+    return "\nUNION ALL\n".join(branches)
+
+
+def batch_suffixes(suffixes, historical_suffixes=(), version="v1", grain="minute", final_dates=(),
+                   max_length=MAX_QUERY_LENGTH, max_tables=MAX_TABLES_PER_QUERY):
+    """Split ``suffixes`` into chunks whose combined query stays under BigQuery's limits."""
+    max_properties = max(1, max_tables // TABLES_PER_PROPERTY)
+    batches, batch, length = [], [], 0
+    for suffix in suffixes:
+        branch_length = len(_property_branch(suffix, suffix in historical_suffixes, version, grain,
+                                             final_dates)) + len("\nUNION ALL\n")
+        if batch and (len(batch) >= max_properties or length + branch_length > max_length):
+            batches.append(batch)
+            batch, length = [], 0
+        batch.append(suffix)
+        length += branch_length
+    if batch:
+        batches.append(batch)
+    return batches
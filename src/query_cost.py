@@ -1,19 +1,43 @@
-def get_bq_cost_usage():
-    return '''
-    WITH gigs_per_day AS (
-        SELECT
-            DATE(creation_time) as date,
-            SUM(total_bytes_billed/1000000000) AS gigs_billed
-        FROM `region-US`.INFORMATION_SCHEMA.JOBS
-        WHERE DATE(creation_time) BETWEEN DATE_TRUNC(CURRENT_DATE(), MONTH) AND CURRENT_DATE()
-        GROUP BY 1
-    )
-    SELECT 
-        date,
-        gigs_billed,
-        SUM(gigs_billed) OVER (
-            PARTITION BY EXTRACT(MONTH FROM date), EXTRACT(YEAR FROM date)
-            ORDER BY date ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-        ) AS month_to_date_gigs_billed_sum
-    FROM gigs_per_day
+import re
+from datetime import datetime
+
+from google.cloud import bigquery
+
+from src.query import REGION
+
+# Value of the "app" label on every job the dashboard runs
+APP_LABEL = "ga4-dashboard"
+
+
+def job_label_value(value) -> str:
+    """Coerce text into a valid BigQuery label value (lowercase, digits, _ and -, max 63 chars)."""
+    return re.sub(r'[^a-z0-9_-]', '_', str(value).lower())[:63]
+
+
+def get_job_cost_query():
+    """Billed bytes per day, site, query kind and version for jobs created in (@since, @until].
+
+    Only finished jobs are counted, so @until should trail the current time by
+    more than the longest job. Jobs without the app's labels come back with
+    NULL site, kind and version. Only jobs run in REGION are listed.
+    """
+    return f'''
+    SELECT
+        DATE(creation_time) AS date,
+        (SELECT value FROM UNNEST(labels) WHERE key = 'site') AS site,
+        (SELECT value FROM UNNEST(labels) WHERE key = 'kind') AS kind,
+        (SELECT value FROM UNNEST(labels) WHERE key = 'version') AS version,
+        COUNT(*) AS jobs,
+        SUM(IFNULL(total_bytes_billed, 0)) AS bytes_billed
+    FROM `region-{REGION}`.INFORMATION_SCHEMA.JOBS
+    WHERE creation_time > @since AND creation_time <= @until
+        AND state = 'DONE'
+    GROUP BY 1, 2, 3, 4
     '''
+
+
+def get_job_cost_parameters(since: datetime, until: datetime):
+    return [
+        bigquery.ScalarQueryParameter("since", "TIMESTAMP", since),
+        bigquery.ScalarQueryParameter("until", "TIMESTAMP", until),
+    ]
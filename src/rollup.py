@@ -0,0 +1,161 @@
+"""
+rollup.py - One-pass aggregation of the analytics frame for the dashboard
+"""
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+from typing import Optional
+
+import pandas as pd
+
+from src.query import REALTIME_MINUTES, add_minutes_past
+
+TOP_COUNTRIES = 3
+TOP_LANDING_PAGES = 10
+TOP_LANDING_PAGES_ALL = 20
+TOP_SOURCES = 3
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """Every aggregate the dashboard panels read, built once per data version.
+
+    Per-site frames are indexed by website so a panel can pull its rows
+    with :meth:`site` instead of filtering the raw frame.
+    """
+    today: pd.Timestamp
+    websites: list              # sites with data in the last 7 days, busiest first
+    website_order: list         # all sites with data, busiest first
+    daily: pd.DataFrame         # website -> event_date, sessions
+    realtime: pd.DataFrame      # website -> minutes_past, sessions (realtime window only)
+    countries: pd.DataFrame     # website -> country, sessions (top countries, realtime window)
+    all_countries: pd.DataFrame  # country, sessions (top countries across sites)
+    landing_pages: pd.DataFrame  # website -> landingPage, sessions (top pages yesterday)
+    all_landing_pages: pd.DataFrame  # landingPage, sessions (top pages yesterday across sites)
+    sources: pd.DataFrame       # website -> session_source, sessions (top sources yesterday)
+    source_trend: pd.DataFrame  # website -> event_date, session_source, sessions (top sources, last 7 days)
+    site_summary: pd.DataFrame  # website -> yesterday, today, recent, week, total, monetization, account
+    account_summary: pd.DataFrame  # account -> yesterday, today, recent (monetized sites only)
+
+    @staticmethod
+    def site(frame: pd.DataFrame, website: str) -> pd.DataFrame:
+        """Rows of a website-indexed frame for one site (empty if it has none)."""
+        if website in frame.index:
+            return frame.loc[[website]].reset_index(drop=True)
+        return frame.iloc[0:0].reset_index(drop=True)
+
+
+def _top_n(frame: pd.DataFrame, by, n: int) -> pd.DataFrame:
+    return (frame.sort_values('sessions', ascending=False, kind='stable')
+            .groupby(by, observed=True, sort=False, dropna=False)
+            .head(n))
+
+
+def _by_website(frame: pd.DataFrame) -> pd.DataFrame:
+    # Plain object columns: the rollup is small and plotting categoricals drags in unused values
+    frame = frame.astype({column: object for column in frame.columns
+                          if isinstance(frame[column].dtype, pd.CategoricalDtype)})
+    return frame.set_index('website').sort_index(kind='stable')
+
+
+def _site_sums(frame: pd.DataFrame) -> pd.Series:
+    sums = frame.groupby('website', observed=True)['sessions'].sum()
+    return sums.set_axis(sums.index.astype(str))
+
+
+def _recent_rows(frame: pd.DataFrame, now: Optional[datetime]) -> pd.DataFrame:
+    """Rows in the realtime window, with minutes_past counted back from ``now``."""
+    recent_df = add_minutes_past(frame[frame['session_minute'].notna()], now)
+    return recent_df[recent_df['minutes_past'] <= REALTIME_MINUTES]
+
+
+def _realtime_sums(recent_df: pd.DataFrame) -> tuple:
+    realtime = recent_df.groupby(['website', 'minutes_past'], observed=True)['sessions'].sum().reset_index()
+    country_sums = recent_df.groupby(['website', 'country'], observed=True)['sessions'].sum().reset_index()
+    all_countries = (country_sums.groupby('country', observed=True)['sessions'].sum()
+                     .nlargest(TOP_COUNTRIES).reset_index().astype({'country': object}))
+    return realtime, country_sums, all_countries
+
+
+def _account_summary(site_summary: pd.DataFrame) -> pd.DataFrame:
+    return (site_summary[site_summary['monetization'] == 'ACTIVE']
+            .groupby('account')[['yesterday', 'today', 'recent']].sum()
+            .sort_values('yesterday', ascending=False))
+
+
+def with_realtime(rollup: Rollup, realtime_df: pd.DataFrame, now: Optional[datetime] = None) -> Rollup:
+    """Swap the realtime aggregates of ``rollup`` for ones built from the realtime lane.
+
+    ``realtime_df`` needs website, session_minute, country and sessions; the
+    realtime window ends at ``now`` (default: the current time). The history
+    aggregates are reused as they are.
+    """
+    realtime, country_sums, all_countries = _realtime_sums(_recent_rows(realtime_df, now))
+    recent = _site_sums(realtime).reindex(rollup.site_summary.index, fill_value=0).astype(int)
+    site_summary = rollup.site_summary.assign(recent=recent)
+    return replace(
+        rollup,
+        realtime=_by_website(realtime),
+        countries=_by_website(_top_n(country_sums, 'website', TOP_COUNTRIES)),
+        all_countries=all_countries,
+        site_summary=site_summary,
+        account_summary=_account_summary(site_summary),
+    )
+
+
+def build_rollup(df: pd.DataFrame, config: dict, today: Optional[date] = None,
+                 now: Optional[datetime] = None) -> Rollup:
+    """Aggregate the analytics frame into the compact rollup behind every panel.
+
+    The realtime aggregates cover the REALTIME_MINUTES before ``now`` (default:
+    the current time); :func:`with_realtime` moves them on later.
+    """
+    today = pd.Timestamp(today or pd.Timestamp.now().date())
+    yesterday = today - pd.Timedelta(days=1)
+    event_date = df['event_date']
+
+    daily = df.groupby(['website', 'event_date'], observed=True)['sessions'].sum().reset_index()
+
+    realtime, country_sums, all_countries = _realtime_sums(_recent_rows(df, now))
+
+    yesterday_df = df[event_date == yesterday]
+    page_sums = (yesterday_df.groupby(['website', 'landingPage'], observed=True, dropna=False)['sessions']
+                 .sum().reset_index())
+    all_landing_pages = (page_sums.groupby('landingPage', dropna=False)['sessions'].sum()
+                         .sort_values(ascending=False).head(TOP_LANDING_PAGES_ALL).reset_index())
+    source_sums = yesterday_df.groupby(['website', 'session_source'], observed=True)['sessions'].sum().reset_index()
+
+    week_df = df[event_date >= today - pd.Timedelta(days=6)]
+    source_daily = (week_df.groupby(['website', 'session_source', 'event_date'], observed=True)['sessions']
+                    .sum().reset_index())
+    source_totals = source_daily.groupby(['website', 'session_source'], observed=True)['sessions'].sum().reset_index()
+    top_sources = _top_n(source_totals, 'website', TOP_SOURCES)[['website', 'session_source']]
+    source_trend = source_daily.merge(top_sources, on=['website', 'session_source'])
+
+    week = _site_sums(daily[daily['event_date'] >= today - pd.Timedelta(days=7)])
+    site_summary = pd.DataFrame({
+        'yesterday': _site_sums(daily[daily['event_date'] == yesterday]),
+        'today': _site_sums(daily[daily['event_date'] == today]),
+        'recent': _site_sums(realtime),
+        'week': week,
+        'total': _site_sums(daily),
+    }).fillna(0).astype(int)
+    site_info = (pd.DataFrame(config['websites'], columns=['website', 'monetization', 'account'])
+                 .drop_duplicates('website').set_index('website'))
+    site_summary = site_summary.join(site_info, how='left')
+    account_summary = _account_summary(site_summary)
+
+    return Rollup(
+        today=today,
+        websites=week.sort_values(ascending=False).index.tolist(),
+        website_order=site_summary['total'].sort_values(ascending=False).index.tolist(),
+        daily=_by_website(daily),
+        realtime=_by_website(realtime),
+        countries=_by_website(_top_n(country_sums, 'website', TOP_COUNTRIES)),
+        all_countries=all_countries,
+        landing_pages=_by_website(_top_n(page_sums, 'website', TOP_LANDING_PAGES)),
+        all_landing_pages=all_landing_pages,
+        sources=_by_website(_top_n(source_sums, 'website', TOP_SOURCES)),
+        source_trend=_by_website(source_trend),
+        site_summary=site_summary,
+        account_summary=account_summary,
+    )
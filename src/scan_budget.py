@@ -0,0 +1,142 @@
+"""
+scan_budget.py - Keep each refresh and each day of BigQuery queries within a bytes-scanned budget
+"""
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+from src.atomic_write import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # Windows: the ledger is then only locked within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Bytes billed per UTC day, persisted so restarts don't reset the count
+LEDGER_PATH = Path(os.environ.get("GA4_SCAN_LEDGER", ".cache/scan_budget.json"))
+# BigQuery bills at least this much for every table a query references
+MIN_BILLED_BYTES = 10 * 1024 ** 2
+
+_ledger_lock = threading.Lock()
+
+
+class ScanBudgetExceeded(RuntimeError):
+    """Raised instead of running a query today's scan budget can't cover."""
+
+# What a refresh does with a site, cheapest last
+RUN = "run"              # full query
+DOWNGRADE = "downgrade"  # history-only query (skips the intraday table)
+DEFER = "defer"          # keep the site's previous rows until a later refresh
+SKIP = "skip"            # no previous rows to keep, so the site is left out
+ACTION_LABELS = {DOWNGRADE: "history only", DEFER: "deferred", SKIP: "skipped"}
+
+
+@dataclass(frozen=True)
+class SiteScan:
+    """Dry-run estimate for one site's history query and what the budget decided."""
+    bytes: Optional[int]  # None when the dry run failed
+    action: str
+
+    def label(self) -> str:
+        text = "?" if self.bytes is None else format_bytes(self.bytes)
+        return f"{text} ({ACTION_LABELS[self.action]})" if self.action in ACTION_LABELS else text
+
+
+def format_bytes(nbytes: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if nbytes < 1000:
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1000
+    return f"{nbytes:.1f} TB"
+
+
+def _today() -> str:
+    return f"{datetime.now(timezone.utc):%Y-%m-%d}"
+
+
+def spent_today(path: Path = LEDGER_PATH) -> int:
+    """Bytes billed so far today (UTC)."""
+    try:
+        ledger = json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return 0
+    return ledger.get("bytes", 0) if ledger.get("date") == _today() else 0
+
+
+@contextmanager
+def _locked(path: Path):
+    # Threads of this process and other processes (replicas, build_snapshot.py) share the ledger
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _ledger_lock, open(path.with_suffix(".lock"), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def record_spent(nbytes: int, path: Path = LEDGER_PATH) -> None:
+    """Add billed bytes to today's total, starting a new total on a new UTC day."""
+    if not nbytes:
+        return
+    with _locked(path):
+        total = spent_today(path) + nbytes
+        with atomic_write(path, "w") as tmp:
+            json.dump({"date": _today(), "bytes": total}, tmp)
+
+
+def remaining_today(daily_limit: Optional[int], path: Path = LEDGER_PATH) -> Optional[int]:
+    """Bytes ``daily_limit`` still allows today, or None without a limit."""
+    return None if daily_limit is None else max(0, daily_limit - spent_today(path))
+
+
+def plan_scans(estimates: dict, estimate_downgraded: Callable[[list], dict], has_previous: set,
+               refresh_limit: Optional[int] = None, daily_limit: Optional[int] = None,
+               ledger: Path = LEDGER_PATH) -> dict:
+    """Decide per site whether to run, downgrade, defer or skip its history query.
+
+    ``estimates`` maps each site, in priority order, to its full query's bytes
+    (None if unknown; such sites always run). Sites are admitted in order
+    while they fit the smaller of ``refresh_limit`` and what ``daily_limit``
+    leaves today. ``estimate_downgraded`` is called once with the sites that
+    didn't fit and returns their history-only estimates; those that still
+    don't fit are deferred when in ``has_previous``, otherwise skipped.
+    """
+    limits = [limit for limit in (refresh_limit, remaining_today(daily_limit, ledger)) if limit is not None]
+    remaining = max(0, min(limits)) if limits else None
+
+    plan, over = {}, []
+    for website, nbytes in estimates.items():
+        if remaining is None or nbytes is None or nbytes <= remaining:
+            plan[website] = SiteScan(nbytes, RUN)
+            if remaining is not None and nbytes is not None:
+                remaining -= nbytes
+        else:
+            over.append(website)
+
+    downgraded = estimate_downgraded(over) if over else {}
+    for website in over:
+        nbytes = downgraded.get(website)
+        if nbytes is not None and nbytes <= remaining:
+            plan[website] = SiteScan(nbytes, DOWNGRADE)
+            remaining -= nbytes
+        else:
+            plan[website] = SiteScan(estimates[website], DEFER if website in has_previous else SKIP)
+    if over:
+        logger.warning(f"Scan budget: {len(over)} sites over budget "
+                       f"({', '.join(f'{w} {plan[w].action}' for w in over)})")
+    return plan
+
+
+def admitted_bytes(plan: dict) -> int:
+    return sum(scan.bytes or 0 for scan in plan.values() if scan.action in (RUN, DOWNGRADE))
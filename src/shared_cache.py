@@ -0,0 +1,201 @@
+"""
+shared_cache.py - Cross-process result cache shared by every replica of the app
+"""
+import abc
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# "off" disables the shared cache; any other value is the SQLite file replicas share
+CACHE_PATH = os.environ.get("GA4_SHARED_CACHE", ".cache/shared_cache.sqlite")
+MAX_CACHE_BYTES = 1024 ** 3
+# A replica holding a refresh lock loses it after this long (e.g. if it crashed)
+LOCK_LEASE_SECONDS = 600
+# How long a replica waits for another one to finish refreshing a key
+LOCK_WAIT_SECONDS = 300
+POLL_SECONDS = 0.5
+
+
+def cache_key(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def frame_to_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def frame_from_bytes(data: bytes) -> pd.DataFrame:
+    return pd.read_parquet(io.BytesIO(data))
+
+
+class CacheBackend(abc.ABC):
+    """Interface for shared cache backends; subclasses store bytes and hold per-key locks."""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        ...
+
+    @abc.abstractmethod
+    def try_lock(self, key: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def is_locked(self, key: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def unlock(self, key: str) -> None:
+        ...
+
+    def wait_for(self, key: str, timeout: float = LOCK_WAIT_SECONDS) -> Optional[bytes]:
+        """Wait for the replica holding ``key``'s lock to store a value; None if it gave up."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            value = self.get(key)
+            if value is not None:
+                return value
+            if not self.is_locked(key):
+                return self.get(key)
+            time.sleep(POLL_SECONDS)
+        return None
+
+    def get_or_compute(self, key: str, compute: Callable[[], bytes], ttl: float) -> bytes:
+        """Return the cached value for ``key``, letting only one replica compute a missing one."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        if not self.try_lock(key):
+            value = self.wait_for(key)
+            if value is not None:
+                return value
+            logger.warning(f"Gave up waiting for shared cache key {key[:12]}, computing it here")
+            value = compute()
+            self.set(key, value, ttl)
+            return value
+        try:
+            # Another replica may have finished between the miss and the lock
+            value = self.get(key)
+            if value is None:
+                value = compute()
+                self.set(key, value, ttl)
+            return value
+        finally:
+            self.unlock(key)
+
+
+class SQLiteCache(CacheBackend):
+    """Shared cache in one SQLite file, for replicas on the same host or a shared volume.
+
+    Entries expire after their TTL; past ``max_bytes`` the least recently read
+    entries are evicted. Locks are leases so a crashed holder can't block a key.
+    """
+
+    def __init__(self, path, max_bytes: int = MAX_CACHE_BYTES, lease: float = LOCK_LEASE_SECONDS):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,
+            expires_at REAL NOT NULL, accessed_at REAL NOT NULL)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS locks (
+            key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)""")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, sqlite3.Binary(value), len(value), now + ttl, now))
+        self.evict()
+
+    def try_lock(self, key: str) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires_at <= ?", (key, now))
+            acquired = conn.execute("INSERT OR IGNORE INTO locks (key, owner, expires_at) VALUES (?, ?, ?)",
+                                    (key, self.owner, now + self.lease)).rowcount == 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return acquired
+
+    def is_locked(self, key: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM locks WHERE key = ? AND expires_at > ?",
+                                    (key, time.time())).fetchone() is not None
+
+    def unlock(self, key: str) -> None:
+        self._conn().execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def evict(self) -> None:
+        """Drop expired entries, then the least recently read ones until under ``max_bytes``."""
+        conn = self._conn()
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+_backend: Optional[CacheBackend] = None
+_backend_lock = threading.Lock()
+
+
+def set_shared_cache(backend: Optional[CacheBackend]) -> None:
+    """Plug in another backend (or None to disable sharing)."""
+    global _backend
+    _backend = backend
+
+
+def get_shared_cache() -> Optional[CacheBackend]:
+    """The process-wide backend; a SQLiteCache at CACHE_PATH unless replaced or disabled."""
+    global _backend
+    if _backend is None and CACHE_PATH.lower() != "off":
+        with _backend_lock:
+            if _backend is None:
+                _backend = SQLiteCache(CACHE_PATH)
+    return _backend
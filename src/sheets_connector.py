@@ -1,41 +1,127 @@
 import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
 import streamlit as st
 import gspread
 from google.oauth2 import service_account
 
+from src.atomic_write import atomic_write
+from src.shared_cache import get_shared_cache, cache_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds the parsed config is shared with other replicas (0 disables sharing)
+SHARED_CACHE_TTL = 300
+# Last good config, served when the sheet is unchanged, slow or unreachable
+SAVED_CONFIG_PATH = Path(os.environ.get("GA4_SAVED_CONFIG", ".cache/sheet_config.json"))
+# A saved config checked this recently is served without asking Drive whether the sheet changed
+CHECK_INTERVAL_SECONDS = 60
+# Seconds before a Sheets/Drive call gives up and the saved config is used
+SHEETS_TIMEOUT = 10
+# Columns A (number) to H (suffix)
+CONFIG_RANGE = "A:H"
+CONFIG_COLUMNS = 8
+
+_client = None
+_spreadsheets = {}
+_client_lock = threading.Lock()
+
 
 def get_config_from_sheet(sheet_id: str = "1Ud0Jw6JtSs9yBcxWnEJwlBccbDrhNK-zMsg_kX7MQBY",
-                          worksheet_name: str = "Websites"):
-
-    # Setup credentials from Streamlit secrets
-    credentials = service_account.Credentials.from_service_account_info(
-        st.secrets["gcp_service_account"]
-    )
-
-    # Setup client
-    scope = ["https://spreadsheets.google.com/feeds",
-             "https://www.googleapis.com/auth/drive"]
-    scoped_credentials = credentials.with_scopes(scope)
-    client = gspread.authorize(scoped_credentials)
-
-    # Get data from sheet
-    sheet = client.open_by_key(sheet_id)
-    worksheet = sheet.worksheet(worksheet_name)
-    all_values = worksheet.get_all_values()    # Map to config format and filter
+                          worksheet_name: str = "Websites", shared_ttl: float = SHARED_CACHE_TTL):
+    cache = get_shared_cache() if shared_ttl else None
+    if cache is None:
+        return _read_config(sheet_id, worksheet_name)
+    data = cache.get_or_compute(
+        cache_key("sheet", sheet_id, worksheet_name),
+        lambda: json.dumps(_read_config(sheet_id, worksheet_name)).encode("utf-8"), shared_ttl)
+    return json.loads(data)
+
+
+def _read_config(sheet_id: str, worksheet_name: str) -> dict:
+    """Download columns A:H only when the sheet changed since the saved config; fall back to it on errors."""
+    saved = _load_saved(sheet_id, worksheet_name)
+    if saved is not None:
+        age = (datetime.now(timezone.utc) - datetime.fromisoformat(saved["checked_at"])).total_seconds()
+        if age < CHECK_INTERVAL_SECONDS:
+            return saved["config"]
+    try:
+        spreadsheet = _get_spreadsheet(sheet_id)
+        modified_time = spreadsheet.client.get_file_drive_metadata(sheet_id)["modifiedTime"]
+        if saved is not None and saved["modified_time"] == modified_time:
+            config = saved["config"]
+        else:
+            rows = spreadsheet.values_get(f"'{worksheet_name}'!{CONFIG_RANGE}").get("values", [])
+            config = _parse_rows(rows)
+            logger.info(f"Loaded {len(config['websites'])} live websites from the sheet (modified {modified_time})")
+        _save(sheet_id, worksheet_name, modified_time, config)
+        return config
+    except Exception as e:
+        if saved is None:
+            raise
+        logger.warning(f"Could not read the config sheet, using the saved config: {str(e)}")
+        return saved["config"]
+
+
+def _get_spreadsheet(sheet_id: str) -> gspread.Spreadsheet:
+    """Authorize once per process and open each spreadsheet once."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Setup credentials from Streamlit secrets
+            credentials = service_account.Credentials.from_service_account_info(
+                st.secrets["gcp_service_account"]
+            )
+            scope = ["https://spreadsheets.google.com/feeds",
+                     "https://www.googleapis.com/auth/drive"]
+            _client = gspread.authorize(credentials.with_scopes(scope))
+            _client.set_timeout(SHEETS_TIMEOUT)
+        if sheet_id not in _spreadsheets:
+            _spreadsheets[sheet_id] = _client.open_by_key(sheet_id)
+        return _spreadsheets[sheet_id]
+
+
+def _parse_rows(rows) -> dict:
+    # Map to config format and filter
     websites = []
-    for row in all_values[1:]:  # Skip header
+    for row in rows[1:]:  # Skip header
+        row = row + [""] * (CONFIG_COLUMNS - len(row))  # Trailing empty cells aren't returned
         if row[0]:  # Only process rows with number
             website = {
-                "number": int(row[0]) if row[0].isdigit() else row[0],# Column A
-                "website": row[1] if len(row) > 1 else "",  # Column B
-                "status": row[4].strip() if len(row) > 4 else "",  # Column E
-                "monetization": row[5].strip() if len(row) > 5 else "",  # Column F
-                "account": row[6].strip() if len(row) > 1 else "",  # Column G
-                "suffix": row[7] if len(row) > 8 else ""  # Column H
+                "number": int(row[0]) if row[0].isdigit() else row[0],  # Column A
+                "website": row[1],  # Column B
+                "status": row[4].strip(),  # Column E
+                "monetization": row[5].strip(),  # Column F
+                "account": row[6].strip(),  # Column G
+                "suffix": row[7]  # Column H
             }
             # Filter: suffix not blank AND status = "LIVE"
-            if (website.get('suffix') and website.get('suffix').strip() != ''
-                    and website.get('status', '').strip().upper() == 'LIVE'):
+            if website['suffix'].strip() != '' and website['status'].upper() == 'LIVE':
                 websites.append(website)
+    return {"websites": websites}
+
+
+def _load_saved(sheet_id: str, worksheet_name: str):
+    try:
+        saved = json.loads(SAVED_CONFIG_PATH.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if saved.get("sheet_id") != sheet_id or saved.get("worksheet") != worksheet_name:
+        return None
+    return saved
+
 
-    return {"websites": websites}
\ No newline at end of file
+def _save(sheet_id: str, worksheet_name: str, modified_time: str, config: dict) -> None:
+    # Several processes may save the config at once
+    with atomic_write(SAVED_CONFIG_PATH, "w") as tmp:
+        json.dump({
+            "sheet_id": sheet_id,
+            "worksheet": worksheet_name,
+            "modified_time": modified_time,
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "config": config,
+        }, tmp)
@@ -0,0 +1,131 @@
+"""
+snapshot_file.py - Versioned on-disk dashboard snapshots shared between build_snapshot.py and the app
+"""
+import json
+import logging
+import os
+import shutil
+from dataclasses import fields
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+from src.data_store import DataSnapshot
+from src.rollup import Rollup
+from src.scan_budget import SiteScan
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = Path(os.environ.get("GA4_SNAPSHOT_DIR", ".cache/snapshots"))
+# Older versions are kept briefly so a reader that just picked one up can still open it
+KEEP_VERSIONS = 3
+LATEST_FILE = "LATEST"
+# Bumped whenever the stored layout changes, so old snapshots are never read
+SNAPSHOT_FORMAT = 2
+
+
+def _write_frame(df: pd.DataFrame, path: Path) -> None:
+    # Uncompressed Arrow IPC so readers can memory-map the file instead of decoding it
+    feather.write_feather(pa.Table.from_pandas(df), path, compression="uncompressed")
+
+
+def _read_frame(path: Path) -> pd.DataFrame:
+    # split_blocks keeps columns that need no conversion backed by the mapped file
+    return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+
+
+def write_snapshot(analytics: pd.DataFrame, cost: Optional[pd.DataFrame], config: dict,
+                   rollup: Optional[Rollup] = None, fetched_at: Optional[datetime] = None,
+                   directory: Path = SNAPSHOT_DIR, keep: int = KEEP_VERSIONS,
+                   site_fetched_at: Optional[dict] = None, site_scan: Optional[dict] = None) -> str:
+    """Write a snapshot version, point LATEST at it and prune old versions; returns the version.
+
+    ``site_fetched_at`` maps websites whose rows are older than ``fetched_at``
+    (e.g. carried over from the previous snapshot) to when they were fetched.
+    ``site_scan`` maps websites to the SiteScan the scan budget planned them with.
+    """
+    now = datetime.now(timezone.utc)
+    fetched_at = fetched_at or now
+    # Write time, not fetch time, so versions sort in the order LATEST moved
+    version = f"{now:%Y%m%d%H%M%S%f}"
+    directory = Path(directory)
+    tmp_dir = directory / f".{version}.tmp"
+    tmp_dir.mkdir(parents=True)
+
+    _write_frame(analytics, tmp_dir / "analytics.arrow")
+    if cost is not None:
+        _write_frame(cost, tmp_dir / "cost.arrow")
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "fetched_at": fetched_at.isoformat(),
+        "config": config,
+        "rows": len(analytics),
+        "has_cost": cost is not None,
+        "site_fetched_at": {str(website): (site_fetched_at or {}).get(str(website), fetched_at).isoformat()
+                            for website in analytics['website'].unique()},
+        "site_scan": {website: {"bytes": scan.bytes, "action": scan.action}
+                      for website, scan in (site_scan or {}).items()},
+    }
+    if rollup is not None:
+        (tmp_dir / "rollup").mkdir()
+        for field in fields(Rollup):
+            value = getattr(rollup, field.name)
+            if isinstance(value, pd.DataFrame):
+                _write_frame(value, tmp_dir / "rollup" / f"{field.name}.arrow")
+        meta["rollup"] = {"today": rollup.today.isoformat(), "websites": rollup.websites,
+                          "website_order": rollup.website_order}
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=2))
+
+    os.replace(tmp_dir, directory / version)
+    tmp_latest = directory / f".{LATEST_FILE}.tmp"
+    tmp_latest.write_text(version)
+    os.replace(tmp_latest, directory / LATEST_FILE)
+    logger.info(f"Wrote snapshot {version} ({len(analytics)} rows) to {directory}")
+    _prune(directory, keep)
+    return version
+
+
+def _prune(directory: Path, keep: int) -> None:
+    versions = sorted(path for path in directory.iterdir() if path.is_dir() and not path.name.startswith("."))
+    for path in versions[:-keep]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def latest_version(directory: Path = SNAPSHOT_DIR) -> Optional[str]:
+    """The version LATEST points at, or None if no snapshot was written yet."""
+    try:
+        return (Path(directory) / LATEST_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _read_rollup(path: Path, meta: dict) -> Rollup:
+    frames = {field.name: _read_frame(path / f"{field.name}.arrow")
+              for field in fields(Rollup) if (path / f"{field.name}.arrow").exists()}
+    return Rollup(today=pd.Timestamp(meta["today"]), websites=meta["websites"],
+                  website_order=meta["website_order"], **frames)
+
+
+def read_snapshot(version: str, directory: Path = SNAPSHOT_DIR) -> DataSnapshot:
+    """Open one snapshot version written by :func:`write_snapshot`."""
+    path = Path(directory) / version
+    meta = json.loads((path / "meta.json").read_text())
+    if meta["format"] != SNAPSHOT_FORMAT:
+        raise ValueError(f"Snapshot {version} has format {meta['format']}, expected {SNAPSHOT_FORMAT}")
+    snapshot = DataSnapshot(
+        version=version,
+        fetched_at=datetime.fromisoformat(meta["fetched_at"]),
+        analytics=_read_frame(path / "analytics.arrow"),
+        cost=_read_frame(path / "cost.arrow") if meta["has_cost"] else None,
+        config=meta["config"],
+        site_fetched_at={website: datetime.fromisoformat(at) for website, at in meta["site_fetched_at"].items()},
+        site_scan={website: SiteScan(**scan) for website, scan in meta.get("site_scan", {}).items()},
+        rollup=_read_rollup(path / "rollup", meta["rollup"]) if "rollup" in meta else None,
+    )
+    logger.info(f"Read snapshot {version} ({meta['rows']} rows)")
+    return snapshot
@@ -0,0 +1,91 @@
+"""
+synthetic.py - Realistic GA4 result frames for offline benchmarks, no BigQuery needed
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.query import REALTIME_MINUTES, WINDOW_DAYS
+
+# Share of rows that fall in the realtime window and carry a session_minute
+REALTIME_SHARE = 0.3
+# Skew of countries, landing pages and sources: a few values take most sessions
+ZIPF_EXPONENT = 1.2
+ACCOUNTS = ['Anas', 'Achraf', 'Other']
+COST_KINDS = ['history', 'day', 'realtime', 'metadata']
+
+
+def _zipf_weights(n: int) -> np.ndarray:
+    weights = 1 / np.arange(1, n + 1) ** ZIPF_EXPONENT
+    return weights / weights.sum()
+
+
+def _categorical(rng, values: list, n: int) -> pd.Categorical:
+    return pd.Categorical.from_codes(rng.choice(len(values), n, p=_zipf_weights(len(values))), values)
+
+
+def synthetic_config(sites: int) -> dict:
+    """A sheet config with ``sites`` live sites, every other one monetized."""
+    return {"websites": [
+        {"number": i + 1, "website": f"site{i:03d}.example", "status": "LIVE",
+         "monetization": "ACTIVE" if i % 2 == 0 else "", "account": ACCOUNTS[i % len(ACCOUNTS)],
+         "suffix": f"{100000000 + i}"}
+        for i in range(sites)
+    ]}
+
+
+def synthetic_analytics(sites: int = 10, rows_per_site: int = 1000, countries: int = 60,
+                        landing_pages: int = 500, sources: int = 30, days: int = WINDOW_DAYS + 1,
+                        realtime_share: float = REALTIME_SHARE, seed: int = 0,
+                        now: Optional[datetime] = None) -> tuple:
+    """Analytics rows in the schema ``fetch_analytics_df`` returns, and the matching config.
+
+    Columns and dtypes follow the downloaded frames: categorical website,
+    country, session_source and sourceDataSet, object landingPage (with some
+    NULLs), int32 sessions and UTC session_minute (NaT on day-grain rows).
+    """
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp(now or datetime.now(timezone.utc)).floor('min')
+    config = synthetic_config(sites)
+    n = sites * rows_per_site
+    site_codes = np.repeat(np.arange(sites), rows_per_site)
+
+    recent = rng.random(n) < realtime_share
+    minutes_ago = rng.integers(0, REALTIME_MINUTES + 1, n)
+    session_minute = pd.Series(now - pd.to_timedelta(np.where(recent, minutes_ago, 0), unit='min'))
+    session_minute[~recent] = pd.NaT
+    days_ago = np.where(recent, 0, rng.integers(0, days, n))
+    # Realtime rows belong to the current (UTC) day; older rows spread over the window
+    event_date = pd.Series(now.tz_convert(None).normalize() - pd.to_timedelta(days_ago, unit='D'))
+
+    pages = np.array([f"/article-{k}" for k in range(landing_pages)] + [None], dtype=object)
+    page_codes = rng.choice(len(pages), n, p=_zipf_weights(len(pages)))
+    df = pd.DataFrame({
+        'sourceDataSet': pd.Categorical.from_codes(site_codes, [f"analytics_{w['suffix']}" for w in config['websites']]),
+        'landingPage': pages[page_codes],
+        'session_minute': session_minute,
+        'country': _categorical(rng, [f"Country {k}" for k in range(countries)], n),
+        'event_date': event_date,
+        'session_source': _categorical(rng, ['(direct)', 'google'] + [f"source-{k}" for k in range(sources - 2)], n),
+        'sessions': rng.geometric(0.3, n).astype('int32'),
+        'website': pd.Categorical.from_codes(site_codes, [w['website'] for w in config['websites']]),
+    })
+    return df, config
+
+
+def synthetic_cost(config: dict, days: int = 90, seed: int = 0,
+                   today: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+    """Cost rollup rows (date, site, kind, version, jobs, bytes_billed) for every site and kind."""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(today or pd.Timestamp.now().date())
+    dates = pd.date_range(end=today, periods=days, freq='D')
+    sites = [w['website'] for w in config['websites']]
+    index = pd.MultiIndex.from_product([dates, sites, COST_KINDS], names=['date', 'site', 'kind'])
+    n = len(index)
+    return index.to_frame(index=False).assign(
+        version='v2',
+        jobs=rng.integers(1, 30, n),
+        bytes_billed=rng.integers(10, 500, n) * 1024 ** 2,
+    )
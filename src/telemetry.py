@@ -0,0 +1,137 @@
+"""
+telemetry.py - Per-job BigQuery execution records kept in a process-wide ring buffer
+"""
+import json
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+# Records kept per process; the oldest are dropped first
+MAX_RECORDS = 2000
+# Phases of a job's latency, in order
+PHASES = ['queue_seconds', 'execute_seconds', 'download_seconds', 'pandas_seconds']
+
+
+@dataclass(frozen=True)
+class JobRecord:
+    """What one query job cost and where its time went."""
+    site: str
+    kind: Optional[str]           # e.g. history, realtime, cost
+    query_version: Optional[str]
+    job_id: Optional[str]
+    queued_at: Optional[datetime]  # job created
+    started_at: Optional[datetime]
+    ended_at: Optional[datetime]
+    total_bytes_processed: Optional[int]
+    total_bytes_billed: Optional[int]
+    slot_millis: Optional[int]
+    cache_hit: Optional[bool]
+    rows: Optional[int]
+    download_seconds: Optional[float]  # fetching the result as Arrow
+    pandas_seconds: Optional[float]    # Arrow to DataFrame conversion
+    memory_bytes: Optional[int]        # DataFrame memory, deep
+    error: Optional[str] = None
+
+    @property
+    def queue_seconds(self) -> Optional[float]:
+        if self.queued_at and self.started_at:
+            return (self.started_at - self.queued_at).total_seconds()
+        return None
+
+    @property
+    def execute_seconds(self) -> Optional[float]:
+        if self.started_at and self.ended_at:
+            return (self.ended_at - self.started_at).total_seconds()
+        return None
+
+    def to_dict(self) -> dict:
+        row = asdict(self)
+        row.update(queue_seconds=self.queue_seconds, execute_seconds=self.execute_seconds)
+        return row
+
+
+def job_record(query_job, site: str, tags: Optional[dict] = None, df: Optional[pd.DataFrame] = None,
+               download_seconds: Optional[float] = None, pandas_seconds: Optional[float] = None,
+               error: Optional[Exception] = None) -> JobRecord:
+    """Build a record from a QueryJob (None if submitting it failed) and what the download measured."""
+    tags = tags or {}
+
+    def attr(name):
+        return getattr(query_job, name, None) if query_job is not None else None
+
+    return JobRecord(
+        site=site,
+        kind=tags.get('kind'),
+        query_version=tags.get('version'),
+        job_id=attr('job_id'),
+        queued_at=attr('created'),
+        started_at=attr('started'),
+        ended_at=attr('ended'),
+        total_bytes_processed=attr('total_bytes_processed'),
+        total_bytes_billed=attr('total_bytes_billed'),
+        slot_millis=attr('slot_millis'),
+        cache_hit=attr('cache_hit'),
+        rows=len(df) if df is not None else None,
+        download_seconds=download_seconds,
+        pandas_seconds=pandas_seconds,
+        memory_bytes=int(df.memory_usage(deep=True).sum()) if df is not None else None,
+        error=str(error) if error is not None else None,
+    )
+
+
+class JobTelemetry:
+    """Thread-safe ring buffer of :class:`JobRecord`, shared by every fetch in the process."""
+
+    def __init__(self, max_records: int = MAX_RECORDS):
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, record: JobRecord) -> None:
+        with self._lock:
+            self._records.append(record)
+
+    def records(self) -> list:
+        with self._lock:
+            return list(self._records)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def to_frame(self) -> pd.DataFrame:
+        columns = [field.name for field in fields(JobRecord)] + ['queue_seconds', 'execute_seconds']
+        return pd.DataFrame([record.to_dict() for record in self.records()], columns=columns)
+
+    def to_json(self) -> str:
+        return json.dumps([record.to_dict() for record in self.records()], default=str, indent=2)
+
+    def to_csv(self) -> str:
+        return self.to_frame().to_csv(index=False)
+
+    def summary(self) -> pd.DataFrame:
+        """Per site and kind: job count, errors, cache hits, bytes billed and mean seconds per phase."""
+        frame = self.to_frame()
+        if frame.empty:
+            return frame
+        frame['failed'] = frame['error'].notna()
+        frame['cache_hit'] = frame['cache_hit'].eq(True)
+        frame['billed_mb'] = frame['total_bytes_billed'].fillna(0) / 1e6
+        frame['total_seconds'] = frame[PHASES].sum(axis=1, min_count=1)
+        return (frame.groupby(['site', 'kind'], dropna=False)
+                .agg(jobs=('site', 'size'), failed=('failed', 'sum'), cache_hits=('cache_hit', 'sum'),
+                     billed_mb=('billed_mb', 'sum'), **{phase: (phase, 'mean') for phase in PHASES},
+                     total_seconds=('total_seconds', 'mean'))
+                .sort_values('total_seconds', ascending=False)
+                .reset_index())
+
+
+_telemetry = JobTelemetry()
+
+
+def get_job_telemetry() -> JobTelemetry:
+    """The process-wide telemetry buffer."""
+    return _telemetry
@@ -0,0 +1,283 @@
+"""
+website_table.py - Data builder and HTML renderer for the unified website performance table
+"""
+from typing import Optional
+
+import pandas as pd
+
+from src.rollup import Rollup
+
+LABEL_COLUMNS = ['Number', 'Website', 'Monetization', 'Account']
+# Sessions in the last REALTIME_MINUTES, the only column the realtime lane changes
+RECENT_COLUMN = '30 Min'
+# Per-site freshness, shown last when the snapshot tracks it
+UPDATED_COLUMN = 'Updated'
+# Estimated bytes per history refresh and the scan budget's decision, when it is enabled
+SCAN_COLUMN = 'Scan'
+TEXT_COLUMNS = LABEL_COLUMNS + [UPDATED_COLUMN, SCAN_COLUMN]
+NAMED_ACCOUNT_CLASSES = {
+    'Anas': 'account-name-anas',
+    'Achraf': 'account-name-achraf',
+    'Ouss2': 'account-name-ouss2',
+}
+ACCOUNT_COLORS = {
+    'account-name-1': '#4D9DE0',
+    'account-name-2': '#6f42c1',
+    'account-name-3': '#fd7e14',
+    'account-name-4': '#17a2b8',
+    'account-name-5': '#28a745',
+    'account-name-anas': '#7a598b',
+    'account-name-achraf': '#88977a',
+    'account-name-ouss2': '#ffc8aa',
+}
+MONETIZATION_CLASSES = {
+    'ACTIVE': 'monetized-active',
+    'REVIEW': 'monetized-review',
+    'READY': 'monetized-ready',
+}
+
+TABLE_HEAD = """
+        <style>        .large-table {
+            width: 100%;
+            border-collapse: collapse;
+            font-size: 24px !important;
+            background-color: transparent;
+            color: white;
+            border: none;
+        }
+        .table-container {
+            border-right: 2px solid #4D9DE0;
+            border-bottom: 2px solid #4D9DE0;
+        }
+        .large-table th {
+            background-color: #262730;
+            color: white;
+            font-size: 26px !important;
+            font-weight: bold;
+            padding: 15px 8px;
+            text-align: center;
+            border: 1px solid #4D9DE0;
+        }
+        .large-table th.border-left {
+            border-left: 4px solid #4D9DE0 !important;
+        }
+        .large-table td {
+            font-size: 24px !important;
+            padding: 12px 8px;
+            text-align: center;
+            border: 1px solid #4D9DE0;
+            background-color: #0e1117;
+        }
+        .large-table td.no-border {
+            border: none !important;
+            background-color: black !important;
+        }
+        .large-table tbody tr td.no-border {
+            border: none !important;
+            border-top: none !important;
+            border-left: none !important;
+            border-right: none !important;
+            border-bottom: none !important;
+        }
+        .large-table tbody tr td.no-border:first-child {
+            border-left: none !important;
+        }
+        .large-table tbody tr td.no-border:last-child {
+            border-right: none !important;
+        }
+        /* Override table border for no-border cells */
+        .large-table tbody tr:first-child td.no-border:first-child,
+        .large-table tbody tr:nth-child(2) td.no-border:first-child,
+        .large-table tbody tr:nth-child(3) td.no-border:first-child,
+        .large-table tbody tr:nth-child(4) td.no-border:first-child,
+        .large-table tbody tr:nth-child(5) td.no-border:first-child,
+        .large-table tbody tr:nth-child(6) td.no-border:first-child {
+            border-left: none !important;
+            box-shadow: none !important;
+        }
+        .large-table td:nth-child(4) {
+            border-left: 2px solid #4D9DE0 !important;
+            border-right: 4px solid #4D9DE0 !important;
+        }
+        .large-table th:nth-child(4) {
+            border-left: 2px solid #4D9DE0 !important;
+            border-right: 4px solid #4D9DE0 !important;
+        }
+        /* Add border after 30 Min column (7th column) */
+        .large-table td:nth-child(7) {
+            border-right: 4px solid #4D9DE0 !important;
+        }
+        .large-table th:nth-child(7) {
+            border-right: 4px solid #4D9DE0 !important;
+        }
+        /* Add top border starting from Account column */
+        .large-table tbody tr:first-child td:nth-child(n+4) {
+            border-top: 2px solid #4D9DE0 !important;
+        }
+        .large-table tr:nth-child(even) td {
+            background-color: #1a1d29;
+        }
+        .monetized-active {
+            color: #28a745;
+            font-weight: bold;
+            font-size: 20px;
+        }
+        .monetized-review {
+            color: #ffc107;
+            font-weight: bold;
+            font-size: 20px;
+        }        .monetized-ready {
+            color: #000000;
+            font-weight: bold;
+            font-size: 20px;
+        }
+        .monetized-none {
+            color: #6c757d;
+            font-weight: bold;
+            font-size: 18px;
+        }        .website-name {
+            font-weight: bold !important;
+        }        .account-name {
+            font-weight: bold !important;
+        }
+        .account-name-1 { color: #4D9DE0; font-size: 20px; }  /* Blue */
+        .account-name-2 { color: #6f42c1; font-size: 20px; }  /* Purple */
+        .account-name-3 { color: #fd7e14; font-size: 20px; }  /* Orange */        
+        .account-name-4 { color: #17a2b8; font-size: 20px; }  /* Cyan */
+        .account-name-5 { color: #28a745; font-size: 20px; }  /* Forest Green */
+        .account-name-anas { color: #7a598b; font-size: 20px; }  /* Dark Purple for Anas */
+        .account-name-achraf { color: #88977a; font-size: 20px; }  /* Green-Gray for Achraf */
+        .account-name-ouss2 { color: #ffc8aa; font-size: 20px; }  /* Light Orange for Ouss2 */
+        .updated-at { color: #9aa0a6; font-size: 18px; }
+        </style>
+        <div class="table-container">
+        <table class="large-table">
+        <tbody>
+        """
+
+
+def _numeric_columns(columns) -> list:
+    return [col for col in columns if col not in TEXT_COLUMNS]
+
+
+def build_website_table(rollup: Rollup, config: dict, site_fetched_at: Optional[dict] = None,
+                        site_scan: Optional[dict] = None) -> pd.DataFrame:
+    """One row per configured site: labels, Yesterday/Today/30 Min and the 5 days before yesterday.
+
+    With ``site_fetched_at`` (website -> UTC datetime) an Updated column shows
+    when each site's rows were last fetched; with ``site_scan`` (website ->
+    SiteScan) a Scan column shows each site's estimated bytes per refresh.
+    """
+    end_date = rollup.today - pd.Timedelta(days=2)  # Day before yesterday
+    date_range = pd.date_range(end=end_date, periods=5, freq='D')[::-1]
+
+    daily = rollup.daily.reset_index()
+    visitors_pivot = (daily[daily['event_date'].between(date_range[-1], date_range[0])]
+                      .pivot(index='website', columns='event_date', values='sessions')
+                      .reindex(columns=date_range))
+    visitors_pivot.columns = [col.strftime('%d/%m') for col in visitors_pivot.columns]
+
+    sites = pd.DataFrame(config['websites'], columns=['number', 'website', 'monetization', 'account'])
+    sites.columns = LABEL_COLUMNS
+    totals = rollup.site_summary[['yesterday', 'today', 'recent']].set_axis(['Yesterday', 'Today', RECENT_COLUMN], axis=1)
+    table = sites.merge(totals.join(visitors_pivot, how='outer'),
+                        left_on='Website', right_index=True, how='left')
+    numeric = _numeric_columns(table.columns)
+    table[numeric] = table[numeric].fillna(0).astype(int)
+    table['Account'] = table['Account'].fillna('')
+    if site_fetched_at is not None:
+        updated = {website: f"{fetched_at:%H:%M}" for website, fetched_at in site_fetched_at.items()}
+        table[UPDATED_COLUMN] = table['Website'].map(updated).fillna('-')
+    if site_scan:
+        scans = {website: scan.label() for website, scan in site_scan.items()}
+        table[SCAN_COLUMN] = table['Website'].map(scans).fillna('-')
+    return table.reset_index(drop=True)
+
+
+def _account_classes(accounts) -> dict:
+    classes = {}
+    for i, account in enumerate(pd.unique(accounts)):
+        if account and account.strip():  # Only map non-empty accounts
+            classes[account] = NAMED_ACCOUNT_CLASSES.get(account, f"account-name-{(i % 5) + 1}")
+    return classes
+
+
+def _border_classes(cols) -> list:
+    # Thick separators before Yesterday and before the first date column (after 30 Min)
+    return ['border-left' if col == 'Yesterday' or (j > 0 and cols[j - 1] == RECENT_COLUMN) else ''
+            for j, col in enumerate(cols)]
+
+
+def _summary_row(cols, borders, label, sums, row_style, label_style, value_style) -> str:
+    cells = []
+    for col, border in zip(cols, borders):
+        class_attr = f' class="{border}"' if border else ''
+        if col == 'Account':
+            cells.append(f'<td{class_attr} style="{label_style}">{label}</td>')
+        elif col in TEXT_COLUMNS:
+            # No borders for empty columns
+            cells.append(f'<td class="{(border + " no-border").strip()}"></td>')
+        else:
+            cells.append(f'<td{class_attr} style="{value_style}">{int(sums[col]):,}</td>')
+    return f'<tr style="{row_style}">' + ''.join(cells) + '</tr>'
+
+
+def render_website_table(table: pd.DataFrame) -> str:
+    """Render the table with its summary rows as one HTML string built by list join."""
+    cols = table.columns.tolist()
+    numeric = _numeric_columns(cols)
+    borders = _border_classes(cols)
+    account_classes = _account_classes(table['Account'])
+    border_bottom = "border-bottom: 2px solid #4D9DE0;"
+    monetized = table[table['Monetization'] == 'ACTIVE']
+
+    parts = [
+        TABLE_HEAD,
+        _summary_row(cols, borders, 'TOTAL', table[numeric].sum(),
+                     'background-color: #262730; font-weight: bold;',
+                     f'font-weight: bold; color: #4D9DE0; {border_bottom}',
+                     f'font-weight: bold; {border_bottom}'),
+        _summary_row(cols, borders, 'TOTAL MONETIZED', monetized[numeric].sum(),
+                     'background-color: #0f7c39;', f'color: white; {border_bottom}', f'color: white; {border_bottom}'),
+        _summary_row(cols, borders, 'NOT MONETIZED', table.loc[table['Monetization'] != 'ACTIVE', numeric].sum(),
+                     'background-color: #7c3d0f;', f'color: white; {border_bottom}', f'color: white; {border_bottom}'),
+    ]
+
+    # Individual account rows (only ACTIVE monetization websites), busiest yesterday first
+    account_sums = (monetized[monetized['Account'].str.strip() != '']
+                    .groupby('Account', sort=False)[numeric].sum()
+                    .sort_values('Yesterday', ascending=False, kind='stable'))
+    for account, sums in account_sums.iterrows():
+        color = ACCOUNT_COLORS.get(account_classes.get(account, 'account-name-1'), '#4D9DE0')
+        parts.append(_summary_row(cols, borders, account, sums, 'background-color: rgba(15, 124, 57, 0.3);',
+                                  f'color: {color};', 'color: white;'))
+
+    # Add headers after the summary rows with bold separator
+    parts.append('<tr style="background-color: #262730; border-top: 4px solid #4D9DE0;">')
+    parts.extend(f'<th class="{border}">{col}</th>' if border else f'<th>{col}</th>'
+                 for col, border in zip(cols, borders))
+    parts.append('</tr>')
+
+    # Individual website rows
+    for row in table.itertuples(index=False, name=None):
+        parts.append('<tr>')
+        for col, border, val in zip(cols, borders, row):
+            css_classes = [border] if border else []
+            if col == 'Website':
+                css_classes.append('website-name')
+            elif col == 'Account':
+                css_classes.append('account-name')
+                if val in account_classes:
+                    css_classes.append(account_classes[val])
+            elif col == 'Monetization':
+                css_classes.append(MONETIZATION_CLASSES.get(val, 'monetized-none'))
+                if val not in MONETIZATION_CLASSES:
+                    val = "NONE"  # Show "NONE" instead of blank
+            elif col in (UPDATED_COLUMN, SCAN_COLUMN):
+                css_classes.append('updated-at')
+            class_attr = f' class="{" ".join(css_classes)}"' if css_classes else ''
+            parts.append(f'<td{class_attr}>{val}</td>')
+        parts.append('</tr>')
+
+    parts.append('</tbody></table></div>')
+    return ''.join(parts)
@@ -2,19 +2,45 @@
 main.py - Streamlit app entry point for GA4 Analytics Dashboard
 """
 import streamlit as st
-import datetime
 import json
-import pandas as pd
+import math
 from typing import Optional
-from src.bq_client import get_bigquery_client, fetch_analytics_data
+from src.bq_client import get_bigquery_client
 from src.dashboard import display_source_dashboard
-from src.query import get_analytics_query, get_historical_analytics_query
-from src.query_cost import get_bq_cost_usage
+from src.data_store import DataStore, DataSnapshot
+from src.prewarm import Prewarmer
+from src.telemetry import get_job_telemetry
+from src.snapshot_file import SNAPSHOT_DIR, latest_version, read_snapshot
+from src.day_cache import invalidate as invalidate_days
+from src.fetch import QUERY_VERSION, fetch_analytics_df, fetch_cost_df, fetch_history, fetch_realtime_df
 from src.sheets_connector import get_config_from_sheet
 
 st.set_page_config(page_title="GA4 Analytics Dashboard", layout="wide")
 
 CACHE_DURATION = 3600  # seconds
+# seconds, for the realtime lane; every run bills at least 10 MB per intraday table it reads,
+# so one run over ~100 sites costs 1-2 GB whatever the columns
+REALTIME_CACHE_DURATION = 300
+# Only query the sites picked in the website filter; narrowing the filter never refetches
+FETCH_SELECTED_ONLY = False
+# Feed the 30-minute panels from a small intraday-only query on REALTIME_CACHE_DURATION,
+# instead of the minute rows of the hourly history fetch
+USE_REALTIME_LANE = True
+# Refresh the history lane (and the site config) on a background thread ahead of expiry, so
+# only the very first load waits on BigQuery; Refresh queues a background refresh. The
+# realtime lane is only ever loaded on demand, while a session is showing it
+PREWARM = True
+PREWARM_LEAD_SECONDS = 300  # history is refreshed this long before CACHE_DURATION runs out
+# Background refreshes pause once no session has loaded the dashboard for this long,
+# and resume (serving the last snapshot meanwhile) on the next visit
+PREWARM_IDLE_SECONDS = CACHE_DURATION
+# Show the per-job query telemetry panel (timings, bytes, exports) under the dashboard
+SHOW_TELEMETRY_PANEL = True
+# Serve the snapshots build_snapshot.py writes to SNAPSHOT_DIR instead of querying BigQuery
+# from the web process; the fetch settings in src/fetch.py then only apply to build_snapshot.py
+USE_SNAPSHOT_FILES = False
+# Realtime results are shared between replicas for a bit less than one realtime refresh
+REALTIME_SHARED_TTL = REALTIME_CACHE_DURATION - 20
 
 # --- Utility Functions ---
 
@@ -26,92 +52,241 @@ def load_config() -> dict:
 
 # --- Caching Functions ---
 
-@st.cache_data(ttl=CACHE_DURATION)
-def fetch_analytics_df(_client, config) -> pd.DataFrame:
-    """Fetch and cache analytics data for filtered websites."""
-    all_data = []
-
-    for website in config['websites']:
-        suffix = website['suffix']
-        website_name = website['website']
-        try:
-            query = get_analytics_query(suffix)
-            data = fetch_analytics_data(_client, query, website_name)
-        except Exception as e:
-            if "does not match any table" in str(e) and "events_intraday_" in str(e):
-                import logging as logger
-                logger.warning(
-                    f"Intraday table not found for website: {website_name}. Using historical data only.")
-                historical_query = get_historical_analytics_query(suffix)
-                data = fetch_analytics_data(
-                    _client, historical_query, website_name)
-            else:
-                import logging as logger
-                logger.warning(
-                    f"Error executing query for website {website_name}: {str(e)}")
-                continue
-        data['website'] = website_name
-        all_data.append(data)
-    if all_data:
-        combined_df = pd.concat(all_data, ignore_index=True)
-        return combined_df
-    return pd.DataFrame()
+@st.cache_resource
+def get_bigquery_client_cached():
+    """Cache the BigQuery client resource."""
+    return get_bigquery_client()
 
 
-@st.cache_data(ttl=CACHE_DURATION)
-def fetch_cost_df(_client) -> Optional[pd.DataFrame]:
-    """Fetch and cache BigQuery cost usage data."""
+@st.cache_resource
+def get_data_store() -> DataStore:
+    """Process-wide store shared by every session without copying."""
+    return DataStore()
+
+
+def _scope_config(config, websites: Optional[frozenset]) -> dict:
+    if websites is None:
+        return config
+    return {**config, 'websites': [w for w in config['websites'] if w['website'] in websites]}
+
+
+def _fetch_scope(config) -> Optional[frozenset]:
+    """Sites this session needs fetched, or None for every configured site."""
+    selection = st.session_state.get('website_filter') if FETCH_SELECTED_ONLY else None
+    if not selection:
+        return None
+    configured = {w['website'] for w in config['websites']}
+    websites = frozenset(selection) & configured
+    return None if not websites or websites == configured else websites
+
+
+def _history_loader(_client, config=None, force: bool = False):
+    """Loader for the history store; without ``config`` the sheet is re-read on every load.
+
+    Forced loads (refreshes a user asked for) skip results shared by other replicas.
+    """
+    def load(websites, force=force):
+        site_config = config or get_config_from_sheet()
+        analytics, extra = fetch_history(_client, _scope_config(site_config, websites), get_data_store().get(),
+                                         force)
+        return analytics, fetch_cost_df(_client), site_config, extra
+    return load
+
+
+def _realtime_loader(_client, config=None, force: bool = False):
+    """Loader for the realtime store; without ``config`` it follows the history snapshot's config."""
+    def load(websites, force=force):
+        history = get_data_store().get()
+        site_config = config or (history.config if history and history.config else get_config_from_sheet())
+        return fetch_realtime_df(_client, site_config, REALTIME_SHARED_TTL, force), None
+    return load
+
+
+def load_snapshot(_client, config, force: bool = False) -> DataSnapshot:
+    """Return the shared data snapshot, fetching it when missing or older than CACHE_DURATION.
+
+    With PREWARM the background refresher keeps it current, so a request only
+    fetches when there is no snapshot yet or it lacks the selected sites.
+    """
+    return get_data_store().get_or_refresh(
+        _history_loader(_client, config, force), max_age=math.inf if PREWARM else CACHE_DURATION,
+        force=force, websites=_fetch_scope(config))
+
+
+@st.cache_resource
+def get_realtime_store() -> DataStore:
+    """Process-wide store for the realtime lane, refreshed on its own short cadence."""
+    return DataStore()
+
+
+def load_realtime(_client, config, force: bool = False) -> Optional[DataSnapshot]:
+    """Return the realtime lane snapshot, or None to fall back to the history lane.
+
+    It is never prewarmed: a session fetches it when it is older than
+    REALTIME_CACHE_DURATION, so nothing runs while nobody is watching.
+    """
+    if not USE_REALTIME_LANE:
+        return None
     try:
-        cost_query = get_bq_cost_usage()
-        cost_df = fetch_analytics_data(_client, cost_query)
-        return cost_df
+        return get_realtime_store().get_or_refresh(
+            _realtime_loader(_client, config, force), max_age=REALTIME_CACHE_DURATION, force=force)
     except Exception as e:
         import logging as logger
-        logger.warning(f"Could not fetch BigQuery cost usage: {str(e)}")
+        logger.warning(f"Realtime lane unavailable, using history data: {str(e)}")
         return None
 
 
 @st.cache_resource
-def get_bigquery_client_cached():
-    """Cache the BigQuery client resource."""
-    return get_bigquery_client()
+def get_prewarmers(_client) -> dict:
+    """Start the background refresher once per process."""
+    return {"history": Prewarmer(get_data_store(), _history_loader(_client), CACHE_DURATION,
+                                 PREWARM_LEAD_SECONDS, "history-prewarm", idle_after=PREWARM_IDLE_SECONDS).start()}
 
 # --- Refresh Logic ---
 
 
 def refresh_all_data(_client, config):
-    fetch_analytics_df.clear()
-    fetch_cost_df.clear()
     load_config.clear()
-    return fetch_analytics_df(_client, config), fetch_cost_df(_client)
+    if PREWARM:
+        # Queue instead of blocking; this request keeps serving the current snapshot
+        get_prewarmers(_client)["history"].request_refresh()
+        return load_snapshot(_client, config)
+    return load_snapshot(_client, config, force=True)
+
+
+def refresh_site(_client, website: str) -> None:
+    """Refetch one site's history rows, cached completed days included, and splice them into
+    the shared snapshot."""
+    store = get_data_store()
+    snapshot = store.get()
+    config = snapshot.config if snapshot and snapshot.config else load_config()
+    site_config = _scope_config(config, frozenset({website}))
+    if not site_config['websites']:
+        return
+    # A site refresh is how a GA4 backfill or reprocessing of older days gets picked up
+    invalidate_days(site_config['websites'][0]['suffix'], version=QUERY_VERSION)
+    site_df = fetch_analytics_df(_client, site_config, force=True)
+    # An empty result means the fetch failed; keep the rows we have
+    if site_df.empty:
+        import logging as logger
+        logger.warning(f"Refresh of {website} returned no rows, keeping the previous data")
+        return
+    store.update_sites(frozenset({website}), site_df)
+
+
+def refresh_cost(_client) -> None:
+    """Refetch only the BigQuery cost data."""
+    cost_df = fetch_cost_df(_client)
+    if cost_df is not None:
+        get_data_store().update_cost(cost_df)
+
+
+def refresh_realtime(_client) -> None:
+    """Refetch only the realtime (intraday) lane."""
+    get_realtime_store().refresh(_realtime_loader(_client, force=True))
+
+
+def refresh_part(_client, lane: str, website: Optional[str] = None) -> None:
+    """Refresh one lane ("site", "realtime" or "cost"), queued in the background with PREWARM.
+
+    The realtime lane is small and not prewarmed, so it always refreshes inline.
+    """
+    if lane == "site":
+        label, job = f"refresh of {website}", lambda: refresh_site(_client, website)
+    elif lane == "realtime":
+        label, job = "realtime refresh", lambda: refresh_realtime(_client)
+    else:
+        label, job = "cost refresh", lambda: refresh_cost(_client)
+    if PREWARM and lane != "realtime":
+        get_prewarmers(_client)["history"].submit(label, job)
+        st.toast(f"Queued {label}; new data shows once it has loaded")
+    else:
+        with st.spinner(f"Running {label}..."):
+            job()
+
+
+def load_snapshot_file() -> Optional[DataSnapshot]:
+    """The latest snapshot written by build_snapshot.py, read once per version for every session."""
+    version = latest_version()
+    if version is None:
+        return get_data_store().get()
+    return get_data_store().adopt(version, lambda: read_snapshot(version))
+
+
+def _data_as_of(snapshot: DataSnapshot, prewarmer: Optional[Prewarmer]) -> str:
+    text = f"Data as of {snapshot.fetched_at:%Y-%m-%d %H:%M} UTC"
+    if prewarmer is not None and prewarmer.refreshing:
+        text += " · refreshing in the background"
+    elif prewarmer is not None and prewarmer.last_error:
+        text += " · last background refresh failed, showing the previous data"
+    return text
 
 # --- Main App ---
+def _show_dashboard(snapshot: DataSnapshot, config, realtime=None, realtime_loader=None,
+                    prewarmer: Optional[Prewarmer] = None, telemetry=None):
+    df, cost_df = snapshot.analytics, snapshot.cost
+    if df.empty:
+        st.error("No data available. Please check your configuration.")
+        return
+    
+    st.caption(_data_as_of(snapshot, prewarmer))
+    # A partial snapshot only shows the fetched sites, but the filter still offers all of them
+    filter_options = None
+    if snapshot.websites is not None:
+        filter_options = [w['website'] for w in config['websites']]
+    try:
+        display_source_dashboard(df, cost_df, _scope_config(config, snapshot.websites),
+                                 snapshot.version, filter_options, realtime, realtime_loader,
+                                 snapshot.site_fetched_at, snapshot.rollup, snapshot.site_scan, telemetry)
+    except Exception as e:
+        st.error(f"Error displaying dashboard: {str(e)}")
+
+
 def main():
     """Main entry point for the Streamlit dashboard app."""
     if 'refresh_clicked' not in st.session_state:
         st.session_state.refresh_clicked = False
+
+    if USE_SNAPSHOT_FILES:
+        # Nothing to fetch here: every rerun (including Refresh) just picks up the newest file
+        st.session_state.refresh_clicked = False
+        st.session_state.pop('refresh_target', None)
+        snapshot = load_snapshot_file()
+        if snapshot is None:
+            st.error(f"No snapshot found in {SNAPSHOT_DIR}. Run build_snapshot.py first.")
+            return
+        _show_dashboard(snapshot, snapshot.config)
+        return
     
     client = get_bigquery_client_cached()
     
     # Load config once
     config = load_config()
     
+    prewarmers = get_prewarmers(client) if PREWARM else {}
+    if PREWARM:
+        prewarmers["history"].touch()
+
+    # Targeted refresh picked in the dashboard: one site, realtime only or cost only
+    refresh_target = st.session_state.pop('refresh_target', None)
+    if refresh_target is not None:
+        refresh_part(client, *refresh_target)
+
     with st.spinner("Loading data..."):
         if st.session_state.refresh_clicked:
-            df, cost_df = refresh_all_data(client, config)
+            snapshot = refresh_all_data(client, config)
+            realtime = load_realtime(client, config, force=True)
             st.session_state.refresh_clicked = False
+            if PREWARM:
+                st.toast("Refresh queued; new data shows once it has loaded")
         else:
-            df = fetch_analytics_df(client, config)
-            cost_df = fetch_cost_df(client)
-    
-    if df.empty:
-        st.error("No data available. Please check your configuration.")
-        return
-    
-    try:
-        display_source_dashboard(df, cost_df, config)
-    except Exception as e:
-        st.error(f"Error displaying dashboard: {str(e)}")
+            snapshot = load_snapshot(client, config)
+            realtime = load_realtime(client, config)
+    # Config and data were fetched together and are swapped in together
+    config = snapshot.config or config
+    _show_dashboard(snapshot, config, realtime,
+                    (lambda: load_realtime(client, config)) if USE_REALTIME_LANE else None,
+                    prewarmers.get("history"), get_job_telemetry() if SHOW_TELEMETRY_PANEL else None)
 
 
 if __name__ == "__main__":
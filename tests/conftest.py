@@ -0,0 +1,10 @@
+import pytest
+
+from src import shared_cache
+
+
+@pytest.fixture(autouse=True)
+def no_shared_cache(monkeypatch):
+    # Tests opt in with their own backend; never share results through the working copy's cache
+    monkeypatch.setattr(shared_cache, "CACHE_PATH", "off")
+    monkeypatch.setattr(shared_cache, "_backend", None)
@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+from src.atomic_write import atomic_write
+
+
+def test_the_file_is_replaced_once_the_block_succeeds(tmp_path):
+    path = tmp_path / "nested" / "ledger.json"
+    with atomic_write(path, "w") as tmp:
+        json.dump({"bytes": 1}, tmp)
+        assert not path.exists()
+    assert json.loads(path.read_text()) == {"bytes": 1}
+    assert list(path.parent.iterdir()) == [path]
+
+
+def test_a_failed_write_keeps_the_old_file_and_leaves_no_temporary_file(tmp_path):
+    path = tmp_path / "ledger.json"
+    path.write_text("old")
+    with pytest.raises(ValueError):
+        with atomic_write(path, "w") as tmp:
+            tmp.write("partial")
+            raise ValueError("serialization failed")
+    assert path.read_text() == "old"
+    assert list(tmp_path.iterdir()) == [path]
@@ -0,0 +1,245 @@
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from src import bq_client, shared_cache
+from src.bq_client import concat_compact, fetch_analytics_data, fetch_analytics_data_concurrent
+from src.shared_cache import SQLiteCache
+from src.telemetry import get_job_telemetry
+
+
+class FakeJob:
+    def __init__(self, query, rows, submitted=None, fail=False, job_config=None):
+        self.query = query
+        self.job_config = job_config
+        self.rows = rows
+        self.fail = fail
+        self.cancelled = False
+        self.submitted = submitted
+        self.total_bytes_billed = 10 * 1024 ** 2
+        self.started = self.ended = None
+
+    def result(self, timeout=None):
+        # Jobs only finish once everything was submitted, so waiting before then would deadlock
+        if self.submitted is not None and not self.submitted.wait(5):
+            raise AssertionError("waited on a job before all jobs were submitted")
+        if self.fail:
+            raise RuntimeError(f"query failed: {self.query}")
+        return self
+
+    def to_arrow(self, create_bqstorage_client=False):
+        return pa.table({"sessions": [self.rows]})
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeClient:
+    def __init__(self, expected_jobs=None, failing=()):
+        self.queries = []
+        self.jobs = []
+        self.failing = set(failing)
+        self.expected_jobs = expected_jobs
+        self.submitted = threading.Event() if expected_jobs else None
+        self._lock = threading.Lock()
+
+    def query(self, query, job_config=None):
+        with self._lock:
+            self.queries.append(query)
+            job = FakeJob(query, len(self.queries), self.submitted, fail=query in self.failing,
+                          job_config=job_config)
+            self.jobs.append(job)
+            if self.expected_jobs and len(self.queries) == self.expected_jobs:
+                self.submitted.set()
+        return job
+
+
+QUERIES = {site: (f"SELECT '{site}'", None) for site in "abcd"}
+
+
+@pytest.fixture(autouse=True)
+def billed(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(bq_client, "record_spent", recorded.append)
+    return recorded
+
+
+def sessions(results):
+    return {website: int(df["sessions"].iloc[0]) for website, df in results.items()}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    backend = SQLiteCache(tmp_path / "shared_cache.sqlite")
+    shared_cache.set_shared_cache(backend)
+    yield backend
+    shared_cache.set_shared_cache(None)
+
+
+def test_all_jobs_are_submitted_before_any_is_waited_on(billed):
+    client = FakeClient(expected_jobs=len(QUERIES))
+    results, errors = fetch_analytics_data_concurrent(client, QUERIES, max_workers=2)
+    assert errors == {}
+    assert set(results) == set(QUERIES)
+    assert billed == [10 * 1024 ** 2] * len(QUERIES)
+
+
+def test_a_failed_job_is_reported_and_cancelled_without_losing_the_others():
+    client = FakeClient(failing={"SELECT 'b'"})
+    results, errors = fetch_analytics_data_concurrent(client, QUERIES)
+    assert set(results) == {"a", "c", "d"}
+    assert set(errors) == {"b"}
+    assert [job.cancelled for job in client.jobs if job.query == "SELECT 'b'"] == [True]
+
+
+def test_every_job_leaves_a_telemetry_record_with_its_tags():
+    telemetry = get_job_telemetry()
+    telemetry.clear()
+    client = FakeClient(failing={"SELECT 'b'"})
+    fetch_analytics_data_concurrent(client, QUERIES, tags={"kind": "history", "version": "v2"})
+    records = {record.site: record for record in telemetry.records()}
+    assert set(records) == set(QUERIES)
+    assert {(record.kind, record.query_version) for record in records.values()} == {("history", "v2")}
+    assert records["b"].error is not None and records["a"].error is None
+    assert records["a"].rows == 1 and records["a"].download_seconds is not None
+    telemetry.clear()
+
+
+def test_jobs_are_labelled_with_their_site_and_kind():
+    client = FakeClient()
+    queries = {"Example.com": ("SELECT 'a'", None),
+               "Example.com 2026-10-07": ("SELECT 'b'", None, {"kind": "day", "site": "Example.com"})}
+    fetch_analytics_data_concurrent(client, queries, tags={"kind": "history", "version": "v2"})
+    labels = {job.query: job.job_config.labels for job in client.jobs}
+    assert labels["SELECT 'a'"] == {"app": "ga4-dashboard", "site": "example_com", "kind": "history",
+                                    "version": "v2"}
+    assert labels["SELECT 'b'"]["kind"] == "day" and labels["SELECT 'b'"]["site"] == "example_com"
+
+
+def test_a_failed_submission_does_not_stop_the_other_queries():
+    class RejectingClient(FakeClient):
+        def query(self, query, job_config=None):
+            if query == "SELECT 'c'":
+                raise ValueError("invalid query")
+            return super().query(query, job_config)
+
+    results, errors = fetch_analytics_data_concurrent(RejectingClient(), QUERIES)
+    assert set(results) == {"a", "b", "d"}
+    assert isinstance(errors["c"], ValueError)
+
+
+def test_the_timeout_covers_the_download_too():
+    class SlowDownloadJob(FakeJob):
+        def to_arrow(self, create_bqstorage_client=False):
+            if self.query == "SELECT 'b'":
+                time.sleep(1)
+            return super().to_arrow(create_bqstorage_client)
+
+    class SlowDownloadClient(FakeClient):
+        def query(self, query, job_config=None):
+            return SlowDownloadJob(query, 1)
+
+    results, errors = fetch_analytics_data_concurrent(SlowDownloadClient(), QUERIES, timeout=0.2)
+    assert set(results) == {"a", "c", "d"}
+    assert isinstance(errors["b"], TimeoutError)
+
+
+def test_results_are_downloaded_into_compact_dtypes():
+    class SitesJob(FakeJob):
+        def to_arrow(self, create_bqstorage_client=False):
+            return pa.table({"country": ["France", "Spain", "France"], "event_date": pa.array(
+                [pd.Timestamp("2026-10-01").date()] * 3), "sessions": pa.array([1, 2, 3], pa.int64())})
+
+    class SitesClient(FakeClient):
+        def query(self, query, job_config=None):
+            return SitesJob(query, 0)
+
+    df = fetch_analytics_data(SitesClient(), "SELECT 1", "a")
+    assert isinstance(df["country"].dtype, pd.CategoricalDtype)
+    assert df["sessions"].dtype == "int32"
+    assert pd.api.types.is_datetime64_any_dtype(df["event_date"])
+
+
+def test_concatenated_frames_stay_categorical():
+    first = pd.DataFrame({"country": pd.Categorical(["France"]), "sessions": [1]})
+    second = pd.DataFrame({"country": pd.Categorical(["Spain", "France"]), "sessions": [2, 3]})
+    df = concat_compact([first, second])
+    assert isinstance(df["country"].dtype, pd.CategoricalDtype)
+    assert df["country"].tolist() == ["France", "Spain", "France"]
+    assert df["sessions"].tolist() == [1, 2, 3]
+
+
+def test_shared_results_are_reused_until_forced(cache):
+    client = FakeClient()
+    first, _ = fetch_analytics_data_concurrent(client, QUERIES)
+    again, _ = fetch_analytics_data_concurrent(client, QUERIES)
+    assert sessions(again) == sessions(first)
+    assert len(client.queries) == len(QUERIES)
+
+    forced, _ = fetch_analytics_data_concurrent(client, QUERIES, force=True)
+    assert len(client.queries) == 2 * len(QUERIES)
+    # Forced results are written through for the next normal fetch
+    after, _ = fetch_analytics_data_concurrent(client, QUERIES)
+    assert sessions(after) == sessions(forced) != sessions(first)
+    assert not any(cache.is_locked(bq_client._shared_key(query, None)) for query, _ in QUERIES.values())
+
+
+def test_single_query_force_writes_through(cache):
+    client = FakeClient()
+    first = fetch_analytics_data(client, "SELECT 1")
+    forced = fetch_analytics_data(client, "SELECT 1", force=True)
+    assert int(forced["sessions"].iloc[0]) != int(first["sessions"].iloc[0])
+    assert int(fetch_analytics_data(client, "SELECT 1")["sessions"].iloc[0]) == int(forced["sessions"].iloc[0])
+    assert len(client.queries) == 2
+
+
+def test_a_query_another_replica_is_running_is_waited_on(cache, tmp_path):
+    other = SQLiteCache(tmp_path / "shared_cache.sqlite")
+    key = bq_client._shared_key("SELECT 'a'", None)
+    assert other.try_lock(key)
+
+    def finish():
+        time.sleep(0.3)
+        other.set(key, shared_cache.frame_to_bytes(pd.DataFrame({"sessions": [42]})), 60)
+        other.unlock(key)
+
+    thread = threading.Thread(target=finish)
+    thread.start()
+    client = FakeClient()
+    results, errors = fetch_analytics_data_concurrent(client, {"a": QUERIES["a"], "b": QUERIES["b"]})
+    thread.join()
+    assert errors == {}
+    assert sessions(results)["a"] == 42
+    assert client.queries == ["SELECT 'b'"]
+
+
+def test_a_query_another_replica_gave_up_on_runs_here(cache, tmp_path):
+    other = SQLiteCache(tmp_path / "shared_cache.sqlite")
+    key = bq_client._shared_key("SELECT 'a'", None)
+    assert other.try_lock(key)
+    threading.Timer(0.3, other.unlock, args=(key,)).start()
+
+    client = FakeClient()
+    results, errors = fetch_analytics_data_concurrent(client, {"a": QUERIES["a"]})
+    assert errors == {}
+    assert client.queries == ["SELECT 'a'"]
+    assert cache.get(key) is not None
+
+
+def test_locks_are_released_when_the_lookup_fails(cache, monkeypatch):
+    reads = []
+    get = cache.get
+
+    def flaky_get(key):
+        reads.append(key)
+        if len(reads) == 2:
+            raise RuntimeError("cache went away")
+        return get(key)
+
+    monkeypatch.setattr(cache, "get", flaky_get)
+    results, errors = fetch_analytics_data_concurrent(FakeClient(), QUERIES)
+    assert set(results) == set(QUERIES) and errors == {}
+    assert not any(cache.is_locked(bq_client._shared_key(query, None)) for query, _ in QUERIES.values())
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from src.cost_rollup import (BACKFILL_DAYS, SETTLE_MINUTES, high_water_mark, load_cost_rollup,
+                             update_cost_rollup)
+
+NOW = datetime(2026, 10, 8, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "cost_rollup.parquet"
+
+
+def rows(*entries):
+    return pd.DataFrame(entries, columns=["date", "site", "kind", "version", "jobs", "bytes_billed"])
+
+
+class Fetch:
+    """Returns the queued frames in order and remembers each (since, until) window."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.windows = []
+
+    def __call__(self, since, until):
+        self.windows.append((since, until))
+        return self.results.pop(0)
+
+
+def test_the_first_load_backfills_and_stops_short_of_running_jobs(path):
+    fetch = Fetch(rows(("2026-10-07", "a_com", "history", "v2", 3, 300)))
+    rollup = update_cost_rollup(fetch, NOW, path)
+    until = NOW - timedelta(minutes=SETTLE_MINUTES)
+    assert fetch.windows == [(NOW - timedelta(days=BACKFILL_DAYS), until)]
+    assert rollup["bytes_billed"].tolist() == [300]
+    assert high_water_mark(path) == until
+
+
+def test_later_loads_only_fetch_new_jobs_and_merge_them(path):
+    fetch = Fetch(rows(("2026-10-07", "a_com", "history", "v2", 3, 300)),
+                  rows(("2026-10-07", "a_com", "history", "v2", 1, 100),
+                       ("2026-10-08", None, None, None, 2, 50)))
+    update_cost_rollup(fetch, NOW, path)
+    later = NOW + timedelta(hours=1)
+    rollup = update_cost_rollup(fetch, later, path)
+
+    assert fetch.windows[1] == (NOW - timedelta(minutes=SETTLE_MINUTES), later - timedelta(minutes=SETTLE_MINUTES))
+    by_day = rollup.set_index(rollup["date"].dt.strftime("%Y-%m-%d"))
+    assert by_day.loc["2026-10-07", ["jobs", "bytes_billed"]].tolist() == [4, 400]
+    # Unlabelled jobs keep their own row instead of being dropped by the group-by
+    assert by_day.loc["2026-10-08", "bytes_billed"] == 50
+    assert load_cost_rollup(path).equals(rollup)
+
+
+def test_nothing_is_fetched_again_before_the_mark_moves(path):
+    fetch = Fetch(rows())
+    update_cost_rollup(fetch, NOW, path)
+    update_cost_rollup(fetch, NOW, path)
+    assert len(fetch.windows) == 1
+    assert high_water_mark(path) == NOW - timedelta(minutes=SETTLE_MINUTES)
+
+
+def test_a_failed_fetch_keeps_the_rollup_and_its_mark(path):
+    update_cost_rollup(Fetch(rows(("2026-10-07", "a_com", "history", "v2", 3, 300))), NOW, path)
+
+    def fail(since, until):
+        raise RuntimeError("quota exceeded")
+
+    with pytest.raises(RuntimeError):
+        update_cost_rollup(fail, NOW + timedelta(hours=1), path)
+    assert high_water_mark(path) == NOW - timedelta(minutes=SETTLE_MINUTES)
+    assert load_cost_rollup(path)["bytes_billed"].tolist() == [300]
+    assert not list(path.parent.glob("*.tmp"))
+
+
+def test_an_empty_rollup_has_the_expected_columns(path):
+    assert load_cost_rollup(path).columns.tolist() == ["date", "site", "kind", "version", "jobs", "bytes_billed"]
+    assert high_water_mark(path) is None
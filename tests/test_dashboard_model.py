@@ -0,0 +1,90 @@
+import pandas as pd
+
+from src.dashboard_model import (FREE_TIER_GIB, MULTI_SITE_JOBS, OTHER_JOBS, compute_cost_summary,
+                                 compute_dashboard_model, compute_realtime_model, merge_realtime)
+from src.query import REALTIME_MINUTES
+from tests.test_rollup import CONFIG, NOW, TODAY, analytics, minutes_ago
+
+
+def test_model_builds_a_panel_per_site_with_data():
+    model = compute_dashboard_model(analytics(), None, CONFIG, today=TODAY, now=NOW)
+    assert list(model.sites) == model.website_order == ["a.com", "b.com", "c.com"]
+    panel = model.sites["a.com"]
+    assert panel.live.active_users == 4
+    assert len(panel.live.by_minute) == REALTIME_MINUTES + 1
+    assert panel.live.by_minute[5] == 4 and panel.live.by_minute.sum() == 4
+    assert panel.landing_pages.columns.tolist() == ["Landing Page", "Sessions"]
+    assert panel.source_trend["event_date"].is_monotonic_increasing
+    assert model.cost is None
+
+
+def test_total_panel_adds_up_every_site():
+    model = compute_dashboard_model(analytics(), None, CONFIG, today=TODAY, now=NOW)
+    total = model.total
+    assert total.daily["sessions"].sum() == sum(panel.daily["sessions"].sum() for panel in model.sites.values())
+    assert total.live.active_users == sum(panel.live.active_users for panel in model.sites.values())
+    assert total.sources.empty and total.source_trend.empty
+    assert model.website_table["Website"].tolist() == ["a.com", "b.com", "c.com"]
+    assert "<table" in model.website_table_html
+
+
+def test_string_dates_are_parsed_without_touching_the_input():
+    df = analytics().astype({"event_date": str})
+    model = compute_dashboard_model(df, None, CONFIG, today=TODAY, now=NOW)
+    assert model.sites["b.com"].daily["sessions"].sum() == 25
+    assert df["event_date"].dtype == object
+
+
+def test_cost_summary_covers_the_last_30_days():
+    cost = pd.DataFrame({"date": ["2026-10-07", "2026-10-07", "2026-10-01", "2026-08-01"],
+                         "site": ["a_com", None, "multi", "a_com"], "kind": ["history", None, "realtime", "history"],
+                         "version": ["v2", None, None, "v2"], "jobs": [3, 1, 2, 9],
+                         "bytes_billed": [10e9, 2e9, 1e9, 500e9]})
+    summary = compute_cost_summary(cost, TODAY, websites=["a.com"])
+    assert len(summary.daily) == summary.days == 30
+    assert summary.total_gb == 13.0
+    assert summary.percent_free == 13.0 / FREE_TIER_GIB * 100
+    # Month-to-date sums restart on the first of the month
+    daily = summary.daily.set_index("date")["month_to_date_gigs_billed_sum"]
+    assert daily[pd.Timestamp("2026-10-01").date()] == 1.0
+    assert daily[pd.Timestamp("2026-10-07").date()] == 13.0
+    # Labels map back to website names; unlabelled jobs are grouped together
+    assert summary.by_site.values.tolist() == [["a.com", 10.0], [OTHER_JOBS, 2.0], [MULTI_SITE_JOBS, 1.0]]
+    assert summary.by_kind["kind"].tolist() == ["history", OTHER_JOBS, "realtime"]
+    assert compute_cost_summary(cost, TODAY, days=90).total_gb == 513.0
+    assert compute_cost_summary(cost.iloc[0:0], TODAY) is None
+
+
+def test_a_selection_scopes_the_panels_but_not_the_website_table():
+    model = compute_dashboard_model(analytics(), None, CONFIG, today=TODAY, websites=["b.com"], now=NOW)
+    assert list(model.sites) == model.website_order == ["b.com"]
+    assert model.total.daily["sessions"].sum() == 25
+    assert model.websites == ["b.com", "a.com", "c.com"]
+    assert model.website_table["Website"].tolist() == ["a.com", "b.com", "c.com"]
+
+
+def test_realtime_rows_feed_the_live_numbers_and_the_30_min_column():
+    realtime_df = pd.DataFrame({"website": ["b.com"], "session_minute": minutes_ago(2), "country": ["Italy"], "sessions": [6]})
+    model = compute_dashboard_model(analytics(), None, CONFIG, today=TODAY, realtime_df=realtime_df, now=NOW)
+    assert model.sites["b.com"].live.active_users == 6
+    assert model.sites["a.com"].live.active_users == 0
+    assert model.total.live.active_users == 6
+    assert model.website_table.set_index("Website")["30 Min"].to_dict() == {"a.com": 0, "b.com": 6, "c.com": 0}
+
+
+def test_merging_realtime_rows_into_a_cached_model_matches_building_it_with_them():
+    realtime_df = pd.DataFrame({"website": ["a.com", "b.com"], "session_minute": minutes_ago(2, 7),
+                                "country": ["Italy", "Spain"], "sessions": [6, 2]})
+    for websites in (None, ["a.com"]):
+        history = compute_dashboard_model(analytics(), None, CONFIG, today=TODAY, websites=websites, now=NOW)
+        merged = merge_realtime(history, realtime_df, websites, NOW)
+        built = compute_dashboard_model(analytics(), None, CONFIG, today=TODAY, websites=websites,
+                                        realtime_df=realtime_df, now=NOW)
+        assert merged.website_table_html == built.website_table_html
+        assert merged.total.live.active_users == built.total.live.active_users
+        assert merged.sites.keys() == built.sites.keys()
+        # The history parts are shared, not rebuilt
+        assert merged.total.daily is history.total.daily
+    live = compute_realtime_model(history.rollup, realtime_df, ["b.com"], NOW)
+    assert live.total.active_users == 2
+    assert live.site("a.com").active_users == 0
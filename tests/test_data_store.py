@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pandas as pd
+
+from src.data_store import DataStore
+
+
+def analytics():
+    return pd.DataFrame({"event_date": ["2026-10-01", "2026-10-02"], "sessions": [1, 2]})
+
+
+def test_publishing_derives_columns_without_touching_the_input():
+    raw = analytics()
+    cost = pd.DataFrame({"date": ["2026-10-01"], "cost": [0.5]})
+    snapshot = DataStore().publish(raw, cost)
+    assert pd.api.types.is_datetime64_any_dtype(snapshot.analytics["event_date"])
+    assert snapshot.cost["date"].tolist() == [pd.Timestamp("2026-10-01").date()]
+    assert raw["event_date"].tolist() == ["2026-10-01", "2026-10-02"]
+    assert cost["date"].tolist() == ["2026-10-01"]
+
+
+def test_a_fresh_snapshot_is_reused_and_a_stale_or_forced_one_reloaded():
+    store = DataStore()
+    loads = []
+
+    def loader(websites):
+        loads.append(1)
+        return analytics(), None
+
+    first = store.get_or_refresh(loader, max_age=60)
+    assert store.get_or_refresh(loader, max_age=60) is first
+    assert store.get_or_refresh(loader, max_age=0) is not first
+    forced = store.get_or_refresh(loader, max_age=60, force=True)
+    assert store.get() is forced
+    assert len(loads) == 3
+    assert len({first.version, forced.version}) == 2
+
+
+def test_sessions_waiting_on_a_reload_reuse_its_snapshot():
+    store = DataStore()
+    loads = []
+
+    def slow_loader(websites):
+        loads.append(1)
+        time.sleep(0.1)
+        return analytics(), None
+
+    snapshots = []
+    threads = [threading.Thread(target=lambda: snapshots.append(store.get_or_refresh(slow_loader, max_age=60)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert len({id(snapshot) for snapshot in snapshots}) == 1
+
+
+def test_a_partial_snapshot_is_widened_for_sessions_asking_for_more_sites():
+    store = DataStore()
+    requested = []
+
+    def loader(websites):
+        requested.append(websites)
+        return analytics(), None
+
+    partial = store.get_or_refresh(loader, max_age=60, websites=frozenset({"a.com"}))
+    assert store.get_or_refresh(loader, max_age=60, websites=frozenset({"a.com"})) is partial
+    widened = store.get_or_refresh(loader, max_age=60, websites=frozenset({"b.com"}))
+    assert widened.websites == {"a.com", "b.com"}
+    assert store.get_or_refresh(loader, max_age=60).websites is None
+    assert requested == [{"a.com"}, {"a.com", "b.com"}, None]
+
+
+def test_a_site_update_splices_its_rows_and_keeps_the_refresh_schedule():
+    store = DataStore()
+    first = store.publish(pd.DataFrame({"website": ["a.com", "b.com"], "event_date": ["2026-10-01"] * 2,
+                                        "sessions": [1, 2]}), None)
+    updated = store.update_sites(frozenset({"b.com"}), pd.DataFrame(
+        {"website": ["b.com"], "event_date": ["2026-10-01"], "sessions": [5]}))
+    assert updated.version != first.version
+    assert updated.fetched_at == first.fetched_at
+    assert updated.site_fetched_at["a.com"] == first.site_fetched_at["a.com"]
+    assert updated.site_fetched_at["b.com"] >= first.site_fetched_at["b.com"]
+    assert dict(zip(updated.analytics["website"], updated.analytics["sessions"])) == {"a.com": 1, "b.com": 5}
+    cost = store.update_cost(pd.DataFrame({"date": ["2026-10-01"], "cost": [0.5]}))
+    assert cost.analytics is updated.analytics
+    assert cost.site_fetched_at == updated.site_fetched_at
@@ -0,0 +1,62 @@
+import os
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from src import day_cache
+from src.day_cache import evict, invalidate, load_day, save_day
+
+DAY = date(2026, 10, 1)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(day_cache, "CACHE_DIR", tmp_path)
+    return tmp_path
+
+
+def frame(sessions):
+    return pd.DataFrame({"event_date": [DAY], "sessions": [sessions]})
+
+
+def test_saved_days_round_trip_and_misses_return_none(cache_dir):
+    save_day("111", DAY, "v2", frame(5))
+    pd.testing.assert_frame_equal(load_day("111", DAY, "v2"), frame(5))
+    assert load_day("111", DAY, "v1") is None
+    assert load_day("222", DAY, "v2") is None
+    assert not list(cache_dir.rglob("*.tmp"))
+
+
+def test_unreadable_files_are_dropped(cache_dir):
+    save_day("111", DAY, "v2", frame(5))
+    path = next(cache_dir.rglob("*.parquet"))
+    path.write_bytes(b"not parquet")
+    assert load_day("111", DAY, "v2") is None
+    assert not path.exists()
+
+
+def test_invalidate_matches_every_given_filter():
+    for suffix in ("111", "222"):
+        for day in (DAY, date(2026, 10, 2)):
+            save_day(suffix, day, "v2", frame(1))
+    assert invalidate(suffix="111", day=DAY) == 1
+    assert load_day("111", DAY, "v2") is None and load_day("111", date(2026, 10, 2), "v2") is not None
+    assert invalidate(version="v2") == 3
+
+
+def test_evict_drops_least_recently_used_days_first(cache_dir):
+    for n, day in enumerate((date(2026, 10, 1), date(2026, 10, 2), date(2026, 10, 3))):
+        save_day("111", day, "v2", frame(n))
+    paths = sorted(cache_dir.rglob("*.parquet"))
+    for age, path in zip((300, 100, 200), paths):
+        os.utime(path, (0, 1_000_000 - age))
+    evict(max_bytes=sum(path.stat().st_size for path in paths) - 1)
+    assert [path.exists() for path in paths] == [False, True, True]
+
+
+def test_cli_invalidates_one_site():
+    save_day("111", DAY, "v2", frame(1))
+    save_day("222", DAY, "v2", frame(1))
+    assert day_cache.main(["invalidate", "--suffix", "111", "--day", "2026-10-01"]) == 0
+    assert load_day("111", DAY, "v2") is None and load_day("222", DAY, "v2") is not None
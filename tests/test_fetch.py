@@ -0,0 +1,116 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+import src.fetch as fetch
+from src.data_store import DataSnapshot
+from src.scan_budget import DEFER, DOWNGRADE, RUN, SKIP, SiteScan
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Intraday table metadata: suffix -> has_intraday, and every suffix list returned."""
+    state = {"tables": {"111": True, "222": False}, "calls": 0, "fail": False}
+
+    def run_query(client, query, website="uknkown", **kwargs):
+        state["calls"] += 1
+        if state["fail"]:
+            raise RuntimeError("metadata unavailable")
+        return pd.DataFrame({"suffix": list(state["tables"]), "has_intraday": list(state["tables"].values())})
+
+    monkeypatch.setattr(fetch, "fetch_analytics_data", run_query)
+    monkeypatch.setattr(fetch, "_intraday", {"seen_at": {}, "checked_at": None})
+    return state
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fetch, "time", clock)
+    return clock
+
+
+def test_sites_without_an_intraday_table_are_rechecked_sooner(lookups, clock):
+    assert fetch.fetch_intraday_suffixes(None, {"111", "222"}) == {"111"}
+    clock.now += fetch.INTRADAY_RECHECK_SECONDS - 1
+    assert fetch.fetch_intraday_suffixes(None, {"111", "222"}) == {"111"}
+    assert lookups["calls"] == 1
+
+    lookups["tables"]["222"] = True
+    clock.now += 1
+    assert fetch.fetch_intraday_suffixes(None, {"111", "222"}) == {"111", "222"}
+    assert lookups["calls"] == 2
+
+
+def test_sites_with_an_intraday_table_are_trusted_for_the_metadata_duration(lookups, clock):
+    assert fetch.fetch_intraday_suffixes(None, {"111"}) == {"111"}
+    clock.now += fetch.METADATA_CACHE_DURATION - 1
+    assert fetch.fetch_intraday_suffixes(None, {"111"}) == {"111"}
+    assert lookups["calls"] == 1
+    clock.now += 1
+    fetch.fetch_intraday_suffixes(None, {"111"})
+    assert lookups["calls"] == 2
+
+
+def test_a_failed_lookup_keeps_what_was_seen(lookups, clock):
+    lookups["fail"] = True
+    assert fetch.fetch_intraday_suffixes(None, {"111"}) is None
+    lookups["fail"] = False
+    assert fetch.fetch_intraday_suffixes(None, {"111", "222"}) == {"111"}
+    lookups["fail"] = True
+    clock.now += fetch.INTRADAY_RECHECK_SECONDS
+    assert fetch.fetch_intraday_suffixes(None, {"111", "222"}) == {"111"}
+
+
+def test_the_budget_carries_deferred_sites_over_and_downgrades_others(monkeypatch):
+    config = {"websites": [{"website": w, "suffix": s} for w, s in
+                           (("a.com", "111"), ("b.com", "222"), ("c.com", "333"), ("d.com", "444"))]}
+    plan = {"a.com": SiteScan(1, RUN), "b.com": SiteScan(2, DOWNGRADE), "c.com": SiteScan(9, DEFER),
+            "d.com": SiteScan(9, SKIP)}
+    fetched = {}
+
+    def fetch_analytics_df(client, site_config, downgraded=frozenset(), force=False):
+        fetched.update(websites=[w["website"] for w in site_config["websites"]], downgraded=downgraded)
+        return pd.DataFrame({"website": ["a.com", "b.com"], "event_date": pd.Timestamp("2026-10-08"),
+                             "session_minute": pd.NaT, "sessions": [1, 2]})
+
+    monkeypatch.setattr(fetch, "plan_history_scan", lambda client, config, previous: plan)
+    monkeypatch.setattr(fetch, "fetch_analytics_df", fetch_analytics_df)
+    earlier = datetime(2026, 10, 8, 6, tzinfo=timezone.utc)
+    previous = DataSnapshot("1", earlier, pd.DataFrame({
+        "website": ["a.com", "c.com"], "event_date": pd.Timestamp("2026-10-08"), "session_minute": pd.NaT,
+        "sessions": [7, 8]}), None, site_fetched_at={"a.com": earlier, "c.com": earlier})
+
+    analytics, extra = fetch.fetch_within_budget(None, config, previous)
+
+    assert fetched == {"websites": ["a.com", "b.com"], "downgraded": frozenset({"222"})}
+    assert sorted(analytics["website"].astype(str)) == ["a.com", "b.com", "c.com"]
+    assert analytics.loc[analytics["website"] == "c.com", "sessions"].tolist() == [8]
+    assert extra["site_fetched_at"]["c.com"] == earlier
+    assert extra["site_fetched_at"]["a.com"] > earlier
+    assert extra["site_scan"] is plan
+
+
+def test_queries_over_todays_budget_are_refused(monkeypatch):
+    monkeypatch.setattr(fetch, "SCAN_BUDGET", True)
+    monkeypatch.setattr(fetch, "remaining_today", lambda limit: 5 * 1024 ** 2)
+    with pytest.raises(fetch.ScanBudgetExceeded):
+        fetch._require_budget("Cost query", fetch.MIN_BILLED_BYTES)
+    monkeypatch.setattr(fetch, "SCAN_BUDGET", False)
+    fetch._require_budget("Cost query", fetch.MIN_BILLED_BYTES)
+
+
+def test_the_budget_is_off_by_default(monkeypatch):
+    monkeypatch.setattr(fetch, "plan_history_scan", lambda *args: pytest.fail("dry-ran without a budget"))
+    monkeypatch.setattr(fetch, "fetch_analytics_df", lambda client, config, force=False: pd.DataFrame())
+    assert fetch.fetch_history(None, {"websites": []})[1] == {}
+    fetch._require_budget("Cost query", 10 ** 15)
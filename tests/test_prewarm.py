@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pandas as pd
+
+import src.prewarm as prewarm
+from src.data_store import DataStore
+from src.prewarm import Prewarmer
+
+
+class CountingLoader:
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.forced = []
+        self.fail = fail
+        self.loaded = threading.Event()
+
+    def __call__(self, websites, force=False):
+        self.calls += 1
+        self.forced.append(force)
+        self.loaded.set()
+        if self.fail:
+            raise RuntimeError("BigQuery unavailable")
+        return pd.DataFrame({"sessions": [self.calls]}), None
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def warm_store():
+    store = DataStore()
+    store.publish(pd.DataFrame({"sessions": [0]}), None)
+    return store
+
+
+def test_a_snapshot_is_refreshed_ahead_of_its_expiry():
+    store, loader = warm_store(), CountingLoader()
+    first = store.get()
+    Prewarmer(store, loader, max_age=0.3, lead=0.2).start()
+    assert wait_until(lambda: store.get() is not first)
+    assert loader.forced[0] is False
+
+
+def test_a_requested_refresh_runs_before_it_is_due():
+    store, loader = warm_store(), CountingLoader()
+    prewarmer = Prewarmer(store, loader, max_age=3600, lead=0).start()
+    time.sleep(0.05)
+    assert loader.calls == 0
+    prewarmer.request_refresh()
+    assert loader.loaded.wait(2)
+    # Refreshes a user asked for skip results other replicas shared
+    assert loader.forced == [True]
+
+
+def test_a_failed_refresh_keeps_the_snapshot_and_waits_before_retrying(monkeypatch):
+    monkeypatch.setattr(prewarm, "RETRY_SECONDS", 3600)
+    store, loader = warm_store(), CountingLoader(fail=True)
+    first = store.get()
+    prewarmer = Prewarmer(store, loader, max_age=0, lead=0).start()
+    assert wait_until(lambda: prewarmer.last_error is not None)
+    time.sleep(0.05)
+    assert loader.calls == 1
+    assert prewarmer.last_error == "BigQuery unavailable"
+    assert prewarmer._seconds_until_due() > 0
+    assert store.get() is first
+
+
+def test_scheduled_refreshes_pause_without_sessions_and_resume_on_touch():
+    store, loader = warm_store(), CountingLoader()
+    prewarmer = Prewarmer(store, loader, max_age=0, lead=0, idle_after=0.01)
+    time.sleep(0.02)
+    assert prewarmer.idle()
+    prewarmer.start()
+    time.sleep(0.05)
+    assert loader.calls == 0
+    assert prewarmer._paused
+    prewarmer.touch()
+    assert loader.loaded.wait(2)
+
+
+def test_submitted_jobs_run_on_the_refresher_thread_and_a_failure_does_not_stop_it():
+    store, loader = warm_store(), CountingLoader()
+    prewarmer = Prewarmer(store, loader, max_age=3600, lead=0).start()
+    ran = []
+
+    def failing():
+        raise RuntimeError("site query failed")
+
+    prewarmer.submit("failing job", failing)
+    prewarmer.submit("site job", lambda: ran.append(threading.current_thread().name))
+    assert wait_until(lambda: ran)
+    assert ran == ["prewarm"]
+    assert loader.calls == 0
+
+
+def test_nothing_is_loaded_until_the_first_snapshot_is_published():
+    store, loader = DataStore(), CountingLoader()
+    prewarmer = Prewarmer(store, loader, max_age=0.3, lead=0.2).start()
+    prewarmer.request_refresh()
+    time.sleep(0.05)
+    assert loader.calls == 0
+    # The request path loads the first snapshot; scheduling starts from there
+    first = store.publish(pd.DataFrame({"sessions": [0]}), None)
+    assert wait_until(lambda: store.get() is not first)
+    assert loader.forced[0] is False
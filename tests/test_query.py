@@ -0,0 +1,158 @@
+from datetime import date, datetime, timezone
+
+import pandas as pd
+
+import src.query as query_module
+from src.query import (DAY_GRAIN_MINUTES, MAX_TABLES_PER_QUERY, REALTIME_MINUTES, TABLES_PER_PROPERTY,
+                       add_minutes_past, batch_suffixes, final_days, get_analytics_query, get_day_query,
+                       get_historical_analytics_query, get_intraday_tables_query,
+                       get_multi_property_analytics_query, get_multi_property_realtime_query,
+                       get_query_parameters, get_realtime_query, get_realtime_query_parameters, get_site_query,
+                       open_days, window_dates)
+from src.query_cost import get_job_cost_query
+
+
+def _last_group_by(query):
+    return query.rsplit("GROUP BY", 1)[1].split(")")[0]
+
+
+def test_multi_property_query_tags_each_branch_with_its_property():
+    query = get_multi_property_analytics_query(["111", "222"], historical_suffixes={"222"})
+    branches = query.split("\nUNION ALL\n")
+    assert branches[0].startswith("SELECT '111' AS property")
+    assert get_analytics_query("111") in query
+    assert get_historical_analytics_query("222") in query
+    assert get_analytics_query("222") not in query
+
+
+def test_batches_respect_the_referenced_table_limit():
+    suffixes = [str(n) for n in range(250)]
+    batches = batch_suffixes(suffixes)
+    assert [suffix for batch in batches for suffix in batch] == suffixes
+    assert all(len(batch) * TABLES_PER_PROPERTY <= MAX_TABLES_PER_QUERY for batch in batches)
+
+
+def test_batches_respect_the_query_length_limit():
+    suffixes = [str(n) for n in range(10)]
+    max_length = 3 * len(get_multi_property_analytics_query(["0"])) + 100
+    batches = batch_suffixes(suffixes, max_length=max_length)
+    assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+    assert all(len(get_multi_property_analytics_query(batch)) <= max_length for batch in batches)
+
+
+def test_an_oversized_property_still_gets_its_own_batch():
+    assert batch_suffixes(["1", "2"], max_length=10) == [["1"], ["2"]]
+
+
+def _params(reference, **kwargs):
+    return {param.name: getattr(param, "value", None) or getattr(param, "values", None)
+            for param in get_query_parameters(reference, **kwargs)}
+
+
+def test_site_query_picks_the_engine_version():
+    assert get_site_query("123") == get_analytics_query("123")
+    assert "Single-scan" in get_site_query("123", "v2")
+    assert "Single-scan" in get_site_query("123", "v2", historical=True)
+    assert "Single-scan" not in get_historical_analytics_query("123")
+
+
+def test_v2_reads_each_events_table_once():
+    query = get_site_query("123", "v2")
+    assert query.count("analytics_123.events_intraday_*") == 1
+    assert query.count("analytics_123.events_*") == 1
+
+
+def test_v2_never_groups_by_literal_columns():
+    for historical in (False, True):
+        group_by = _last_group_by(get_site_query("123", "v2", historical))
+        assert "sourceDataSet" not in group_by
+        assert "session_minute" in group_by
+    # The constant session_minute of the historical engine is computed per session before grouping
+    historical = get_site_query("123", "v2", historical=True)
+    assert historical.index("CAST(NULL AS TIMESTAMP) AS session_minute") < historical.index("FROM sessions")
+
+
+def test_multi_grain_keeps_minutes_only_inside_the_realtime_window():
+    for version in ("v1", "v2"):
+        minute = get_site_query("123", version)
+        multi = get_site_query("123", version, grain="multi")
+        assert minute in multi
+        assert f"INTERVAL {REALTIME_MINUTES} MINUTE),\n     session_minute, NULL) AS session_minute" in multi
+        # Per-minute distinct counts are summed, which is exact as each session has one start minute
+        assert "SUM(sessions) AS sessions" in multi
+    assert get_site_query("123", grain="multi") in get_multi_property_analytics_query(["123"], grain="multi")
+
+
+def test_split_days_only_count_the_sessions_they_started():
+    day_query = get_day_query("123", date(2026, 10, 1))
+    assert "analytics_123.events_20261001`" in day_query and "_TABLE_SUFFIX" not in day_query
+    assert "key = 'ga_session_id') >= (SELECT DIV(MIN(event_timestamp), 1000000) - 1" in day_query
+    # Live queries after the cached days drop sessions carried over from them; full-window queries don't
+    assert "ga_session_id') >=" in get_site_query("123", "v2", after_cached_days=True)
+    assert "ga_session_id') >=" not in get_site_query("123", "v2")
+
+
+def test_window_splits_into_final_and_open_days():
+    today = date(2026, 10, 8)
+    assert final_days(today) == [date(2026, 10, n) for n in (5, 4, 3, 2, 1)]
+    assert open_days(today) == [date(2026, 10, 7), date(2026, 10, 6)]
+    assert window_dates(today) == [date(2026, 10, n) for n in range(1, 8)]
+    # A shorter window drops the oldest finalized days first
+    assert window_dates(today, window_days=4) == [date(2026, 10, n) for n in range(4, 8)]
+    assert final_days(today, window_days=1) == [] and open_days(today, window_days=1) == [date(2026, 10, 7)]
+
+
+def test_final_days_are_named_and_only_the_open_days_go_through_the_wildcard():
+    final = final_days(date(2026, 10, 8))
+    for version in ("v1", "v2"):
+        query = get_site_query("123", version, final_dates=final)
+        assert all(f"analytics_123.events_{day:%Y%m%d}`" in query for day in final)
+        assert "_TABLE_SUFFIX IN UNNEST(@table_suffixes)" in query
+    branch = get_multi_property_analytics_query(["123"], final_dates=final)
+    assert "analytics_123.events_20261001`" in branch
+
+
+def test_parameters_are_the_same_within_a_minute():
+    first = _params(datetime(2026, 10, 8, 12, 30, 5, tzinfo=timezone.utc))
+    second = _params(datetime(2026, 10, 8, 12, 30, 55, 123, tzinfo=timezone.utc))
+    assert first == second
+    assert first["ref_ts"] == datetime(2026, 10, 8, 12, 30, tzinfo=timezone.utc)
+    assert first["start_date"] == date(2026, 10, 1)
+    assert first["table_suffixes"] == ["20261007", "20261006"]
+    whole_window = _params(datetime(2026, 10, 8, tzinfo=timezone.utc), table_dates=window_dates(date(2026, 10, 8)))
+    assert whole_window["table_suffixes"] == [f"202610{n:02d}" for n in range(1, 8)]
+    short = _params(datetime(2026, 10, 8, tzinfo=timezone.utc), window_days=1)
+    assert short["start_date"] == date(2026, 10, 7) and short["table_suffixes"] == ["20261007"]
+
+
+def test_minutes_past_is_derived_from_the_session_minute():
+    df = pd.DataFrame({"session_minute": [pd.Timestamp("2026-10-08 12:25", tz="UTC"), None]})
+    derived = add_minutes_past(df, now=datetime(2026, 10, 8, 12, 30, 40, tzinfo=timezone.utc))
+    assert derived["minutes_past"].tolist() == [5, DAY_GRAIN_MINUTES]
+    assert "minutes_past" not in df.columns
+
+
+def test_realtime_query_reads_only_recent_session_starts_from_the_intraday_table():
+    query = get_realtime_query("123")
+    assert "analytics_123.events_intraday_*" in query
+    assert "analytics_123.events_*" not in query
+    assert "event_params" not in query
+    assert "event_name = 'session_start'" in query
+    assert f"INTERVAL {REALTIME_MINUTES} MINUTE" in query
+    # The dataset literal is never grouped
+    assert query.rstrip().endswith("GROUP BY 2, 3")
+
+
+def test_multi_property_realtime_query_tags_each_property():
+    query = get_multi_property_realtime_query(["111", "222"])
+    assert query.count("UNION ALL") == 1
+    assert "SELECT '222' AS property" in query
+    params = get_realtime_query_parameters(datetime(2026, 10, 8, 12, 30, 59, tzinfo=timezone.utc))
+    assert [(param.name, param.value) for param in params] == [
+        ("ref_ts", datetime(2026, 10, 8, 12, 30, tzinfo=timezone.utc))]
+
+
+def test_information_schema_views_are_read_from_the_configured_region(monkeypatch):
+    assert "`region-US`.INFORMATION_SCHEMA.JOBS" in get_job_cost_query()
+    monkeypatch.setattr(query_module, "REGION", "EU")
+    assert ".region-EU.INFORMATION_SCHEMA.TABLES" in get_intraday_tables_query()
@@ -0,0 +1,93 @@
+import pandas as pd
+
+from src.rollup import Rollup, build_rollup, with_realtime
+
+TODAY = pd.Timestamp("2026-10-08")
+NOW = pd.Timestamp("2026-10-08 12:00", tz="UTC")
+CONFIG = {"websites": [
+    {"website": "a.com", "suffix": "1", "monetization": "ACTIVE", "account": "acme"},
+    {"website": "b.com", "suffix": "2", "monetization": "ACTIVE", "account": "acme"},
+    {"website": "c.com", "suffix": "3", "monetization": "PAUSED", "account": "other"},
+]}
+
+
+def minutes_ago(*minutes):
+    return [NOW - pd.Timedelta(minutes=n) for n in minutes]
+
+
+def row(website, days_ago, sessions, minutes=None, country="France", page="/", source="google"):
+    session_minute = minutes_ago(minutes)[0] if minutes is not None else pd.NaT
+    return {"website": website, "event_date": TODAY - pd.Timedelta(days=days_ago), "sessions": sessions,
+            "session_minute": session_minute, "country": country, "landingPage": page, "session_source": source}
+
+
+def analytics():
+    return pd.DataFrame([
+        row("a.com", 0, 4, minutes=5, country="Spain"),
+        row("a.com", 0, 1, minutes=90),
+        row("a.com", 1, 10, page="/home", source="bing"),
+        row("a.com", 1, 3, page="/about"),
+        row("a.com", 9, 100),
+        row("b.com", 1, 20, source="direct"),
+        row("b.com", 3, 5),
+        row("c.com", 1, 7),
+    ])
+
+
+def test_site_summary_adds_up_the_raw_rows():
+    rollup = build_rollup(analytics(), CONFIG, today=TODAY, now=NOW)
+    summary = rollup.site_summary
+    assert summary.loc["a.com", ["yesterday", "today", "recent", "week", "total"]].tolist() == [13, 5, 4, 18, 118]
+    assert summary.loc["b.com", ["yesterday", "week", "total"]].tolist() == [20, 25, 25]
+    assert summary.loc["c.com", "account"] == "other"
+    # Only monetized sites count towards their account
+    assert rollup.account_summary.index.tolist() == ["acme"]
+    assert rollup.account_summary.loc["acme", "yesterday"] == 33
+
+
+def test_sites_are_ordered_by_traffic():
+    rollup = build_rollup(analytics(), CONFIG, today=TODAY, now=NOW)
+    assert rollup.websites == ["b.com", "a.com", "c.com"]
+    assert rollup.website_order == ["a.com", "b.com", "c.com"]
+
+
+def test_realtime_panels_only_see_the_realtime_window():
+    rollup = build_rollup(analytics(), CONFIG, today=TODAY, now=NOW)
+    realtime = Rollup.site(rollup.realtime, "a.com")
+    assert realtime[["minutes_past", "sessions"]].values.tolist() == [[5, 4]]
+    assert Rollup.site(rollup.countries, "a.com")["country"].tolist() == ["Spain"]
+    assert Rollup.site(rollup.realtime, "c.com").empty
+
+
+def test_yesterday_panels_keep_the_top_rows_per_site():
+    rollup = build_rollup(analytics(), CONFIG, today=TODAY, now=NOW)
+    pages = Rollup.site(rollup.landing_pages, "a.com")
+    assert pages[["landingPage", "sessions"]].values.tolist() == [["/home", 10], ["/about", 3]]
+    assert rollup.all_landing_pages["landingPage"].tolist()[0] == "/"
+    assert Rollup.site(rollup.sources, "b.com")["session_source"].tolist() == ["direct"]
+    # The 7-day trend keeps each site's top sources for every day they appear
+    trend = Rollup.site(rollup.source_trend, "a.com")
+    assert set(trend["session_source"]) == {"google", "bing"}
+    assert trend["event_date"].min() >= TODAY - pd.Timedelta(days=6)
+
+
+def test_realtime_lane_rows_replace_only_the_realtime_aggregates():
+    rollup = build_rollup(analytics(), CONFIG, today=TODAY, now=NOW)
+    realtime_df = pd.DataFrame({"website": ["b.com", "b.com", "b.com"], "session_minute": minutes_ago(2, 3, 45),
+                                "country": ["Italy", "Italy", "Spain"], "sessions": [6, 1, 9]})
+    live = with_realtime(rollup, realtime_df, NOW)
+    assert live.site_summary.loc["b.com", "recent"] == 7
+    assert live.site_summary.loc["a.com", "recent"] == 0
+    assert live.site_summary.loc["a.com", "yesterday"] == rollup.site_summary.loc["a.com", "yesterday"]
+    assert live.account_summary.loc["acme", "recent"] == 7
+    assert live.all_countries["country"].tolist() == ["Italy"]
+    assert live.daily is rollup.daily
+
+
+def test_realtime_rows_age_out_as_the_window_moves_on():
+    rollup = build_rollup(analytics(), CONFIG, today=TODAY, now=NOW)
+    realtime_df = pd.DataFrame({"website": ["b.com", "b.com"], "session_minute": minutes_ago(2, 20),
+                                "country": ["Italy", "Spain"], "sessions": [6, 9]})
+    later = with_realtime(rollup, realtime_df, NOW + pd.Timedelta(minutes=15))
+    assert later.site_summary.loc["b.com", "recent"] == 6
+    assert Rollup.site(later.realtime, "b.com")["minutes_past"].tolist() == [17]
@@ -0,0 +1,80 @@
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src import scan_budget
+from src.scan_budget import RUN, DOWNGRADE, DEFER, SKIP, plan_scans, record_spent, remaining_today, spent_today
+
+GB = 1000 ** 3
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return tmp_path / "scan_budget.json"
+
+
+def no_downgrade(names):
+    raise AssertionError(f"unexpected downgrade estimate for {names}")
+
+
+def test_everything_runs_without_limits(ledger):
+    plan = plan_scans({"a": 5 * GB, "b": None}, no_downgrade, set(), ledger=ledger)
+    assert {site: scan.action for site, scan in plan.items()} == {"a": RUN, "b": RUN}
+
+
+def test_sites_over_the_refresh_limit_are_downgraded_deferred_or_skipped(ledger):
+    calls = []
+
+    def estimate_downgraded(names):
+        calls.append(list(names))
+        return {"b": 2 * GB, "c": 5 * GB, "d": 5 * GB}
+
+    plan = plan_scans({"a": 6 * GB, "b": 3 * GB, "c": 8 * GB, "d": 8 * GB}, estimate_downgraded,
+                      has_previous={"c"}, refresh_limit=10 * GB, ledger=ledger)
+
+    assert calls == [["c", "d"]]
+    assert plan["a"] == scan_budget.SiteScan(6 * GB, RUN)
+    assert plan["b"].action == RUN
+    assert plan["c"] == scan_budget.SiteScan(8 * GB, DEFER)
+    assert plan["d"] == scan_budget.SiteScan(8 * GB, SKIP)
+
+
+def test_downgrade_is_used_when_the_history_only_query_fits(ledger):
+    plan = plan_scans({"a": 6 * GB, "b": 6 * GB}, lambda names: {"b": 3 * GB}, set(),
+                      refresh_limit=10 * GB, ledger=ledger)
+    assert plan["b"] == scan_budget.SiteScan(3 * GB, DOWNGRADE)
+
+
+def test_unknown_estimates_run_without_using_the_budget(ledger):
+    plan = plan_scans({"a": None, "b": 10 * GB}, no_downgrade, set(), refresh_limit=10 * GB, ledger=ledger)
+    assert plan["a"].action == RUN and plan["b"].action == RUN
+
+
+def test_daily_limit_counts_what_was_billed_today(ledger):
+    record_spent(8 * GB, ledger)
+    plan = plan_scans({"a": 3 * GB}, lambda names: {}, {"a"}, daily_limit=10 * GB, ledger=ledger)
+    assert plan["a"].action == DEFER
+    assert remaining_today(10 * GB, ledger) == 2 * GB
+    assert remaining_today(None, ledger) is None
+
+
+def test_ledger_rolls_over_on_a_new_utc_day(ledger):
+    yesterday = f"{datetime.now(timezone.utc) - timedelta(days=1):%Y-%m-%d}"
+    ledger.write_text(json.dumps({"date": yesterday, "bytes": 9 * GB}))
+    assert spent_today(ledger) == 0
+    record_spent(GB, ledger)
+    assert spent_today(ledger) == GB
+    plan = plan_scans({"a": 5 * GB}, no_downgrade, set(), daily_limit=10 * GB, ledger=ledger)
+    assert plan["a"].action == RUN
+
+
+def test_concurrent_records_are_not_lost(ledger):
+    threads = [threading.Thread(target=lambda: [record_spent(1, ledger) for _ in range(25)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert spent_today(ledger) == 200
+    assert not list(ledger.parent.glob("*.tmp"))
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src import sheets_connector
+from src.sheets_connector import _read_config
+
+SHEET_ID = "sheet"
+ROWS = [["#", "Website", "", "", "Status", "Monetization", "Account", "Suffix"],
+        ["1", "a.com", "", "", "LIVE", "ACTIVE", "acme", "111"],
+        ["2", "b.com", "", "", "PAUSED", "ACTIVE", "acme", "222"],
+        ["3", "c.com", "", "", "LIVE"]]
+
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.modified_time = "2026-10-08T10:00:00Z"
+        self.rows = ROWS
+        self.fail = False
+        self.reads = 0
+        self.client = self
+
+    def get_file_drive_metadata(self, sheet_id):
+        if self.fail:
+            raise TimeoutError("sheets timed out")
+        return {"modifiedTime": self.modified_time}
+
+    def values_get(self, range_name):
+        self.reads += 1
+        return {"values": self.rows}
+
+
+@pytest.fixture
+def sheet(tmp_path, monkeypatch):
+    spreadsheet = FakeSpreadsheet()
+    monkeypatch.setattr(sheets_connector, "SAVED_CONFIG_PATH", tmp_path / "sheet_config.json")
+    monkeypatch.setattr(sheets_connector, "CHECK_INTERVAL_SECONDS", 0)
+    monkeypatch.setattr(sheets_connector, "_get_spreadsheet", lambda sheet_id: spreadsheet)
+    return spreadsheet
+
+
+def test_only_live_rows_with_a_suffix_are_loaded(sheet):
+    config = _read_config(SHEET_ID, "Websites")
+    assert [w["website"] for w in config["websites"]] == ["a.com"]
+    assert config["websites"][0] == {"number": 1, "website": "a.com", "status": "LIVE", "monetization": "ACTIVE",
+                                     "account": "acme", "suffix": "111"}
+
+
+def test_an_unchanged_sheet_is_not_downloaded_again(sheet):
+    first = _read_config(SHEET_ID, "Websites")
+    assert _read_config(SHEET_ID, "Websites") == first
+    assert sheet.reads == 1
+
+
+def test_a_changed_sheet_is_downloaded_again(sheet):
+    _read_config(SHEET_ID, "Websites")
+    sheet.modified_time = "2026-10-08T11:00:00Z"
+    sheet.rows = ROWS + [["4", "d.com", "", "", "LIVE", "ACTIVE", "other", "444"]]
+    config = _read_config(SHEET_ID, "Websites")
+    assert [w["website"] for w in config["websites"]] == ["a.com", "d.com"]
+    assert sheet.reads == 2
+
+
+def test_errors_fall_back_to_the_saved_config(sheet):
+    saved = _read_config(SHEET_ID, "Websites")
+    sheet.fail = True
+    assert _read_config(SHEET_ID, "Websites") == saved
+    # Without a saved config for this sheet there is nothing to fall back to
+    with pytest.raises(TimeoutError):
+        _read_config("other sheet", "Websites")
+
+
+def test_a_recently_checked_config_is_served_without_any_call(sheet, monkeypatch):
+    _read_config(SHEET_ID, "Websites")
+    monkeypatch.setattr(sheets_connector, "CHECK_INTERVAL_SECONDS", 60)
+    sheet.fail = True
+    assert [w["website"] for w in _read_config(SHEET_ID, "Websites")["websites"]] == ["a.com"]
+    saved = sheets_connector._load_saved(SHEET_ID, "Websites")
+    checked_at = datetime.fromisoformat(saved["checked_at"])
+    assert datetime.now(timezone.utc) - checked_at < timedelta(seconds=60)
@@ -0,0 +1,66 @@
+import json
+
+import pandas as pd
+import pytest
+
+import src.snapshot_file as snapshot_file
+from src.data_store import DataStore
+from src.rollup import build_rollup
+from src.scan_budget import DEFER, RUN, SiteScan
+from src.snapshot_file import LATEST_FILE, latest_version, read_snapshot, write_snapshot
+from tests.test_rollup import CONFIG, TODAY, analytics
+
+
+def test_a_written_snapshot_reads_back_with_its_rollup(tmp_path):
+    df = analytics()
+    cost = pd.DataFrame({"date": ["2026-10-07"], "cost": [0.5]})
+    rollup = build_rollup(df, CONFIG, today=TODAY)
+    version = write_snapshot(df, cost, CONFIG, rollup, directory=tmp_path)
+
+    assert latest_version(tmp_path) == version
+    snapshot = read_snapshot(version, tmp_path)
+    assert snapshot.version == version
+    assert snapshot.config == CONFIG
+    pd.testing.assert_frame_equal(snapshot.analytics, df)
+    pd.testing.assert_frame_equal(snapshot.cost, cost)
+    assert set(snapshot.site_fetched_at) == {"a.com", "b.com", "c.com"}
+    assert snapshot.rollup.today == TODAY
+    assert snapshot.rollup.websites == rollup.websites
+    pd.testing.assert_frame_equal(snapshot.rollup.site_summary, rollup.site_summary)
+
+
+def test_latest_moves_to_the_newest_version_and_old_ones_are_pruned(tmp_path):
+    versions = [write_snapshot(analytics(), None, CONFIG, directory=tmp_path, keep=2) for _ in range(3)]
+    assert latest_version(tmp_path) == versions[-1]
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([LATEST_FILE] + versions[1:])
+    assert read_snapshot(versions[-1], tmp_path).cost is None
+
+
+def test_no_snapshot_yet_and_other_formats_are_not_read(tmp_path, monkeypatch):
+    assert latest_version(tmp_path) is None
+    version = write_snapshot(analytics(), None, CONFIG, directory=tmp_path)
+    monkeypatch.setattr(snapshot_file, "SNAPSHOT_FORMAT", snapshot_file.SNAPSHOT_FORMAT + 1)
+    with pytest.raises(ValueError):
+        read_snapshot(version, tmp_path)
+    assert json.loads((tmp_path / version / "meta.json").read_text())["rows"] == len(analytics())
+
+
+def test_a_version_is_only_read_once_per_store(tmp_path):
+    version = write_snapshot(analytics(), None, CONFIG, directory=tmp_path)
+    store, reads = DataStore(), []
+
+    def read():
+        reads.append(version)
+        return read_snapshot(version, tmp_path)
+
+    first = store.adopt(version, read)
+    assert store.adopt(version, read) is first
+    assert store.get() is first
+    assert reads == [version]
+
+
+def test_scan_estimates_are_kept_with_the_snapshot(tmp_path):
+    site_scan = {"a.com": SiteScan(3 * 1024 ** 3, RUN), "b.com": SiteScan(None, DEFER)}
+    version = write_snapshot(analytics(), None, CONFIG, directory=tmp_path, site_scan=site_scan)
+    assert read_snapshot(version, tmp_path).site_scan == site_scan
+    assert read_snapshot(write_snapshot(analytics(), None, CONFIG, directory=tmp_path), tmp_path).site_scan == {}
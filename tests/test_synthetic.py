@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from src.dashboard_model import compute_dashboard_model
+from src.query import REALTIME_MINUTES, add_minutes_past
+from src.synthetic import synthetic_analytics, synthetic_cost
+
+NOW = datetime(2026, 10, 8, 12, 30, tzinfo=timezone.utc)
+
+
+def test_synthetic_rows_match_the_downloaded_schema():
+    df, config = synthetic_analytics(sites=3, rows_per_site=200, now=NOW)
+    assert len(df) == 600 and len(config["websites"]) == 3
+    assert isinstance(df["website"].dtype, pd.CategoricalDtype)
+    assert df["sessions"].dtype == "int32"
+    recent = df["session_minute"].notna()
+    assert add_minutes_past(df[recent], NOW)["minutes_past"].between(0, REALTIME_MINUTES).all()
+    assert (df.loc[recent, "event_date"] == pd.Timestamp("2026-10-08")).all()
+
+
+def test_the_same_seed_gives_the_same_rows():
+    first, _ = synthetic_analytics(sites=2, rows_per_site=50, seed=7, now=NOW)
+    again, _ = synthetic_analytics(sites=2, rows_per_site=50, seed=7, now=NOW)
+    pd.testing.assert_frame_equal(first, again)
+
+
+def test_synthetic_data_renders_a_full_model():
+    df, config = synthetic_analytics(sites=3, rows_per_site=200, now=NOW)
+    cost = synthetic_cost(config, days=30, today=pd.Timestamp("2026-10-08"))
+    model = compute_dashboard_model(df, cost, config, today=pd.Timestamp("2026-10-08"), now=NOW)
+    assert set(model.sites) == {w["website"] for w in config["websites"]}
+    assert model.cost.by_kind["kind"].nunique() == 4
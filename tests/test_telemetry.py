@@ -0,0 +1,69 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from src.telemetry import JobTelemetry, job_record
+
+START = datetime(2026, 10, 8, 12, tzinfo=timezone.utc)
+
+
+class Job:
+    def __init__(self, job_id, queued=1.0, executed=4.0, billed=10 * 1024 ** 2, cache_hit=False):
+        self.job_id = job_id
+        self.created = START
+        self.started = START + timedelta(seconds=queued)
+        self.ended = self.started + timedelta(seconds=executed)
+        self.total_bytes_processed = 1000
+        self.total_bytes_billed = billed
+        self.slot_millis = 250
+        self.cache_hit = cache_hit
+
+
+def test_a_record_splits_the_job_latency_into_phases():
+    df = pd.DataFrame({"sessions": [1, 2, 3]})
+    record = job_record(Job("job-1"), "a.com", {"kind": "history", "version": "v2"}, df, 0.5, 0.25)
+    assert (record.kind, record.query_version, record.job_id) == ("history", "v2", "job-1")
+    assert (record.queue_seconds, record.execute_seconds) == (1.0, 4.0)
+    assert (record.rows, record.download_seconds, record.pandas_seconds) == (3, 0.5, 0.25)
+    assert record.memory_bytes == int(df.memory_usage(deep=True).sum())
+
+
+def test_a_job_that_was_never_submitted_keeps_only_its_error():
+    record = job_record(None, "a.com", {"kind": "realtime"}, error=ValueError("invalid query"))
+    assert record.error == "invalid query"
+    assert record.job_id is None and record.rows is None and record.queue_seconds is None
+
+
+def test_the_buffer_drops_the_oldest_records():
+    telemetry = JobTelemetry(max_records=2)
+    for job_id in ("job-1", "job-2", "job-3"):
+        telemetry.record(job_record(Job(job_id), "a.com"))
+    assert [record.job_id for record in telemetry.records()] == ["job-2", "job-3"]
+
+
+def test_summary_groups_jobs_per_site_and_kind():
+    telemetry = JobTelemetry()
+    history = {"kind": "history"}
+    telemetry.record(job_record(Job("job-1", executed=2.0), "a.com", history, download_seconds=1.0,
+                                pandas_seconds=0.0))
+    telemetry.record(job_record(Job("job-2", executed=6.0, cache_hit=True, billed=0), "a.com", history,
+                                download_seconds=3.0, pandas_seconds=0.0))
+    telemetry.record(job_record(None, "b.com", history, error=RuntimeError("timeout")))
+
+    summary = telemetry.summary().set_index("site")
+    assert summary.loc["a.com", ["jobs", "failed", "cache_hits"]].tolist() == [2, 0, 1]
+    assert summary.loc["a.com", "execute_seconds"] == 4.0
+    assert summary.loc["a.com", "billed_mb"] == 10 * 1024 ** 2 / 1e6
+    assert summary.loc["b.com", "failed"] == 1
+    # Slowest first
+    assert summary.index.tolist() == ["a.com", "b.com"]
+
+
+def test_exports_hold_every_record():
+    telemetry = JobTelemetry()
+    telemetry.record(job_record(Job("job-1"), "a.com", {"kind": "cost"}))
+    exported = json.loads(telemetry.to_json())
+    assert exported[0]["job_id"] == "job-1" and exported[0]["execute_seconds"] == 4.0
+    assert telemetry.to_csv().splitlines()[0].startswith("site,kind,query_version,job_id")
+    assert JobTelemetry().summary().empty
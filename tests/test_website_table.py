@@ -0,0 +1,75 @@
+import pandas as pd
+
+from src.rollup import build_rollup
+from src.website_table import build_website_table, render_website_table
+
+TODAY = pd.Timestamp("2026-10-08")
+NOW = pd.Timestamp("2026-10-08 12:00", tz="UTC")
+CONFIG = {"websites": [
+    {"number": 1, "website": "a.com", "suffix": "1", "monetization": "ACTIVE", "account": "Anas"},
+    {"number": 2, "website": "b.com", "suffix": "2", "monetization": "ACTIVE", "account": "acme"},
+    {"number": 3, "website": "c.com", "suffix": "3", "monetization": "REVIEW", "account": ""},
+    {"number": 4, "website": "quiet.com", "suffix": "4", "monetization": "", "account": "acme"},
+]}
+
+
+def analytics():
+    rows = []
+    for days_ago in range(9):
+        for n, website in enumerate(["a.com", "b.com", "c.com"]):
+            rows.append({"website": website, "event_date": TODAY - pd.Timedelta(days=days_ago),
+                         "sessions": (n + 1) * (days_ago + 2), "session_minute": pd.NaT, "country": "France",
+                         "landingPage": "/", "session_source": "google"})
+    rows.append({"website": "b.com", "event_date": TODAY, "sessions": 3, "session_minute": NOW - pd.Timedelta(minutes=4), "country": "Spain",
+                 "landingPage": "/", "session_source": "bing"})
+    return pd.DataFrame(rows)
+
+
+def baseline_table(rollup, config):
+    """The per-site loop the table used to be built with."""
+    summary = rollup.site_summary
+    end_date = rollup.today - pd.Timedelta(days=2)
+    date_range = pd.date_range(start=end_date - pd.Timedelta(days=4), end=end_date, freq='D')
+    daily = rollup.daily.reset_index()
+    pivot = (daily[daily['event_date'].between(date_range[0], end_date)]
+             .pivot(index='website', columns='event_date', values='sessions')
+             .reindex(columns=date_range[::-1]).fillna(0))
+    date_columns = [col.strftime('%d/%m') for col in pivot.columns]
+    pivot.columns = date_columns
+    pivot = pivot.astype(int)
+    rows = []
+    for site in config['websites']:
+        name = site['website']
+        has_data = name in summary.index
+        row = {'Number': site['number'], 'Website': name, 'Monetization': site['monetization'],
+               'Account': site.get('account', ''),
+               'Yesterday': int(summary.at[name, 'yesterday']) if has_data else 0,
+               'Today': int(summary.at[name, 'today']) if has_data else 0,
+               '30 Min': int(summary.at[name, 'recent']) if has_data else 0}
+        for col in date_columns:
+            row[col] = pivot.loc[name, col] if name in pivot.index else 0
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def test_table_matches_the_per_site_loop():
+    rollup = build_rollup(analytics(), CONFIG, today=TODAY, now=NOW)
+    table = build_website_table(rollup, CONFIG)
+    expected = baseline_table(rollup, CONFIG)
+    assert table.columns.tolist() == expected.columns.tolist()
+    assert table.columns.tolist()[7:] == ["06/10", "05/10", "04/10", "03/10", "02/10"]
+    pd.testing.assert_frame_equal(table, expected, check_dtype=False)
+
+
+def test_rendered_table_has_the_summary_rows_before_the_sites():
+    rollup = build_rollup(analytics(), CONFIG, today=TODAY, now=NOW)
+    table = build_website_table(rollup, CONFIG)
+    html = render_website_table(table)
+    labels = ["TOTAL", "TOTAL MONETIZED", "NOT MONETIZED", "acme", "Anas", "<th>Number</th>", "a.com"]
+    positions = [html.index(f">{label}<") if not label.startswith("<") else html.index(label) for label in labels]
+    assert positions == sorted(positions)
+    # TOTAL yesterday covers every site; each account row only its monetized sites
+    assert f">{int(table['Yesterday'].sum()):,}<" in html
+    assert 'class="account-name account-name-anas"' in html
+    assert '<td class="monetized-none">NONE</td>' in html
+    assert html.endswith("</tbody></table></div>")